@@ -0,0 +1,101 @@
+# benchmarks/channel_layers.py
+"""
+Channel layer throughput: messages/sec through ``group_send`` -> ``receive``.
+
+Compares channels' ``InMemoryChannelLayer`` (sender and receiver in one
+process) with ``posts.layers.UnixSocketChannelLayer`` (receiver in a separate
+process, like the Daphne worker holding the WebSockets).
+
+    cd backend
+    python -m benchmarks.channel_layers --messages 20000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+
+from posts.layers import UnixSocketChannelLayer
+
+GROUP = "bench"
+
+
+def _message(index, payload_size):
+    return {"type": "feed_update", "content": {"id": index, "text": "x" * payload_size}}
+
+
+async def _receive_all(layer, channel, count):
+    for _ in range(count):
+        await layer.receive(channel)
+
+
+async def bench_in_memory(count, payload_size):
+    layer = InMemoryChannelLayer(capacity=count + 1)
+    channel = await layer.new_channel()
+    await layer.group_add(GROUP, channel)
+    receiver = asyncio.create_task(_receive_all(layer, channel, count))
+    started = time.perf_counter()
+    for index in range(count):
+        await layer.group_send(GROUP, _message(index, payload_size))
+    await receiver
+    return time.perf_counter() - started
+
+
+def _receiver_process(path, count, ready, done):
+    async def main():
+        layer = UnixSocketChannelLayer(path=path, capacity=count + 1)
+        channel = await layer.new_channel()
+        await layer.group_add(GROUP, channel)
+        ready.set()
+        await layer.receive(channel)
+        started = time.perf_counter()
+        await _receive_all(layer, channel, count - 1)
+        done.put(time.perf_counter() - started)
+        await layer.close()
+
+    asyncio.run(main())
+
+
+async def bench_unix_socket(count, payload_size):
+    path = tempfile.mkdtemp(prefix="mb-layer-")
+    ready = multiprocessing.Event()
+    done = multiprocessing.Queue()
+    receiver = multiprocessing.Process(target=_receiver_process, args=(path, count, ready, done))
+    receiver.start()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, ready.wait)
+
+    layer = UnixSocketChannelLayer(path=path)
+    started = time.perf_counter()
+    for index in range(count):
+        await layer.group_send(GROUP, _message(index, payload_size))
+    sent = time.perf_counter() - started
+    # Keep the loop running so buffered frames are flushed while we wait.
+    received = await loop.run_in_executor(None, done.get)
+    await loop.run_in_executor(None, receiver.join)
+    await layer.close()
+    return max(sent, received)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--payload-size", type=int, default=200)
+    args = parser.parse_args()
+
+    results = {}
+    for name, bench in (("in_memory", bench_in_memory), ("unix_socket", bench_unix_socket)):
+        elapsed = asyncio.run(bench(args.messages, args.payload_size))
+        results[name] = {
+            "messages": args.messages,
+            "seconds": round(elapsed, 4),
+            "messages_per_sec": round(args.messages / elapsed, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# benchmarks/env.py
+"""
+Django bootstrap shared by the benchmark scripts.
+
+Benchmarks run against their own SQLite file (``--db``) so a generated graph
+never touches the development database, and by default use the in-memory
+channel layer so WebSocket scenarios measure the consumer rather than the
+transport (``benchmarks.channel_layers`` covers that).
+"""
+import os
+
+IN_MEMORY_LAYER = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer", "CONFIG": {"capacity": 10000}}}
+
+
+def add_arguments(parser):
+    parser.add_argument("--db", default="bench.sqlite3", help="SQLite file to use (created if missing)")
+    parser.add_argument(
+        "--channel-layer", choices=("memory", "settings"), default="memory",
+        help="'memory' swaps in InMemoryChannelLayer; 'settings' keeps CHANNEL_LAYERS as configured",
+    )
+
+
+def setup(db_path=None, channel_layer="memory", migrate=True):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "microblog.settings")
+    from django.conf import settings
+
+    # Connections are created lazily, so overriding before setup() is enough.
+    if db_path:
+        settings.DATABASES["default"]["NAME"] = os.path.abspath(db_path)
+    if channel_layer == "memory":
+        settings.CHANNEL_LAYERS = IN_MEMORY_LAYER
+    # Tracebacks and the debug query log would skew timings.
+    settings.DEBUG = False
+    # With DEBUG off an empty ALLOWED_HOSTS rejects the test client's host.
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+
+    import django
+    django.setup()
+
+    if migrate:
+        from django.core.management import call_command
+        call_command("migrate", verbosity=0, interactive=False)
@@ -0,0 +1,249 @@
+# benchmarks/graph.py
+"""
+Seeded synthetic social graph for benchmarks.
+
+Users get a Zipf-distributed popularity. Follow targets are drawn by
+popularity, so a few accounts collect most of the followers, and out-degrees
+follow a Pareto tail. Posts, likes and comments also lean toward popular
+authors. The same ``--seed`` and options always produce the same graph. Rows
+go in with ``bulk_create`` in ``--chunk-size`` batches. Memory grows with the
+user and post counts: at 10M users, expect a few GB for the popularity table
+and post index.
+
+    cd backend
+    python -m benchmarks.graph --db bench.sqlite3 --users 10000 --seed 1
+
+Derived data is rebuilt afterwards unless ``--skip-derived`` is given. That
+covers timelines, like and comment counts, affinity and the search index.
+"""
+import argparse
+import bisect
+import itertools
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+
+from benchmarks import env
+
+USERNAME_PREFIX = "bench"
+WORDS = (
+    "coffee deploy weekend launch bug fix release music photo sunset running "
+    "python django feed timeline cache latency queue shard index search"
+).split()
+
+
+def username(index):
+    return f"{USERNAME_PREFIX}{index}"
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let ``bulk_create`` keep the ``created_at`` values we generate."""
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field, _ in saved:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in saved:
+            field.auto_now_add = value
+
+
+class GraphGenerator:
+    def __init__(self, users, follows=40, posts=10, likes=30, comments=5, alpha=1.1,
+                 days=30, seed=1, chunk_size=5000, log=print):
+        self.users = users
+        self.follows = follows
+        self.posts = posts
+        self.likes = likes
+        self.comments = comments
+        self.alpha = alpha
+        self.days = days
+        self.chunk_size = chunk_size
+        self.rng = random.Random(seed)
+        self.log = log
+        self.user_ids = array("q")
+        self.cum_weights = []
+        # Post IDs grouped by author: author ``i`` owns
+        # post_ids[post_offsets[i]:post_offsets[i + 1]].
+        self.post_ids = array("q")
+        self.post_offsets = array("q", [0])
+
+    def popular_index(self):
+        """Index of a user drawn by popularity."""
+        return bisect.bisect(self.cum_weights, self.rng.random() * self.cum_weights[-1])
+
+    def degree(self, mean):
+        # paretovariate(2) has mean 2, so halving keeps the requested mean.
+        return int(mean / 2 * self.rng.paretovariate(2))
+
+    def _insert(self, model, rows):
+        """``bulk_create`` ``rows`` in chunks, yielding each created batch."""
+        # Models with a unique pair may draw duplicates; the others need their PKs back.
+        ignore_conflicts = bool(model._meta.unique_together)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.chunk_size:
+                yield model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+                batch = []
+        if batch:
+            yield model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+
+    def create_users(self):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.hashers import make_password
+
+        User = get_user_model()
+        if User.objects.filter(username=username(0)).exists():
+            raise SystemExit(f"{User._meta.db_table} already has generated users; use a fresh --db")
+
+        password = make_password("bench-password")
+        rows = (
+            User(username=username(index), email=f"{username(index)}@example.com", password=password)
+            for index in range(self.users)
+        )
+        for batch in self._insert(User, rows):
+            self.user_ids.extend(user.pk for user in batch)
+        self.log(f"users: {len(self.user_ids)}")
+
+        # Popularity is Zipf over a shuffled rank so it doesn't track user IDs.
+        ranks = list(range(1, self.users + 1))
+        self.rng.shuffle(ranks)
+        self.cum_weights = list(itertools.accumulate(rank ** -self.alpha for rank in ranks))
+
+    def create_follows(self):
+        from posts.models import Follow
+
+        def rows():
+            for index, user_id in enumerate(self.user_ids):
+                wanted = min(self.degree(self.follows), self.users - 1)
+                followees = set()
+                for _ in range(wanted * 2):
+                    if len(followees) >= wanted:
+                        break
+                    target = self.popular_index()
+                    if target != index:
+                        followees.add(target)
+                for target in followees:
+                    yield Follow(follower_id=user_id, followee_id=self.user_ids[target])
+
+        total = sum(len(batch) for batch in self._insert(Follow, rows()))
+        self.log(f"follows: {total}")
+
+    def create_posts(self):
+        from django.utils import timezone
+        from posts.models import Post
+
+        now = timezone.now()
+        span = self.days * 86400
+        field = Post._meta.get_field("created_at")
+        mean_weight = self.cum_weights[-1] / self.users
+
+        # Authors are written in order and never split across a bulk_create,
+        # so each author's post IDs can be recorded as one slice.
+        with explicit_timestamps(field):
+            batch = []
+            for index, user_id in enumerate(self.user_ids):
+                weight = self.cum_weights[index] - (self.cum_weights[index - 1] if index else 0)
+                count = self.degree(self.posts * min(4.0, 0.5 + weight / mean_weight))
+                for _ in range(count):
+                    batch.append(Post(
+                        user_id=user_id,
+                        text=" ".join(self.rng.choices(WORDS, k=self.rng.randint(3, 20))),
+                        created_at=now - timedelta(seconds=self.rng.uniform(0, span)),
+                    ))
+                if len(batch) >= self.chunk_size or index == len(self.user_ids) - 1:
+                    self.post_ids.extend(post.pk for post in Post.objects.bulk_create(batch))
+                    batch = []
+                self.post_offsets.append(len(self.post_ids) + len(batch))
+        self.log(f"posts: {len(self.post_ids)}")
+
+    def random_post_id(self):
+        """A post by a popularity-weighted author, or ``None`` if that author has none."""
+        author = self.popular_index()
+        start, end = self.post_offsets[author], self.post_offsets[author + 1]
+        if start == end:
+            return None
+        return self.post_ids[self.rng.randrange(start, end)]
+
+    def _interactions(self, mean, make):
+        for user_id in self.user_ids:
+            for _ in range(self.degree(mean)):
+                post_id = self.random_post_id()
+                if post_id is not None:
+                    yield make(user_id, post_id)
+
+    def create_likes(self):
+        from posts.models import Like
+
+        rows = self._interactions(self.likes, lambda user_id, post_id: Like(user_id=user_id, post_id=post_id))
+        total = sum(len(batch) for batch in self._insert(Like, rows))
+        self.log(f"likes: {total}")
+
+    def create_comments(self):
+        from django.utils import timezone
+        from posts.models import Comment
+
+        now = timezone.now()
+        span = self.days * 86400
+
+        def make(user_id, post_id):
+            return Comment(
+                user_id=user_id,
+                post_id=post_id,
+                content=" ".join(self.rng.choices(WORDS, k=self.rng.randint(2, 12))),
+                created_at=now - timedelta(seconds=self.rng.uniform(0, span)),
+            )
+
+        with explicit_timestamps(Comment._meta.get_field("created_at")):
+            total = sum(len(batch) for batch in self._insert(Comment, self._interactions(self.comments, make)))
+        self.log(f"comments: {total}")
+
+    def generate(self):
+        for step in (self.create_users, self.create_follows, self.create_posts,
+                     self.create_likes, self.create_comments):
+            started = time.perf_counter()
+            step()
+            self.log(f"  {step.__name__} took {time.perf_counter() - started:.1f}s")
+
+
+def rebuild_derived():
+    from django.core.management import call_command
+
+    for command in ("rebuild_timelines", "reconcile_like_counts", "reconcile_comment_counts",
+                    "backfill_affinity", "reindex_posts"):
+        started = time.perf_counter()
+        call_command(command, verbosity=0)
+        print(f"{command} took {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    env.add_arguments(parser)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--follows", type=int, default=40, help="mean follows per user")
+    parser.add_argument("--posts", type=int, default=10, help="mean posts per user")
+    parser.add_argument("--likes", type=int, default=30, help="mean likes per user")
+    parser.add_argument("--comments", type=int, default=5, help="mean comments per user")
+    parser.add_argument("--alpha", type=float, default=1.1, help="Zipf exponent for popularity")
+    parser.add_argument("--days", type=int, default=30, help="spread post timestamps over this many days")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--skip-derived", action="store_true")
+    args = parser.parse_args()
+
+    env.setup(args.db, args.channel_layer)
+    GraphGenerator(
+        users=args.users, follows=args.follows, posts=args.posts, likes=args.likes,
+        comments=args.comments, alpha=args.alpha, days=args.days, seed=args.seed,
+        chunk_size=args.chunk_size,
+    ).generate()
+    if not args.skip_derived:
+        rebuild_derived()
+
+
+if __name__ == "__main__":
+    main()
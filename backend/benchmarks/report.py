@@ -0,0 +1,128 @@
+# benchmarks/report.py
+"""
+Benchmark results: summaries, JSON reports and run-to-run comparison.
+
+A report is a JSON object with a ``meta`` block (scenario options, git
+revision, timestamp) and one entry per scenario with latency percentiles in
+milliseconds, queries per request and throughput. Compare two reports with
+
+    python -m benchmarks.report base.json new.json --threshold 0.10
+
+which prints the change for every metric and exits non-zero if any metric
+got worse by more than the threshold.
+"""
+import argparse
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+
+# Metrics where growth is a regression, and where shrinking is.
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "mean_ms", "queries_per_request", "queries_max")
+HIGHER_IS_BETTER = ("throughput_per_sec",)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, queries=(), errors=0, elapsed=None, count=None):
+    """
+    Summarize one scenario. ``latencies`` are seconds per operation; ``count``
+    is the number of operations ``elapsed`` covers when it differs (e.g. one
+    timed batch delivering many messages).
+    """
+    ordered = sorted(latencies)
+    count = len(ordered) if count is None else count
+    elapsed = sum(ordered) if elapsed is None else elapsed
+    summary = {
+        "count": count,
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "throughput_per_sec": round(count / elapsed, 1) if elapsed else 0.0,
+    }
+    if queries:
+        summary["queries_per_request"] = round(sum(queries) / len(queries), 2)
+        summary["queries_max"] = max(queries)
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build(results, **meta):
+    meta.update({
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+    })
+    return {"meta": meta, "scenarios": results}
+
+
+def write(report, path=None):
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def compare(base, new, threshold=0.10):
+    """Return ``(rows, regressions)`` comparing two reports scenario by scenario."""
+    rows = []
+    regressions = []
+    for name, before in sorted(base["scenarios"].items()):
+        after = new["scenarios"].get(name)
+        if after is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if metric not in before or metric not in after:
+                continue
+            old, current = before[metric], after[metric]
+            change = (current - old) / old if old else 0.0
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            rows.append((name, metric, old, current, change, worse))
+            if worse:
+                regressions.append((name, metric))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    rows, regressions = compare(base, new, args.threshold)
+    for name, metric, old, current, change, worse in rows:
+        flag = "  REGRESSION" if worse else ""
+        print(f"{name:<16} {metric:<20} {old:>12} -> {current:<12} {change:+8.1%}{flag}")
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
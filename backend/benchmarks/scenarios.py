@@ -0,0 +1,235 @@
+# benchmarks/scenarios.py
+"""
+Drive the real endpoints and the feed WebSocket in process.
+
+Each HTTP scenario sends requests through DRF's ``APIClient`` with real JWT
+access tokens, so authentication, serialization and the full middleware
+stack are all timed. Queries are counted per request with
+``CaptureQueriesContext``. ``create_post`` also times the background fan-out
+until the dispatcher is idle. ``feed_ws`` connects followers of a popular
+author through ``WebsocketCommunicator`` and measures end-to-end delivery.
+
+    cd backend
+    python -m benchmarks.graph --db bench.sqlite3 --users 5000
+    python -m benchmarks.scenarios --db bench.sqlite3 --requests 300 --out base.json
+    python -m benchmarks.report base.json new.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks import env, report
+
+SCENARIOS = ("feed", "profile", "toggle_like", "create_post", "feed_ws")
+
+
+class Bench:
+    """Sampling helpers and per-user API clients over a generated graph."""
+
+    def __init__(self, seed=1):
+        from django.contrib.auth import get_user_model
+        from django.db.models import Max, Min
+        from posts.models import Post
+
+        self.rng = random.Random(seed)
+        self.User = get_user_model()
+        user_range = self.User.objects.aggregate(low=Min("id"), high=Max("id"))
+        post_range = Post.objects.aggregate(low=Min("id"), high=Max("id"))
+        if user_range["low"] is None or post_range["low"] is None:
+            raise SystemExit("No users or posts; run `python -m benchmarks.graph` against this --db first")
+        self.user_range = (user_range["low"], user_range["high"])
+        self.post_range = (post_range["low"], post_range["high"])
+        self._clients = {}
+
+    def _sample(self, model, bounds, count):
+        # Random IDs in the PK range are much cheaper than ORDER BY RANDOM()
+        # on a large table; gaps are simply retried.
+        found = {}
+        for _ in range(10):
+            if len(found) >= count:
+                break
+            ids = [self.rng.randint(*bounds) for _ in range(count * 2)]
+            found.update(model.objects.in_bulk(ids))
+        return list(found.values())[:count]
+
+    def users(self, count):
+        return self._sample(self.User, self.user_range, count)
+
+    def post_ids(self, count):
+        from posts.models import Post
+        return [post.pk for post in self._sample(Post, self.post_range, count)]
+
+    def token(self, user):
+        from rest_framework_simplejwt.tokens import AccessToken
+        return str(AccessToken.for_user(user))
+
+    def client(self, user):
+        from rest_framework.test import APIClient
+
+        client = self._clients.get(user.pk)
+        if client is None:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token(user)}")
+            self._clients[user.pk] = client
+        return client
+
+
+def run_http(bench, name, requests, warmup=10):
+    """Run one HTTP scenario and return its summary."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from posts import fanout
+
+    users = bench.users(min(requests, 200))
+    posts = bench.post_ids(min(requests, 500))
+    if name == "toggle_like":
+        # PostViewSet only resolves the requester's own posts
+        from posts.models import Post
+
+        own = dict(Post.objects.filter(user__in=users).values_list("user_id", "id"))
+        users = [user for user in users if user.pk in own]
+        if not users:
+            raise SystemExit("None of the sampled users have posts")
+        posts = [own[user.pk] for user in users]
+
+    def operation(index):
+        user = users[index % len(users)]
+        client = bench.client(user)
+        if name == "feed":
+            return client.get("/api/feed/")
+        if name == "profile":
+            return client.get(f"/api/users/{users[(index * 7 + 3) % len(users)].username}/")
+        if name == "toggle_like":
+            return client.post(f"/api/posts/{posts[index % len(posts)]}/toggle_like/")
+        if name == "create_post":
+            return client.post("/api/posts/", {"content": f"benchmark post {index}"}, format="json")
+        raise ValueError(name)
+
+    for index in range(warmup):
+        operation(index)
+    fanout.get_dispatcher().join()
+
+    latencies, queries, fanout_latencies = [], [], []
+    errors = 0
+    started = time.perf_counter()
+    for index in range(warmup, warmup + requests):
+        with CaptureQueriesContext(connection) as captured:
+            began = time.perf_counter()
+            response = operation(index)
+            latencies.append(time.perf_counter() - began)
+        queries.append(len(captured))
+        if response.status_code >= 400:
+            errors += 1
+        if name == "create_post":
+            began = time.perf_counter()
+            fanout.get_dispatcher().join()
+            fanout_latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - started
+
+    summary = report.summarize(latencies, queries, errors=errors, elapsed=elapsed)
+    if fanout_latencies:
+        summary["fanout"] = report.summarize(fanout_latencies)
+    return summary
+
+
+async def run_websocket(bench, connections, posts, timeout=30.0):
+    """
+    Connect followers of one popular author, publish ``posts`` posts as that
+    author and time until every socket has received all of them.
+    """
+    from asgiref.sync import sync_to_async
+    from channels.testing import WebsocketCommunicator
+    from django.db.models import Count
+    from microblog.asgi import application
+    from posts.models import Follow
+
+    @sync_to_async
+    def pick_audience():
+        author_id = (
+            Follow.objects.values("followee_id").annotate(n=Count("id")).order_by("-n")
+            .values_list("followee_id", flat=True).first()
+        )
+        follower_ids = list(
+            Follow.objects.filter(followee_id=author_id).values_list("follower_id", flat=True)[:connections]
+        )
+        followers = list(bench.User.objects.filter(pk__in=follower_ids))
+        return bench.User.objects.get(pk=author_id), [(user, bench.token(user)) for user in followers]
+
+    author, audience = await pick_audience()
+    sockets = []
+    for _, token in audience:
+        communicator = WebsocketCommunicator(application, "/ws/feed/", subprotocols=["access_token", token])
+        connected, _ = await communicator.connect()
+        if connected:
+            sockets.append(communicator)
+
+    @sync_to_async
+    def publish():
+        from posts import fanout
+        client = bench.client(author)
+        for index in range(posts):
+            client.post("/api/posts/", {"content": f"websocket benchmark {index}"}, format="json")
+        fanout.get_dispatcher().join()
+
+    async def drain(communicator):
+        received = 0
+        while received < posts:
+            frame = json.loads(await communicator.receive_from(timeout=timeout))
+            if frame.get("type") == "resync":
+                break
+            received += len(frame["posts"])
+            await communicator.send_to(text_data=json.dumps({"type": "ack", "seq": frame["seq"]}))
+        return time.perf_counter(), received
+
+    started = time.perf_counter()
+    drains = [asyncio.ensure_future(drain(communicator)) for communicator in sockets]
+    await publish()
+    results = await asyncio.gather(*drains, return_exceptions=True)
+    for communicator in sockets:
+        try:
+            await communicator.disconnect()
+        except asyncio.CancelledError:
+            # A receive timeout already cancelled this socket's application
+            pass
+
+    finished = [result for result in results if not isinstance(result, BaseException)]
+    delivered = sum(received for _, received in finished)
+    latencies = [done - started for done, _ in finished]
+    summary = report.summarize(
+        latencies, errors=len(results) - len(finished), elapsed=max(latencies, default=0.0), count=delivered,
+    )
+    summary["connections"] = len(sockets)
+    summary["posts"] = posts
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    env.add_arguments(parser)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per HTTP scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--ws-connections", type=int, default=100)
+    parser.add_argument("--ws-posts", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    env.setup(args.db, args.channel_layer)
+    bench = Bench(seed=args.seed)
+    results = {}
+    for name in args.scenarios.split(","):
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}")
+        if name == "feed_ws":
+            results[name] = asyncio.run(run_websocket(bench, args.ws_connections, args.ws_posts))
+        else:
+            results[name] = run_http(bench, name, args.requests, args.warmup)
+
+    report.write(report.build(results, **{key: value for key, value in vars(args).items() if key != "out"}), args.out)
+
+
+if __name__ == "__main__":
+    main()
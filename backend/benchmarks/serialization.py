@@ -0,0 +1,96 @@
+# benchmarks/serialization.py
+"""
+Serialize-and-render time per page of posts: ``PostSerializer`` with DRF's
+``JSONRenderer`` vs ``posts.fastserialize`` with ``FastJSONRenderer``.
+
+Pages are the newest posts of the benchmark graph, ``--page-size`` at a time
+(100 by default), serialized for a random viewer. Serialize times include
+the page's lookup queries; both paths start from post IDs. Every page is
+also checked for byte-identical output.
+
+    cd backend
+    python -m benchmarks.graph --db bench.sqlite3 --users 2000
+    python -m benchmarks.serialization --db bench.sqlite3 --pages 50
+"""
+import argparse
+import json
+import random
+import time
+from types import SimpleNamespace
+
+from benchmarks import env, report
+
+
+def measure(serialize, renderer, pages):
+    serialize_timings, render_timings, outputs = [], [], []
+    for post_ids, viewer in pages:
+        started = time.perf_counter()
+        data = serialize(post_ids, viewer)
+        serialized = time.perf_counter()
+        outputs.append(renderer.render(data))
+        render_timings.append(time.perf_counter() - serialized)
+        serialize_timings.append(serialized - started)
+    totals = [a + b for a, b in zip(serialize_timings, render_timings)]
+    return {
+        "serialize": report.summarize(serialize_timings),
+        "render": report.summarize(render_timings),
+        "total": report.summarize(totals),
+    }, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    env.add_arguments(parser)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    env.setup(args.db, args.channel_layer)
+    from django.contrib.auth.models import User
+    from rest_framework.renderers import JSONRenderer
+
+    from posts import fastserialize, renderers
+    from posts.models import Post
+    from posts.serializers import PostSerializer
+
+    rng = random.Random(args.seed)
+    newest = list(Post.objects.order_by("-created_at", "-id").values_list("id", flat=True)[:args.pages * args.page_size])
+    if not newest:
+        raise SystemExit("No posts; generate a graph first (python -m benchmarks.graph --db ...)")
+    user_ids = list(User.objects.values_list("id", flat=True)[:1000])
+    viewers = {user.id: user for user in User.objects.filter(id__in=rng.sample(user_ids, min(len(user_ids), args.pages)))}
+    pages = [
+        (newest[start:start + args.page_size], rng.choice(list(viewers.values())))
+        for start in range(0, len(newest), args.page_size)
+    ]
+
+    def serializer_path(post_ids, viewer):
+        posts = Post.objects.select_related("user").in_bulk(post_ids)
+        found = [posts[post_id] for post_id in post_ids if post_id in posts]
+        return PostSerializer(found, many=True, context={"request": SimpleNamespace(user=viewer)}).data
+
+    def fast_path(post_ids, viewer):
+        return fastserialize.serialize_posts(fastserialize.post_rows_by_id(post_ids), viewer)
+
+    # One unmeasured pass each so connection setup and caches don't count
+    measure(serializer_path, JSONRenderer(), pages[:1])
+    measure(fast_path, renderers.FastJSONRenderer(), pages[:1])
+
+    baseline, expected = measure(serializer_path, JSONRenderer(), pages)
+    fast, actual = measure(fast_path, renderers.FastJSONRenderer(), pages)
+    mismatched = sum(1 for a, b in zip(expected, actual) if a != b)
+
+    print(json.dumps({
+        "pages": len(pages),
+        "page_size": args.page_size,
+        "orjson": renderers.orjson is not None,
+        "identical_output": mismatched == 0,
+        "mismatched_pages": mismatched,
+        "results": {"serializer": baseline, "fast": fast},
+        "speedup_p50": round(baseline["total"]["p50_ms"] / fast["total"]["p50_ms"], 2) if fast["total"]["p50_ms"] else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
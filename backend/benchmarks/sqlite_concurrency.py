@@ -0,0 +1,231 @@
+# benchmarks/sqlite_concurrency.py
+"""
+SQLite under mixed load: the stock configuration vs production mode.
+
+Writer threads toggle likes (insert/delete a like row and update the post's
+count) while reader threads page through a user's posts with the likes
+count. Two configurations are compared:
+
+* ``default``: the rollback journal with ``synchronous=FULL``. Every writer
+  opens its own deferred transaction, which is what Django does out of the box.
+* ``wal_immediate``: the production pragmas (WAL, ``synchronous=NORMAL``,
+  mmap and a 64 MB cache), with every writer opening ``BEGIN IMMEDIATE``
+  itself. This is production mode with ``WRITE_QUEUE_ENABLED = False``.
+* ``production``: the same pragmas, with writes handed to one writer thread
+  that commits batches in savepoints, mirroring ``posts.writequeue``.
+
+Only the standard library is needed:
+
+    cd backend
+    python -m benchmarks.sqlite_concurrency --seconds 5 --writers 8 --readers 8
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+from benchmarks import report
+
+PRODUCTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def create_database(path, users, posts):
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE post (id INTEGER PRIMARY KEY, user_id INTEGER, text TEXT, created_at REAL, likes_count INTEGER);
+        CREATE INDEX post_user_created ON post (user_id, created_at);
+        CREATE TABLE "like" (id INTEGER PRIMARY KEY, user_id INTEGER, post_id INTEGER, UNIQUE (user_id, post_id));
+    """)
+    rng = random.Random(1)
+    db.executemany(
+        "INSERT INTO post (user_id, text, created_at, likes_count) VALUES (?, ?, ?, 0)",
+        ((rng.randrange(users), "x" * 140, time.time() - rng.uniform(0, 86400)) for _ in range(posts)),
+    )
+    db.commit()
+    db.close()
+
+
+def connect(path, production):
+    # isolation_level=None: transactions are explicit, like Django's
+    # autocommit. The timeouts match Django's default and production mode.
+    db = sqlite3.connect(path, timeout=20 if production else 5, isolation_level=None, check_same_thread=False)
+    if production:
+        for pragma in PRODUCTION_PRAGMAS:
+            db.execute(pragma)
+    return db
+
+
+def toggle_like(db, user_id, post_id):
+    # Read then write, like get_or_create() in the like view
+    row = db.execute('SELECT id FROM "like" WHERE user_id = ? AND post_id = ?', (user_id, post_id)).fetchone()
+    if row:
+        db.execute('DELETE FROM "like" WHERE id = ?', row)
+        delta = -1
+    else:
+        db.execute('INSERT INTO "like" (user_id, post_id) VALUES (?, ?)', (user_id, post_id))
+        delta = 1
+    db.execute("UPDATE post SET likes_count = likes_count + ? WHERE id = ?", (delta, post_id))
+
+
+class Writer:
+    """One thread committing queued writes in batches, each job in a savepoint."""
+
+    def __init__(self, path, batch_size, max_delay):
+        self.db = connect(path, production=True)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, *args):
+        future = Future()
+        self.jobs.put((args, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self.jobs.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                try:
+                    job = self.jobs.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if job is None:
+                    self.jobs.put(None)
+                    break
+                batch.append(job)
+            outcomes = []
+            self.db.execute("BEGIN IMMEDIATE")
+            for args, future in batch:
+                self.db.execute("SAVEPOINT job")
+                try:
+                    toggle_like(self.db, *args)
+                    self.db.execute("RELEASE job")
+                    outcomes.append((future, None))
+                except sqlite3.Error as exc:
+                    self.db.execute("ROLLBACK TO job")
+                    self.db.execute("RELEASE job")
+                    outcomes.append((future, exc))
+            self.db.execute("COMMIT")
+            for future, exc in outcomes:
+                if exc is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(exc)
+
+    def close(self):
+        self.jobs.put(None)
+        self.thread.join()
+        self.db.close()
+
+
+def run(config, path, args):
+    production = config == "production"
+    tuned = config != "default"
+    writer = Writer(path, args.batch_size, args.max_delay) if production else None
+    stop = threading.Event()
+    lock = threading.Lock()
+    results = {"writes": 0, "write_errors": 0, "write_latencies": [], "read_latencies": []}
+
+    def write_loop(seed):
+        rng = random.Random(seed)
+        db = None if production else connect(path, tuned)
+        while not stop.is_set():
+            user_id, post_id = rng.randrange(args.users), rng.randrange(1, args.posts + 1)
+            started = time.perf_counter()
+            try:
+                if production:
+                    writer.submit(user_id, post_id)
+                else:
+                    db.execute("BEGIN IMMEDIATE" if tuned else "BEGIN")
+                    try:
+                        toggle_like(db, user_id, post_id)
+                        db.execute("COMMIT")
+                    except sqlite3.Error:
+                        db.execute("ROLLBACK")
+                        raise
+            except sqlite3.OperationalError:
+                with lock:
+                    results["write_errors"] += 1
+                continue
+            took = time.perf_counter() - started
+            with lock:
+                results["writes"] += 1
+                results["write_latencies"].append(took)
+
+    def read_loop(seed):
+        rng = random.Random(seed)
+        db = connect(path, tuned)
+        while not stop.is_set():
+            started = time.perf_counter()
+            db.execute(
+                "SELECT id, text, likes_count FROM post WHERE user_id = ? ORDER BY created_at DESC LIMIT 20",
+                (rng.randrange(args.users),),
+            ).fetchall()
+            took = time.perf_counter() - started
+            with lock:
+                results["read_latencies"].append(took)
+        db.close()
+
+    threads = [threading.Thread(target=write_loop, args=(index,)) for index in range(args.writers)]
+    threads += [threading.Thread(target=read_loop, args=(1000 + index,)) for index in range(args.readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if writer:
+        writer.close()
+
+    return {
+        "writes_per_sec": round(results["writes"] / elapsed, 1),
+        "write_errors": results["write_errors"],
+        "writes": report.summarize(results["write_latencies"], elapsed=elapsed),
+        "reads": report.summarize(results["read_latencies"], elapsed=elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    results = {}
+    for config in ("default", "wal_immediate", "production"):
+        directory = tempfile.mkdtemp(prefix="mb-sqlite-")
+        path = os.path.join(directory, "bench.sqlite3")
+        create_database(path, args.users, args.posts)
+        if config != "default":
+            # journal_mode=WAL is persistent; set it once before the threads start
+            connect(path, production=True).close()
+        results[config] = run(config, path, args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
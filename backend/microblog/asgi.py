@@ -10,15 +10,28 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'microblog.settings')
+
+# Initialize Django before importing anything that touches models
+django_asgi_app = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
+from posts import fanout, trending
 from posts.routing import websocket_urlpatterns
+from posts.ws_auth import JWTAuthMiddleware
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'microblog.settings')
+# Start the fan-out workers now, so fan-out a previous process left pending
+# is resumed without waiting for the next post
+fanout.get_dispatcher().start()
+# Load trending totals before the first request asks for them
+trending.tracker.start()
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": URLRouter(
-        websocket_urlpatterns
+    "http": django_asgi_app,
+    "websocket": JWTAuthMiddleware(
+        URLRouter(
+            websocket_urlpatterns
+        )
     ),
 })
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,6 +55,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'posts.routers.PrimaryPinMiddleware',
+    # Keep last: times the view and rendering only
+    'posts.instrumentation.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'microblog.urls'
@@ -77,9 +81,17 @@ WSGI_APPLICATION = 'microblog.wsgi.application'
 
 ASGI_APPLICATION = 'microblog.asgi.application'
 
+# The HTTP server and the Daphne process holding the WebSockets are separate
+# processes, so the layer has to work across them (see posts/layers.py).
+# To run several hosts, switch to channels_redis instead:
+#     "BACKEND": "channels_redis.core.RedisChannelLayer",
+#     "CONFIG": {"hosts": [("127.0.0.1", 6379)]},
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        "BACKEND": "posts.layers.UnixSocketChannelLayer",
+        "CONFIG": {
+            "path": "/tmp/microblog-channels",
+        },
     },
 }
 
@@ -91,9 +103,59 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections across requests, checking them before reuse
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# SQLite production mode (MICROBLOG_SQLITE_PRODUCTION=1): WAL so readers never
+# wait on the writer, fewer fsyncs, mmap'd reads and a 64 MB page cache on
+# every connection. Transactions take the write lock up front (IMMEDIATE)
+# instead of failing with "database is locked" when upgrading.
+SQLITE_PRODUCTION = os.environ.get('MICROBLOG_SQLITE_PRODUCTION') == '1'
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA mmap_size=268435456;'
+    'PRAGMA cache_size=-65536;'
+    'PRAGMA temp_store=MEMORY;'
+)
+if SQLITE_PRODUCTION:
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': SQLITE_PRAGMAS,
+        'transaction_mode': 'IMMEDIATE',
+        # Seconds to wait for the lock held by another process
+        'timeout': 20,
+    }
+# Optionally funnel request-thread writes through one batching writer thread
+# (MICROBLOG_SQLITE_WRITE_QUEUE=1, see posts/writequeue.py). Compare it with
+# plain IMMEDIATE transactions for your workload using
+# `python -m benchmarks.sqlite_concurrency`.
+WRITE_QUEUE_ENABLED = SQLITE_PRODUCTION and os.environ.get('MICROBLOG_SQLITE_WRITE_QUEUE') == '1'
+WRITE_QUEUE_BATCH_SIZE = 32
+WRITE_QUEUE_MAX_DELAY = 0
+
+# Read replicas for views using posts.routers.ReplicaReadMixin. Locally,
+# MICROBLOG_SQLITE_REPLICAS=path1,path2 adds SQLite aliases (point them at
+# db.sqlite3 itself to exercise routing without replication); for Postgres,
+# add aliases here with the replica hosts.
+for _index, _path in enumerate(filter(None, os.environ.get('MICROBLOG_SQLITE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{_index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path,
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'init_command': SQLITE_PRAGMAS} if SQLITE_PRODUCTION else {},
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+DATABASE_ROUTERS = ['posts.routers.PrimaryReplicaRouter']
+# Keep a user on the primary this long after a write (read-your-writes)
+DATABASE_PIN_SECONDS = 5
+# Probe replicas with SELECT 1 at most this often; failed ones are skipped
+DATABASE_REPLICA_CHECK_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -173,7 +235,7 @@ SIMPLE_JWT = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'posts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -186,3 +248,135 @@ AWS_SECRET_ACCESS_KEY = 'minioadmin'
 AWS_STORAGE_BUCKET_NAME = 'microblog-bucket'
 AWS_S3_ENDPOINT_URL = 'http://localhost:9000'
 AWS_S3_USE_SSL = False
+
+# Materialized home timelines (see posts/timeline.py)
+TIMELINE_BACKEND = 'posts.timeline.DatabaseTimelineBackend'
+TIMELINE_MAX_LENGTH = 800
+# Authors with more followers than this are merged into feeds at read time.
+# Run `manage.py maintain_timelines` periodically to trim timelines back to
+# TIMELINE_MAX_LENGTH and fan out authors who dropped back under the limit.
+TIMELINE_FANOUT_LIMIT = 10000
+
+# Sharded like counters (see posts/counters.py). The trending background
+# thread folds them into Post.likes_count every LIKE_COUNTER_FLUSH_SECONDS;
+# `manage.py reconcile_like_counts --flush-only` does the same on demand
+LIKE_COUNTER_SHARDS = 8
+LIKE_COUNTER_FLUSH_SECONDS = 30
+
+# Background fan-out of new posts (see posts/fanout.py)
+FANOUT_WORKERS = 2
+FANOUT_BATCH_SIZE = 500
+FANOUT_QUEUE_SIZE = 10000
+# Fan-out still pending after this many seconds (a crashed or redeployed
+# process, a failed dispatch) is resubmitted; `manage.py resume_fanout`
+# does the same on demand
+FANOUT_RESUME_SECONDS = 60
+
+# Validated WebSocket access tokens kept in memory (see posts/ws_auth.py)
+WS_TOKEN_CACHE_SIZE = 10000
+
+# Per-socket send queues in FeedConsumer (see posts/consumers.py)
+FEED_SEND_QUEUE_SIZE = 50
+FEED_COALESCE_SECONDS = 0.05
+FEED_MAX_BATCH = 20
+# Frames a client may leave unacknowledged before sends pause for it
+FEED_MAX_UNACKED_FRAMES = 4
+# 'drop_oldest' or 'disconnect' (closes with a resync frame)
+FEED_SLOW_CONSUMER_POLICY = 'drop_oldest'
+
+# Interaction affinity used for feed candidates (see posts/affinity.py)
+AFFINITY_HALF_LIFE_DAYS = 14
+AFFINITY_TOP_K = 100
+# Newest posts per affinity author considered as feed candidates
+AFFINITY_POSTS_PER_AUTHOR = 20
+
+# Full-text search over posts (see posts/search.py); only the newest
+# SEARCH_MAX_CANDIDATES matches of a query are ranked
+SEARCH_BACKEND = 'posts.search.SQLiteFTSBackend'
+SEARCH_MAX_CANDIDATES = 5000
+
+# Cache used by profile responses and other hot read paths. Use a shared
+# backend (e.g. Memcached or Redis) when running more than one process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'microblog',
+    }
+}
+
+# Cached viewer-independent profile payloads (see posts/profile_cache.py)
+PROFILE_CACHE_TIMEOUT = 300
+
+# User rows cached for authentication (see posts/usercache.py). Other
+# processes may serve a deactivated user for up to USER_CACHE_TTL seconds.
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+# Also share loaded users through CACHES['default']
+USER_CACHE_SHARED = False
+
+# Uploaded image variants, by longest edge in pixels (see posts/images.py)
+IMAGE_VARIANTS = {
+    'thumb': 160,
+    'feed': 720,
+    'full': 1600,
+}
+# Rendered before the upload responds, so clients can store their URLs
+# right away; the rest are rendered in the background
+IMAGE_SYNC_VARIANTS = ('feed',)
+IMAGE_WORKERS = 2
+
+# Upper bound on IDs per request for the batch post/like/follow endpoints
+BATCH_MAX_IDS = 500
+
+# Request instrumentation (see posts/instrumentation.py): add Server-Timing
+# headers, and flag a query shape repeated this many times in one request as N+1
+SERVER_TIMING_HEADER = True
+N_PLUS_ONE_THRESHOLD = 5
+
+# Ranked home feed, /api/feed/?mode=ranked (see posts/ranking.py). Weights
+# for each scoring column, plus the candidate bounds and how long a ranking
+# snapshot is kept for paging.
+FEED_RANKING = {
+    'recency': 1.0,
+    'recency_half_life_hours': 6,
+    'likes': 0.6,
+    'affinity': 0.8,
+    'comments': 0.4,
+    'candidates': 2000,
+    'window_hours': 72,
+    'snapshot_seconds': 600,
+}
+
+# Latest comments embedded in each post of a list response (see posts/comments.py)
+COMMENT_PREVIEW_SIZE = 3
+
+# Trending posts, /api/trending/ (see posts/trending.py). Weights per like
+# and comment, the sliding window, how many posts are kept ranked, and how
+# often each process writes its counts and reloads everyone else's.
+TRENDING = {
+    'window_hours': 24,
+    'top_k': 50,
+    'like_weight': 1,
+    'comment_weight': 2,
+    'flush_seconds': 2,
+    'refresh_seconds': 5,
+}
+
+# "Who to follow", /api/suggestions/ (see posts/suggestions.py): suggestions
+# kept per user, and the size above which a follow's effect is left to the
+# next `manage.py compute_suggestions` run instead of applied immediately
+FOLLOW_SUGGESTIONS = {
+    'per_user': 50,
+    'max_fanout': 5000,
+}
+
+# Hot/cold tiering (see posts/archive.py): `manage.py archive_posts` moves
+# posts older than this into the archive tables, and list endpoints read the
+# archive only past that age. Other processes pick up a newly archived
+# boundary within ARCHIVE_BOUNDARY_TTL seconds.
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_BOUNDARY_TTL = 60
+
+# Account export, /api/export/ and `manage.py export_user` (see
+# posts/export.py): rows fetched per database round trip while streaming
+EXPORT_CHUNK_SIZE = 2000
@@ -0,0 +1,156 @@
+# posts/affinity.py
+"""
+Incrementally maintained user -> author affinity.
+
+Likes and comments add weight to the (user, author) edge; weights halve every
+``AFFINITY_HALF_LIFE_DAYS``. Each edge is stored as a single time-invariant
+score (see ``Affinity``), and only the top ``AFFINITY_TOP_K`` authors per user
+are kept, so feed candidate selection reads a small precomputed set instead of
+the user's whole interaction history.
+
+Scores never change on their own, so an edge the user stopped engaging with
+keeps its slot until it's overwritten. Reads therefore compare the stored score
+against ``min_score(now)`` (the score of an edge decayed to ``MIN_WEIGHT``),
+``prune()`` deletes edges below it, and feed queries take at most
+``AFFINITY_POSTS_PER_AUTHOR`` recent posts from each affinity author.
+"""
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Affinity, Post
+
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+# Edges that decay below this weight are dropped
+MIN_WEIGHT = 0.05
+
+
+def half_life_seconds():
+    return getattr(settings, 'AFFINITY_HALF_LIFE_DAYS', 14) * 86400
+
+
+def top_k():
+    return getattr(settings, 'AFFINITY_TOP_K', 100)
+
+
+def posts_per_author():
+    return getattr(settings, 'AFFINITY_POSTS_PER_AUTHOR', 20)
+
+
+def to_score(weight, at):
+    return math.log2(weight) + at.timestamp() / half_life_seconds()
+
+
+def weight_at(score, at):
+    return 2 ** (score - at.timestamp() / half_life_seconds())
+
+
+def min_score(at):
+    """Stored scores below this have decayed under ``MIN_WEIGHT`` by ``at``."""
+    return to_score(MIN_WEIGHT, at)
+
+
+def record_interaction(user_id, author_id, delta, at=None):
+    """Add ``delta`` (negative to undo) to the user's decayed affinity for an author."""
+    record_interactions(user_id, {author_id: delta}, at)
+
+
+def record_interactions(user_id, deltas, at=None):
+    """Add ``{author_id: delta}`` to the user's affinities with one read and a few set-based writes."""
+    deltas = {author_id: delta for author_id, delta in deltas.items() if author_id != user_id}
+    if not deltas:
+        return
+    at = at or timezone.now()
+    with transaction.atomic():
+        rows = {
+            row.author_id: row
+            for row in Affinity.objects.select_for_update().filter(user_id=user_id, author_id__in=deltas)
+        }
+        decayed, changed, created = [], [], []
+        for author_id, delta in deltas.items():
+            row = rows.get(author_id)
+            weight = (weight_at(row.score, at) if row else 0.0) + delta
+            if weight < MIN_WEIGHT:
+                if row:
+                    decayed.append(row.pk)
+            elif row:
+                row.score = to_score(weight, at)
+                row.last_interaction_at = at
+                changed.append(row)
+            else:
+                created.append(Affinity(
+                    user_id=user_id, author_id=author_id, score=to_score(weight, at), last_interaction_at=at
+                ))
+        if decayed:
+            Affinity.objects.filter(pk__in=decayed).delete()
+        if changed:
+            Affinity.objects.bulk_update(changed, ['score', 'last_interaction_at'])
+        if created:
+            # A concurrent first interaction wins, as get_or_create would
+            Affinity.objects.bulk_create(created, ignore_conflicts=True)
+            _trim(user_id)
+
+
+def _trim(user_id):
+    overflow = list(
+        Affinity.objects.filter(user_id=user_id).order_by('-score').values_list('id', flat=True)[top_k():]
+    )
+    if overflow:
+        Affinity.objects.filter(id__in=overflow).delete()
+
+
+def record_like(user_id, author_id, liked=True):
+    record_interaction(user_id, author_id, LIKE_WEIGHT if liked else -LIKE_WEIGHT)
+
+
+def record_comment(user_id, author_id, created=True):
+    record_interaction(user_id, author_id, COMMENT_WEIGHT if created else -COMMENT_WEIGHT)
+
+
+def top_weights(user_id, at=None, limit=None):
+    """``{author_id: weight at at}`` for the user's live edges, at most ``limit`` of them."""
+    at = at or timezone.now()
+    rows = (
+        Affinity.objects.filter(user_id=user_id, score__gte=min_score(at))
+        .order_by('-score')
+        .values_list('author_id', 'score')[:limit or top_k()]
+    )
+    return {author_id: weight_at(score, at) for author_id, score in rows}
+
+
+def top_authors(user_id, limit=None):
+    """Author IDs the user engages with most right now, strongest first."""
+    return list(top_weights(user_id, limit=limit))
+
+
+def recent_post_ids(author_ids, model=Post, per_author=None):
+    """Subquery of the newest ``per_author`` post IDs by each of ``author_ids``.
+
+    Keeps one prolific affinity author from filling the feed's candidate set.
+    """
+    return (
+        model.objects.filter(user__in=author_ids)
+        .annotate(position=Window(
+            RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[F('created_at').desc(), F('id').desc()],
+        ))
+        .filter(position__lte=per_author or posts_per_author())
+        .values('id')
+    )
+
+
+def prune(at=None, batch_size=5000):
+    """Delete edges that have decayed below ``MIN_WEIGHT``; returns how many."""
+    cutoff = min_score(at or timezone.now())
+    deleted = 0
+    while True:
+        ids = list(Affinity.objects.filter(score__lt=cutoff).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Affinity.objects.filter(id__in=ids).delete()[0]
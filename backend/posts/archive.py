@@ -0,0 +1,144 @@
+# posts/archive.py
+"""
+Hot/cold tiering for old posts.
+
+``archive_posts`` (``manage.py archive_posts``) moves posts older than
+``ARCHIVE_AFTER_DAYS`` out of ``Post`` into ``ArchivedPost``, oldest first,
+in chunks. Each chunk's likes and comments move with it in the same
+transaction, after its pending like shards are folded into ``likes_count``;
+that transaction is one job on the write queue (see posts/writequeue.py).
+The hot table and its ``created_at`` indexes then only cover recent posts.
+Archived posts keep their IDs and stay in the search index, but can no
+longer be liked or commented on.
+
+Because posts move oldest first, every archived post sorts at or before the
+*boundary*: the newest archived ``(created_at, id)``, or the
+``ARCHIVE_AFTER_DAYS`` cutoff if that is later. ``ArchiveFallbackPagination``
+queries the archive only for pages that reach the boundary, so pages of
+recent posts never touch it. Other processes see a new boundary within
+``ARCHIVE_BOUNDARY_TTL`` seconds. Until then they rely on the cutoff, which
+is already later for any run using the configured age.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters, profile_cache, writequeue
+from .models import ArchivedComment, ArchivedLike, ArchivedPost, Comment, Like, Post
+
+BOUNDARY_KEY = 'archive:boundary'
+# The largest ID Post will ever hand out, used for a boundary at a bare timestamp
+MAX_ID = 2 ** 63 - 1
+
+COPIED_FIELDS = ('id', 'user_id', 'text', 'image_url', 'created_at', 'updated_at', 'likes_count', 'comments_count')
+
+
+def archive_after():
+    return timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 180))
+
+
+def boundary_ttl():
+    return getattr(settings, 'ARCHIVE_BOUNDARY_TTL', 60)
+
+
+def newest_archived():
+    """``(created_at, id)`` of the newest archived post, or ``None``."""
+    return ArchivedPost.objects.order_by('-created_at', '-id').values_list('created_at', 'id').first()
+
+
+def _cached_newest():
+    newest = cache.get(BOUNDARY_KEY)
+    if newest is None:
+        newest = newest_archived() or ()
+        cache.set(BOUNDARY_KEY, newest, boundary_ttl())
+    return newest
+
+
+def has_archived():
+    """Whether any post has been archived, as of the cached boundary."""
+    return bool(_cached_newest())
+
+
+def boundary(now=None):
+    """``(created_at, id)`` at or after which no post has been archived."""
+    newest = _cached_newest()
+    cutoff = ((now or timezone.now()) - archive_after(), MAX_ID)
+    return max(cutoff, tuple(newest)) if newest else cutoff
+
+
+def archive_chunk(cutoff, chunk_size=500):
+    """Archive up to ``chunk_size`` of the oldest posts created before ``cutoff``. Returns how many moved."""
+    moved = writequeue.run(_move_chunk, cutoff, chunk_size)
+    if not moved:
+        return 0
+    cache.set(BOUNDARY_KEY, newest_archived() or (), boundary_ttl())
+    profile_cache.bump(*set(moved.values()))
+    return len(moved)
+
+
+def _move_chunk(cutoff, chunk_size):
+    """Copy a chunk of posts to the archive tables and delete them; returns ``{post_id: author_id}``."""
+    with transaction.atomic():
+        post_ids = list(
+            Post.objects.filter(created_at__lt=cutoff).order_by('created_at', 'id')
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not post_ids:
+            return {}
+        counters.flush_like_counters_for(post_ids)
+
+        posts = list(Post.objects.filter(id__in=post_ids).values(*COPIED_FIELDS))
+        ArchivedPost.objects.bulk_create([ArchivedPost(**row) for row in posts], batch_size=500)
+        ArchivedLike.objects.bulk_create(
+            [
+                ArchivedLike(user_id=user_id, post_id=post_id, created_at=created_at)
+                for user_id, post_id, created_at in Like.objects.filter(post_id__in=post_ids)
+                .values_list('user_id', 'post_id', 'created_at').iterator(chunk_size=2000)
+            ],
+            batch_size=1000,
+        )
+        ArchivedComment.objects.bulk_create(
+            [
+                ArchivedComment(**row)
+                for row in Comment.objects.filter(post_id__in=post_ids)
+                .values('id', 'user_id', 'post_id', 'content', 'created_at').iterator(chunk_size=2000)
+            ],
+            batch_size=1000,
+        )
+        # Cascades to likes, comments, counter shards, timeline entries and trending buckets
+        Post.objects.filter(id__in=post_ids).delete()
+    return {row['id']: row['user_id'] for row in posts}
+
+
+def archive_posts(older_than=None, chunk_size=500, pause=0.0, max_chunks=None, progress=None):
+    """
+    Archive every post older than ``older_than`` (default ``ARCHIVE_AFTER_DAYS``),
+    one chunk per transaction, sleeping ``pause`` seconds between chunks so
+    request writes aren't starved. Returns the number of posts archived.
+    """
+    cutoff = timezone.now() - (older_than if older_than is not None else archive_after())
+    archived = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        moved = archive_chunk(cutoff, chunk_size)
+        if not moved:
+            break
+        archived += moved
+        chunks += 1
+        if progress:
+            progress(archived)
+        if pause:
+            time.sleep(pause)
+    return archived
+
+
+def liked_post_ids(user, post_ids):
+    """The IDs in ``post_ids`` that ``user`` liked, hot or archived."""
+    liked = set(Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True))
+    rest = [post_id for post_id in post_ids if post_id not in liked]
+    if rest and has_archived():
+        liked.update(ArchivedLike.objects.filter(user=user, post_id__in=rest).values_list('post_id', flat=True))
+    return liked
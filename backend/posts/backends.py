@@ -1,24 +1,35 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from .usercache import user_cache
 
 User = get_user_model()
 
 class EmailBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
-        # First try to find user by email (treating username as email)
-        user = User.objects.filter(email=username).first()
-        if user and user.check_password(password) and self.user_can_authenticate(user):
-            return user
+        if username is None or password is None:
+            return None
+
+        # Look the login up as an email or a username in one query; an email
+        # match is tried before a username match, as before.
+        candidates = list(User.objects.filter(Q(email=username) | Q(username=username)).order_by('pk'))
+        by_email = next((user for user in candidates if user.email == username), None)
+        by_username = next((user for user in candidates if user.username == username), None)
+
+        if by_email is None and by_username is None:
+            # Run the hasher anyway so response time doesn't reveal which logins exist
+            User().set_password(password)
+            return None
 
-        # If not found by email, try normal username authentication
-        user = User.objects.filter(username=username).first()
-        if user and user.check_password(password) and self.user_can_authenticate(user):
-            return user
+        for user in (by_email, by_username):
+            if user and user.check_password(password) and self.user_can_authenticate(user):
+                return user
+            if by_email is by_username:
+                break
 
         return None
 
     def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
\ No newline at end of file
+        user = user_cache.get(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
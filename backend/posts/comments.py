@@ -0,0 +1,100 @@
+# posts/comments.py
+"""
+Comment writes and page-level comment previews.
+
+``Post.comments_count`` is denormalized and changed with ``F()`` updates in
+the same transaction as the comment row, so it can't drift under concurrent
+writes; ``reconcile_comment_counts`` recounts it for rows loaded in bulk.
+``previews`` loads the latest ``COMMENT_PREVIEW_SIZE`` comments for a
+whole page of posts in one ``ROW_NUMBER()`` window query, walking the
+``(post, created_at)`` index.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from . import affinity, profile_cache, trending
+from .models import Comment, Post
+
+
+def preview_size():
+    return getattr(settings, 'COMMENT_PREVIEW_SIZE', 3)
+
+
+def add_comment(user, post, content):
+    with transaction.atomic():
+        comment = Comment.objects.create(user=user, post=post, content=content)
+        Post.objects.filter(pk=post.pk).update(comments_count=F('comments_count') + 1)
+        affinity.record_comment(user.id, post.user_id)
+        trending.record_comment(post.pk)
+    profile_cache.bump(post.user_id)
+    return comment
+
+
+def delete_comment(comment):
+    post_id, author_id = comment.post_id, comment.post.user_id
+    with transaction.atomic():
+        if not Comment.objects.filter(pk=comment.pk).delete()[0]:
+            return
+        Post.objects.filter(pk=post_id, comments_count__gt=0).update(comments_count=F('comments_count') - 1)
+        affinity.record_comment(comment.user_id, author_id, created=False)
+        trending.record_comment(post_id, created=False)
+    profile_cache.bump(author_id)
+
+
+def _latest(post_ids, size, model=Comment):
+    return (
+        model.objects.filter(post_id__in=post_ids)
+        .annotate(position=Window(
+            RowNumber(),
+            partition_by=[F('post_id')],
+            order_by=[F('created_at').desc(), F('id').desc()],
+        ))
+        .filter(position__lte=size)
+        .order_by('post_id', 'created_at', 'id')
+    )
+
+
+def previews(post_ids, size=None):
+    """Return ``{post_id: [Comment, ...]}`` with each post's latest comments, oldest first."""
+    size = preview_size() if size is None else size
+    if not post_ids or size <= 0:
+        return {}
+    grouped = {}
+    for comment in _latest(post_ids, size).select_related('user'):
+        grouped.setdefault(comment.post_id, []).append(comment)
+    return grouped
+
+
+def preview_rows(post_ids, size=None, model=Comment):
+    """Like ``previews``, with ``values()`` rows; ``model`` may be ``ArchivedComment``."""
+    size = preview_size() if size is None else size
+    if not post_ids or size <= 0:
+        return {}
+    grouped = {}
+    for row in _latest(post_ids, size, model).values('id', 'post_id', 'user_id', 'content', 'created_at'):
+        grouped.setdefault(row['post_id'], []).append(row)
+    return grouped
+
+
+def reconcile_comment_counts(batch_size=500):
+    """Recompute ``Post.comments_count`` from ``Comment`` rows in primary-key chunks."""
+    counts = (
+        Comment.objects.filter(post=OuterRef('pk'))
+        .order_by()
+        .values('post')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    reconciled = 0
+    last_id = 0
+    while True:
+        post_ids = list(
+            Post.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not post_ids:
+            return reconciled
+        Post.objects.filter(pk__in=post_ids).update(comments_count=Coalesce(Subquery(counts), 0))
+        reconciled += len(post_ids)
+        last_id = post_ids[-1]
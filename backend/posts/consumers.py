@@ -1,25 +1,162 @@
+import asyncio
 import json
+import time
+import weakref
+from collections import deque
+
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+
+class FeedMetrics:
+    """Process-wide counters for feed sockets."""
+
+    def __init__(self):
+        self.connections = 0
+        self.events_received = 0
+        self.events_sent = 0
+        self.frames_sent = 0
+        self.events_dropped = 0
+        self.slow_disconnects = 0
+        self.live = weakref.WeakSet()
+
+    def snapshot(self, top=10):
+        live = list(self.live)
+        busiest = sorted(live, key=lambda consumer: len(consumer.pending), reverse=True)[:top]
+        return {
+            "connections": len(live),
+            "connections_total": self.connections,
+            "events_received": self.events_received,
+            "events_sent": self.events_sent,
+            "frames_sent": self.frames_sent,
+            "events_dropped": self.events_dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "queued": sum(len(consumer.pending) for consumer in live),
+            "busiest": [consumer.stats() for consumer in busiest],
+        }
+
+
+feed_metrics = FeedMetrics()
+
 
 class FeedConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes new posts to a user's socket.
+
+    Events go through a bounded per-connection queue and are flushed at most
+    once per ``FEED_COALESCE_SECONDS`` as ``{"type": "batch", "seq": n,
+    "posts": [...]}`` frames. The client acknowledges them with ``{"type":
+    "ack", "seq": n}`` (cumulative). ASGI ``send`` doesn't push back, so a
+    client that stops reading would otherwise make the server buffer for it
+    without limit. Instead, nothing more is sent while ``FEED_MAX_UNACKED_FRAMES``
+    frames are unacknowledged, and events wait in the queue. When the queue is
+    full the ``FEED_SLOW_CONSUMER_POLICY`` applies: ``"drop_oldest"`` discards
+    the oldest queued post, ``"disconnect"`` closes the socket after sending a
+    ``{"type": "resync", "last_post_id": ...}`` frame so the client can refetch.
+    """
+    queue_size = getattr(settings, 'FEED_SEND_QUEUE_SIZE', 50)
+    coalesce_seconds = getattr(settings, 'FEED_COALESCE_SECONDS', 0.05)
+    max_batch = getattr(settings, 'FEED_MAX_BATCH', 20)
+    max_unacked = getattr(settings, 'FEED_MAX_UNACKED_FRAMES', 4)
+    slow_consumer_policy = getattr(settings, 'FEED_SLOW_CONSUMER_POLICY', 'drop_oldest')
+    close_code_slow = 4008
+
     async def connect(self):
         self.user = self.scope.get("user")
+        self.pending = deque()
+        self.sent_events = 0
+        self.sent_frames = 0
+        self.dropped = 0
+        self.last_post_id = None
+        self.seq = 0
+        self.acked = 0
+        self.connected_at = time.time()
+        self._wakeup = asyncio.Event()
+        self._sender = None
         if self.user and self.user.is_authenticated:
             self.room_group_name = f"user_{self.user.id}"
             await self.channel_layer.group_add(
                 self.room_group_name,
                 self.channel_name
             )
-        # Accept connection regardless
-        await self.accept()
+        # Accept connection regardless, echoing the auth subprotocol if one was used
+        await self.accept(subprotocol=self.scope.get("jwt_subprotocol"))
+        self._sender = asyncio.ensure_future(self._send_loop())
+        feed_metrics.connections += 1
+        feed_metrics.live.add(self)
 
     async def disconnect(self, close_code):
+        sender = getattr(self, "_sender", None)
+        if sender is not None:
+            sender.cancel()
+        feed_metrics.live.discard(self)
         if self.user and self.user.is_authenticated:
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
             )
 
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or "")
+            seq = int(message["seq"]) if message.get("type") == "ack" else None
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return
+        if seq is not None and self.acked < seq <= self.seq:
+            self.acked = seq
+            if self.pending:
+                self._wakeup.set()
+
     # Send personalized feed updates
     async def feed_update(self, event):
-        await self.send(text_data=json.dumps(event["content"]))
\ No newline at end of file
+        feed_metrics.events_received += 1
+        if len(self.pending) >= self.queue_size:
+            if self.slow_consumer_policy == 'disconnect':
+                await self._disconnect_slow()
+                return
+            self.pending.popleft()
+            self.dropped += 1
+            feed_metrics.events_dropped += 1
+        self.pending.append(event["content"])
+        self._wakeup.set()
+
+    async def _send_loop(self):
+        while True:
+            await self._wakeup.wait()
+            # Let a burst accumulate so it goes out as one frame
+            await asyncio.sleep(self.coalesce_seconds)
+            if self.seq - self.acked >= self.max_unacked:
+                # Hold events until the client catches up; an ack wakes us
+                self._wakeup.clear()
+                continue
+            batch = [self.pending.popleft() for _ in range(min(len(self.pending), self.max_batch))]
+            if not self.pending:
+                self._wakeup.clear()
+            if not batch:
+                continue
+            self.seq += 1
+            await self.send(text_data=json.dumps({"type": "batch", "seq": self.seq, "posts": batch}))
+            self.last_post_id = batch[-1].get("id")
+            self.sent_events += len(batch)
+            self.sent_frames += 1
+            feed_metrics.events_sent += len(batch)
+            feed_metrics.frames_sent += 1
+
+    async def _disconnect_slow(self):
+        feed_metrics.events_dropped += len(self.pending)
+        feed_metrics.slow_disconnects += 1
+        self.pending.clear()
+        await self.send(text_data=json.dumps({"type": "resync", "last_post_id": self.last_post_id}))
+        await self.close(code=self.close_code_slow)
+
+    def stats(self):
+        return {
+            "channel": self.channel_name,
+            "user_id": self.user.id if self.user and self.user.is_authenticated else None,
+            "queued": len(self.pending),
+            "unacked_frames": self.seq - self.acked,
+            "sent_events": self.sent_events,
+            "sent_frames": self.sent_frames,
+            "dropped": self.dropped,
+            "connected_seconds": round(time.time() - self.connected_at, 1),
+        }
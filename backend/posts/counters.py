@@ -0,0 +1,133 @@
+# posts/counters.py
+"""
+Sharded like counters.
+
+Like/unlike increments land on one of ``LIKE_COUNTER_SHARDS`` rows picked at
+random, so concurrent likes on a viral post don't queue behind a single row
+lock on ``Post``. The durable count is ``Post.likes_count`` plus the pending
+shard totals; ``flush_like_counters`` folds shards back into the post row and
+``reconcile_like_counts`` recomputes it from the ``Like`` table.
+
+The trending background thread (see posts/trending.py) calls
+``flush_like_counters`` every ``LIKE_COUNTER_FLUSH_SECONDS``, one process at a
+time. Each batch is written through the write queue, and the folded count is
+clamped at zero: an unlike whose like was already recounted by
+``reconcile_like_counts`` would otherwise push it negative.
+"""
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from . import writequeue
+from .models import Like, LikeCounterShard, Post
+
+
+FLUSH_LOCK_KEY = 'counters:flush'
+
+
+def shard_count():
+    return getattr(settings, 'LIKE_COUNTER_SHARDS', 8)
+
+
+def flush_seconds():
+    return getattr(settings, 'LIKE_COUNTER_FLUSH_SECONDS', 30)
+
+
+def increment_likes(post_id, delta):
+    shard = random.randrange(shard_count())
+    shards = LikeCounterShard.objects.filter(post_id=post_id, shard=shard)
+    if not shards.update(count=F('count') + delta):
+        LikeCounterShard.objects.bulk_create(
+            [LikeCounterShard(post_id=post_id, shard=shard)], ignore_conflicts=True
+        )
+        shards.update(count=F('count') + delta)
+
+
+def increment_likes_many(post_ids, delta):
+    """Apply ``delta`` to many posts with two set-based statements on one shard."""
+    if not post_ids:
+        return
+    shard = random.randrange(shard_count())
+    LikeCounterShard.objects.bulk_create(
+        [LikeCounterShard(post_id=post_id, shard=shard) for post_id in post_ids], ignore_conflicts=True
+    )
+    LikeCounterShard.objects.filter(post_id__in=post_ids, shard=shard).update(count=F('count') + delta)
+
+
+def pending_like_counts(post_ids):
+    """Return ``{post_id: delta}`` for shard increments not yet folded into ``Post``."""
+    return dict(
+        LikeCounterShard.objects.filter(post_id__in=post_ids)
+        .values('post_id')
+        .annotate(total=Sum('count'))
+        .values_list('post_id', 'total')
+    )
+
+
+def like_count(post):
+    return post.likes_count + pending_like_counts([post.id]).get(post.id, 0)
+
+
+def _fold(post_ids, recount=False):
+    with transaction.atomic():
+        shards = list(
+            LikeCounterShard.objects.select_for_update()
+            .filter(post_id__in=post_ids)
+            .values_list('id', 'post_id', 'count')
+        )
+        posts = Post.objects.filter(pk__in=post_ids)
+        if recount:
+            likes = (
+                Like.objects.filter(post=OuterRef('pk'))
+                .values('post')
+                .annotate(total=Count('id'))
+                .values('total')
+            )
+            posts.update(likes_count=Coalesce(Subquery(likes, output_field=IntegerField()), Value(0)))
+        else:
+            totals = {}
+            for _, post_id, count in shards:
+                totals[post_id] = totals.get(post_id, 0) + count
+            for post_id, total in totals.items():
+                if total:
+                    Post.objects.filter(pk=post_id).update(likes_count=Greatest(F('likes_count') + total, Value(0)))
+        LikeCounterShard.objects.filter(pk__in=[shard_id for shard_id, _, _ in shards]).delete()
+
+
+def flush_like_counters(batch_size=500):
+    """Fold pending shard totals into ``Post.likes_count``. Returns the number of posts flushed."""
+    flushed = 0
+    while True:
+        post_ids = list(
+            LikeCounterShard.objects.order_by('post_id')
+            .values_list('post_id', flat=True)
+            .distinct()[:batch_size]
+        )
+        if not post_ids:
+            return flushed
+        writequeue.run(_fold, post_ids)
+        flushed += len(post_ids)
+
+
+def flush_like_counters_for(post_ids):
+    """Fold pending shard totals for just ``post_ids`` into ``Post.likes_count``."""
+    if post_ids:
+        _fold(post_ids)
+
+
+def reconcile_like_counts(batch_size=500):
+    """Recompute ``Post.likes_count`` from ``Like`` rows in primary-key chunks."""
+    reconciled = 0
+    last_id = 0
+    while True:
+        post_ids = list(
+            Post.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not post_ids:
+            return reconciled
+        _fold(post_ids, recount=True)
+        reconciled += len(post_ids)
+        last_id = post_ids[-1]
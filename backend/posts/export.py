@@ -0,0 +1,372 @@
+# posts/export.py
+"""
+Streaming account export and batched import.
+
+An export is NDJSON, one JSON object per line:
+
+* ``account``: format version and the user, always the first line
+* ``post``: the user's posts, hot then archived
+* ``like`` / ``comment``: the user's likes and comments on any post
+* ``follow`` / ``follower``: who the user follows and who follows them
+
+Likes and comments name their post by author username and ``created_at``,
+not by ID. Imported posts keep their timestamps, so those references still
+resolve after an account moves between instances. Rows are read with
+``iterator(chunk_size=EXPORT_CHUNK_SIZE)`` and encoded one line at a time,
+then handed on in ~64 KB pieces, optionally gzip-compressed as they go. So
+memory stays flat however large the account is. ``streaming_content``
+adapts the generator for ``StreamingHttpResponse`` under ASGI, which would
+otherwise buffer a sync iterator in full.
+
+``import_lines`` reads the same format back in batches of ``bulk_create``.
+Posts and comments the account already has with the same ``created_at`` and
+text, and likes and follows that already exist, are skipped, so importing
+the same file twice changes nothing. References to posts or users that
+don't exist are counted as unresolved. Followers are other
+users' data and aren't imported. Imported likes count toward
+``likes_count``, but don't feed affinity or trending. Imported posts are
+backfilled into the account's own timeline and its followers' once the
+import finishes.
+"""
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, profile_cache, search, suggestions, timeline
+from .models import ArchivedComment, ArchivedLike, ArchivedPost, Comment, Follow, Like, Post
+
+FORMAT_VERSION = 1
+BUFFER_BYTES = 64 * 1024
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def _time(value):
+    return value.isoformat() if value is not None else None
+
+
+def _post_ref(post_id, author, created_at):
+    return {'id': post_id, 'author': author, 'created_at': _time(created_at)}
+
+
+def records(user):
+    """Yield the export records for ``user`` as dicts."""
+    size = chunk_size()
+    yield {
+        'type': 'account',
+        'version': FORMAT_VERSION,
+        'exported_at': _time(timezone.now()),
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'date_joined': _time(user.date_joined),
+        },
+    }
+
+    fields = ('id', 'text', 'image_url', 'created_at', 'updated_at', 'likes_count', 'comments_count')
+    for model, archived in ((Post, False), (ArchivedPost, True)):
+        rows = model.objects.filter(user=user).order_by('id').values_list(*fields).iterator(chunk_size=size)
+        for post_id, text, image_url, created_at, updated_at, likes_count, comments_count in rows:
+            yield {
+                'type': 'post',
+                'id': post_id,
+                'text': text,
+                'image_url': image_url,
+                'created_at': _time(created_at),
+                'updated_at': _time(updated_at),
+                'likes_count': likes_count,
+                'comments_count': comments_count,
+                'archived': archived,
+            }
+
+    for model in (Like, ArchivedLike):
+        rows = (
+            model.objects.filter(user=user).order_by('id')
+            .values_list('post_id', 'post__user__username', 'post__created_at', 'created_at')
+            .iterator(chunk_size=size)
+        )
+        for post_id, author, post_created_at, created_at in rows:
+            yield {'type': 'like', 'post': _post_ref(post_id, author, post_created_at), 'created_at': _time(created_at)}
+
+    for model in (Comment, ArchivedComment):
+        rows = (
+            model.objects.filter(user=user).order_by('id')
+            .values_list('id', 'post_id', 'post__user__username', 'post__created_at', 'content', 'created_at')
+            .iterator(chunk_size=size)
+        )
+        for comment_id, post_id, author, post_created_at, content, created_at in rows:
+            yield {
+                'type': 'comment',
+                'id': comment_id,
+                'post': _post_ref(post_id, author, post_created_at),
+                'content': content,
+                'created_at': _time(created_at),
+            }
+
+    for kind, mine, theirs in (('follow', 'follower', 'followee'), ('follower', 'followee', 'follower')):
+        rows = (
+            Follow.objects.filter(**{mine: user}).order_by('id')
+            .values_list(f'{theirs}_id', f'{theirs}__username', 'created_at')
+            .iterator(chunk_size=size)
+        )
+        for other_id, username, created_at in rows:
+            yield {'type': kind, 'user': {'id': other_id, 'username': username}, 'created_at': _time(created_at)}
+
+
+def stream(user, compress=False):
+    """Yield the NDJSON export for ``user`` as byte chunks of about ``BUFFER_BYTES``."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer, size = [], 0
+    for record in records(user):
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode()
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_BYTES:
+            chunk = b''.join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b''.join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def streaming_content(chunks, asgi=False):
+    """
+    ``chunks`` as ``StreamingHttpResponse`` content. Under ASGI the sync
+    generator is advanced one chunk at a time on the thread that owns the
+    database connection, instead of being consumed into a list first.
+    """
+    if not asgi:
+        return chunks
+
+    async def chunks_async():
+        done = object()
+        advance = sync_to_async(next, thread_sensitive=True)
+        while True:
+            chunk = await advance(chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+
+    return chunks_async()
+
+
+def _bulk_create(model, objs, fields=('created_at',)):
+    """
+    ``bulk_create`` that keeps the exported values of ``fields``.
+
+    ``auto_now``/``auto_now_add`` overwrite them on insert, so they're put
+    back with one ``bulk_update``. That needs the new primary keys; backends
+    that can't return them from a bulk insert create the rows one at a time.
+    """
+    exported = [{name: getattr(obj, name) for name in fields} for obj in objs]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        for obj, values in zip(objs, exported):
+            obj.save()
+            model.objects.filter(pk=obj.pk).update(**values)
+        return
+    model.objects.bulk_create(objs)
+    for obj, values in zip(objs, exported):
+        for name, value in values.items():
+            setattr(obj, name, value)
+    model.objects.bulk_update(objs, fields)
+
+
+class Importer:
+    """Batches records by type and writes each batch with ``bulk_create``."""
+    KINDS = ('post', 'like', 'comment', 'follow')
+
+    def __init__(self, user, exported_username, batch_size=1000):
+        self.user = user
+        self.exported_username = exported_username
+        self.batch_size = batch_size
+        self.kind = None
+        self.batch = []
+        self.counts = {'posts': 0, 'likes': 0, 'comments': 0, 'follows': 0, 'skipped': 0, 'unresolved': 0}
+
+    def add(self, record):
+        kind = record.get('type')
+        if kind not in self.KINDS:
+            self.counts['skipped'] += 1
+            return
+        # Records arrive grouped by type; posts must be written before the
+        # likes and comments that reference them
+        if kind != self.kind:
+            self.flush()
+            self.kind = kind
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            batch, self.batch = self.batch, []
+            with transaction.atomic():
+                getattr(self, f'_import_{self.kind}s')(batch)
+
+    def _resolve_posts(self, refs):
+        """``{(author, created_at): post_id}`` for the posts ``refs`` point at."""
+        keys = {(self._username(ref['author']), parse_datetime(ref['created_at'])) for ref in refs}
+        rows = Post.objects.filter(
+            user__username__in={author for author, _ in keys},
+            created_at__in={created_at for _, created_at in keys},
+        ).order_by('-id').values_list('id', 'user__username', 'created_at')
+        # Lowest ID wins if an author has two posts with the same timestamp
+        return {(author, created_at): post_id for post_id, author, created_at in rows}
+
+    def _username(self, username):
+        return self.user.username if username == self.exported_username else username
+
+    def _post_ids(self, records):
+        found = self._resolve_posts([record['post'] for record in records])
+        post_ids = []
+        for record in records:
+            ref = record['post']
+            post_id = found.get((self._username(ref['author']), parse_datetime(ref['created_at'])))
+            if post_id is None:
+                self.counts['unresolved'] += 1
+            post_ids.append(post_id)
+        return post_ids
+
+    def _import_posts(self, records):
+        wanted = {}
+        for record in records:
+            wanted.setdefault((parse_datetime(record['created_at']), record['text']), record)
+        existing = set()
+        for model in (Post, ArchivedPost):
+            existing.update(
+                model.objects.filter(user=self.user, created_at__in={created_at for created_at, _ in wanted})
+                .values_list('created_at', 'text')
+            )
+        posts = [
+            Post(
+                user=self.user,
+                text=text,
+                image_url=record['image_url'],
+                created_at=created_at,
+                updated_at=parse_datetime(record['updated_at']),
+            )
+            for (created_at, text), record in wanted.items()
+            if (created_at, text) not in existing
+        ]
+        _bulk_create(Post, posts, ('created_at', 'updated_at'))
+        search.get_search_backend().index([(post.pk, post.text) for post in posts])
+        self.counts['posts'] += len(posts)
+
+    def _import_likes(self, records):
+        likes = {}
+        for record, post_id in zip(records, self._post_ids(records)):
+            if post_id is not None:
+                likes.setdefault(post_id, parse_datetime(record['created_at']))
+        existing = set(
+            Like.objects.filter(user=self.user, post_id__in=likes).values_list('post_id', flat=True)
+        )
+        new = {post_id: created_at for post_id, created_at in likes.items() if post_id not in existing}
+        _bulk_create(
+            Like, [Like(user=self.user, post_id=post_id, created_at=created_at) for post_id, created_at in new.items()]
+        )
+        counters.increment_likes_many(list(new), 1)
+        self.counts['likes'] += len(new)
+
+    def _import_comments(self, records):
+        wanted = {}
+        for record, post_id in zip(records, self._post_ids(records)):
+            if post_id is not None:
+                wanted.setdefault((post_id, parse_datetime(record['created_at']), record['content']), record)
+        existing = set(
+            Comment.objects.filter(user=self.user, post_id__in={post_id for post_id, _, _ in wanted})
+            .values_list('post_id', 'created_at', 'content')
+        )
+        comments = [
+            Comment(user=self.user, post_id=post_id, content=content, created_at=created_at)
+            for post_id, created_at, content in wanted
+            if (post_id, created_at, content) not in existing
+        ]
+        _bulk_create(Comment, comments)
+        per_post = {}
+        for comment in comments:
+            per_post[comment.post_id] = per_post.get(comment.post_id, 0) + 1
+        by_count = {}
+        for post_id, count in per_post.items():
+            by_count.setdefault(count, []).append(post_id)
+        for count, post_ids in by_count.items():
+            Post.objects.filter(pk__in=post_ids).update(comments_count=F('comments_count') + count)
+        self.counts['comments'] += len(comments)
+
+    def _import_follows(self, records):
+        wanted = {record['user']['username']: parse_datetime(record['created_at']) for record in records}
+        users = dict(User.objects.filter(username__in=wanted).values_list('username', 'id'))
+        self.counts['unresolved'] += len(set(wanted) - set(users))
+        existing = set(
+            Follow.objects.filter(follower=self.user, followee_id__in=users.values()).values_list('followee_id', flat=True)
+        )
+        new = {
+            user_id: wanted[username] for username, user_id in users.items()
+            if user_id not in existing and user_id != self.user.id
+        }
+        _bulk_create(
+            Follow,
+            [Follow(follower=self.user, followee_id=user_id, created_at=created_at) for user_id, created_at in new.items()],
+        )
+        if new:
+            timeline.on_follow_many(self.user.id, list(new))
+            suggestions.on_follow_many(self.user.id, list(new))
+        self.counts['follows'] += len(new)
+
+
+def import_lines(lines, username=None, batch_size=1000):
+    """
+    Import an export (an iterable of NDJSON lines, bytes or str) into the
+    account ``username``, by default the exported username. The account is
+    created, without a usable password, if it doesn't exist. Returns
+    ``(user, counts)``.
+    """
+    lines = (line for line in lines if line.strip())
+    try:
+        header = json.loads(next(lines))
+    except (StopIteration, ValueError):
+        raise InvalidExport("Not an export: the first line must be the account record")
+    if header.get('type') != 'account' or header.get('version') != FORMAT_VERSION:
+        raise InvalidExport(f"Unsupported export: expected an account record of version {FORMAT_VERSION}")
+
+    exported = header['user']
+    username = username or exported['username']
+    user = User.objects.filter(username=username).first()
+    if user is None:
+        user = User(username=username, email=exported.get('email') or '')
+        if exported.get('date_joined'):
+            user.date_joined = parse_datetime(exported['date_joined'])
+        user.set_unusable_password()
+        user.save()
+
+    importer = Importer(user, exported['username'], batch_size)
+    for number, line in enumerate(lines, start=2):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise InvalidExport(f"Line {number} is not valid JSON")
+        importer.add(record)
+    importer.flush()
+    if importer.counts['posts']:
+        timeline.backfill_author(user.id)
+    profile_cache.bump(user.id)
+    return user, importer.counts
@@ -0,0 +1,225 @@
+# posts/fanout.py
+"""
+Background fan-out of new posts.
+
+``PostViewSet.perform_create`` serializes the post once and hands it to the
+dispatcher. A small pool of worker threads then loads the author's
+followers, pushes the post into their materialized timelines and sends the
+WebSocket ``feed_update`` messages in batches, so the POST returns in the
+same time whether the author has ten followers or fifty thousand.
+
+The queue lives in memory, so each post also gets a ``PendingFanout`` row in
+its own transaction, deleted once its timelines are written. A sweeper
+thread resubmits rows older than ``FANOUT_RESUME_SECONDS``: posts a crashed
+or redeployed process never dispatched, and dispatches that failed. Resumed
+posts only get their timeline inserts, which are idempotent; the WebSocket
+pushes are best-effort and not repeated.
+
+Timeline inserts and ``PendingFanout`` claims and deletes go through the
+write queue (see posts/writequeue.py) like request writes, so the workers
+don't contend with them for the SQLite write lock.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from . import timeline, writequeue
+from .models import Follow, PendingFanout, Post
+
+logger = logging.getLogger(__name__)
+
+
+def resume_seconds():
+    return getattr(settings, 'FANOUT_RESUME_SECONDS', 60)
+
+
+def enqueue(post, payload):
+    """Record the post's fan-out in the current transaction and dispatch it once that commits."""
+    PendingFanout.objects.create(post=post)
+    transaction.on_commit(lambda: get_dispatcher().submit(post, payload))
+
+
+class FanoutDispatcher:
+    def __init__(self, workers=2, batch_size=500, max_queue=10000):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'resumed': 0,
+            'dispatched': 0,
+            'failed': 0,
+            'messages_sent': 0,
+            'queue_full': 0,
+            'dispatch_seconds_total': 0.0,
+            'dispatch_seconds_max': 0.0,
+            'queue_wait_seconds_total': 0.0,
+            'queue_wait_seconds_max': 0.0,
+        }
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'fanout-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            sweeper = threading.Thread(target=self._sweep, name='fanout-sweeper', daemon=True)
+            sweeper.start()
+            self._threads.append(sweeper)
+
+    def submit(self, post, payload):
+        """
+        Queue a post for fan-out. Blocks only when the queue is full, which
+        pushes back on writers instead of dropping timeline updates.
+        """
+        self.start()
+        job = (post, payload, time.monotonic())
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._record(queue_full=1)
+            self._queue.put(job)
+        self._record(submitted=1)
+
+    def join(self):
+        """Wait until every queued post has been dispatched."""
+        self._queue.join()
+
+    def resume(self, older_than=None):
+        """
+        Resubmit posts whose fan-out has been pending longer than
+        ``older_than`` seconds (default ``FANOUT_RESUME_SECONDS``). Returns
+        how many were resubmitted.
+        """
+        older_than = resume_seconds() if older_than is None else older_than
+        cutoff = timezone.now() - timedelta(seconds=older_than)
+        stale = list(
+            PendingFanout.objects.filter(queued_at__lte=cutoff).order_by('queued_at')
+            .values_list('post_id', flat=True)[:self.max_queue // 2]
+        )
+        # Claim each row by moving its timestamp, so processes sweeping at
+        # the same time don't all resubmit it
+        claimed = writequeue.run(self._claim, stale, cutoff)
+        posts = Post.objects.in_bulk(claimed)
+        for post_id in claimed:
+            if post_id in posts:
+                self.submit(posts[post_id], None)
+        self._record(resumed=len(posts))
+        return len(posts)
+
+    @staticmethod
+    def _claim(post_ids, cutoff):
+        return [
+            post_id for post_id in post_ids
+            if PendingFanout.objects.filter(post_id=post_id, queued_at__lte=cutoff).update(queued_at=timezone.now())
+        ]
+
+    def _sweep(self):
+        while True:
+            try:
+                close_old_connections()
+                resumed = self.resume()
+                if resumed:
+                    logger.warning("Resumed fan-out for %d posts", resumed)
+            except DatabaseError:
+                logger.exception("Fan-out sweep failed")
+            finally:
+                close_old_connections()
+            time.sleep(resume_seconds())
+
+    def _run(self):
+        while True:
+            post, payload, enqueued_at = self._queue.get()
+            started = time.monotonic()
+            try:
+                close_old_connections()
+                sent = self.dispatch(post, payload)
+                writequeue.run(PendingFanout.objects.filter(post_id=post.id).delete)
+            except Exception:
+                logger.exception("Fan-out failed for post %s", post.id)
+                self._record(failed=1)
+            else:
+                self._record(dispatched=1, messages_sent=sent)
+            finally:
+                close_old_connections()
+                finished = time.monotonic()
+                self._record_timing(started - enqueued_at, finished - started)
+                self._queue.task_done()
+
+    def dispatch(self, post, payload):
+        """Fan one post out to its followers. Returns the number of WebSocket messages sent."""
+        follower_ids = Follow.objects.filter(followee_id=post.user_id).values_list('follower_id', flat=True)
+        writequeue.run(timeline.fan_out_post, post, follower_ids)
+
+        channel_layer = get_channel_layer()
+        if channel_layer is None or payload is None:
+            return 0
+        message = {"type": "feed_update", "content": payload}
+        sent = 0
+        groups = []
+        for follower_id in follower_ids.iterator(chunk_size=self.batch_size):
+            groups.append(f"user_{follower_id}")
+            if len(groups) >= self.batch_size:
+                async_to_sync(self._send_batch)(channel_layer, groups, message)
+                sent += len(groups)
+                groups = []
+        if groups:
+            async_to_sync(self._send_batch)(channel_layer, groups, message)
+            sent += len(groups)
+        return sent
+
+    @staticmethod
+    async def _send_batch(channel_layer, groups, message):
+        await asyncio.gather(*(channel_layer.group_send(group, message) for group in groups))
+
+    def _record(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _record_timing(self, waited, took):
+        with self._stats_lock:
+            self._stats['queue_wait_seconds_total'] += waited
+            self._stats['queue_wait_seconds_max'] = max(self._stats['queue_wait_seconds_max'], waited)
+            self._stats['dispatch_seconds_total'] += took
+            self._stats['dispatch_seconds_max'] = max(self._stats['dispatch_seconds_max'], took)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        finished = stats['dispatched'] + stats['failed']
+        stats['dispatch_seconds_avg'] = stats['dispatch_seconds_total'] / finished if finished else 0.0
+        stats['queue_wait_seconds_avg'] = stats['queue_wait_seconds_total'] / finished if finished else 0.0
+        return stats
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = FanoutDispatcher(
+                workers=getattr(settings, 'FANOUT_WORKERS', 2),
+                batch_size=getattr(settings, 'FANOUT_BATCH_SIZE', 500),
+                max_queue=getattr(settings, 'FANOUT_QUEUE_SIZE', 10000),
+            )
+        return _dispatcher
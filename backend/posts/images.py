@@ -0,0 +1,180 @@
+# posts/images.py
+"""
+Upload pipeline for post images.
+
+Uploads are streamed to a temporary file in chunks while being hashed, then
+stored under their SHA-256 digest, so identical images are kept once no
+matter how often they're uploaded. Resized WebP variants (``IMAGE_VARIANTS``)
+are rendered on a process pool and written to the same storage. The ones in
+``IMAGE_SYNC_VARIANTS`` are waited for, so their URLs work as soon as the
+upload returns; the rest are stored in the background. Without Pillow no
+variants are made and only the original is returned. Everything goes through
+``default_storage``, so local files and the S3/MinIO settings behave the same.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+try:
+    import PIL
+except ImportError:  # pragma: no cover - exercised when Pillow isn't installed
+    PIL = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+DEFAULT_VARIANTS = {
+    'thumb': 160,
+    'feed': 720,
+    'full': 1600,
+}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def variants():
+    return getattr(settings, 'IMAGE_VARIANTS', DEFAULT_VARIANTS) if PIL is not None else {}
+
+
+def sync_variants():
+    return getattr(settings, 'IMAGE_SYNC_VARIANTS', ('feed',))
+
+
+def sniff_type(head):
+    """Return the file extension for known image signatures, ignoring what the client claims."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return '.gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+def _render_variants(path, sizes):
+    """Runs in a worker process: return ``{name: webp_bytes}`` for each max edge size."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return {}
+
+    rendered = {}
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        for name, size in sizes.items():
+            variant = image.copy()
+            variant.thumbnail((size, size))
+            buffer = io.BytesIO()
+            variant.save(buffer, format='WEBP', quality=80, method=4)
+            rendered[name] = buffer.getvalue()
+    return rendered
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=getattr(settings, 'IMAGE_WORKERS', 2))
+        return _pool
+
+
+def _prefix(digest):
+    return f"user_uploads/{digest[:2]}/{digest}"
+
+
+def variant_name(digest, name):
+    return f"{_prefix(digest)}/{name}.webp"
+
+
+def _save_variants(digest, rendered):
+    for name, data in rendered.items():
+        key = variant_name(digest, name)
+        if not default_storage.exists(key):
+            default_storage.save(key, ContentFile(data))
+
+
+def _store_variants(digest, temp_path, future):
+    try:
+        _save_variants(digest, future.result())
+    except Exception:
+        logger.exception("Rendering variants failed for upload %s", digest)
+    finally:
+        os.unlink(temp_path)
+
+
+def process_upload(upload):
+    """
+    Store an uploaded image and render its variants.
+
+    Returns a dict with the content hash, the original's URL, the variant
+    URLs and whether every variant exists yet. The ``IMAGE_SYNC_VARIANTS``
+    in ``variants`` always exist; if they can't be rendered, ``variants`` is
+    empty and clients should use ``public_url``.
+    """
+    hasher = hashlib.sha256()
+    head = b''
+    with tempfile.NamedTemporaryFile(delete=False, prefix='upload-') as temp:
+        for chunk in upload.chunks(CHUNK_SIZE):
+            if len(head) < 16:
+                head += chunk[:16 - len(head)]
+            hasher.update(chunk)
+            temp.write(chunk)
+    temp_path = temp.name
+
+    # The background render deletes the temp file once it's handed off
+    handed_off = False
+    try:
+        ext = sniff_type(head)
+        if ext is None:
+            raise InvalidImage('Invalid file type')
+
+        digest = hasher.hexdigest()
+        original = f"{_prefix(digest)}/original{ext}"
+        if not default_storage.exists(original):
+            with open(temp_path, 'rb') as source:
+                original = default_storage.save(original, File(source))
+
+        sizes = variants()
+        missing = {name: size for name, size in sizes.items() if not default_storage.exists(variant_name(digest, name))}
+        now = {name: size for name, size in missing.items() if name in sync_variants()}
+        later = {name: size for name, size in missing.items() if name not in now}
+        if now:
+            try:
+                _save_variants(digest, get_pool().submit(_render_variants, temp_path, now).result())
+            except Exception:
+                logger.exception("Rendering variants failed for upload %s", digest)
+                sizes = later = {}
+        if later:
+            future = get_pool().submit(_render_variants, temp_path, later)
+            handed_off = True
+            future.add_done_callback(lambda done: _store_variants(digest, temp_path, done))
+    finally:
+        if not handed_off:
+            os.unlink(temp_path)
+
+    return {
+        'hash': digest,
+        'public_url': default_storage.url(original),
+        'variants': {name: default_storage.url(variant_name(digest, name)) for name in sizes},
+        'variants_ready': not later,
+    }
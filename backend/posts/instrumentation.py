@@ -0,0 +1,291 @@
+# posts/instrumentation.py
+"""
+Per-request SQL and timing instrumentation.
+
+``RequestMetricsMiddleware`` wraps every database connection with an execute
+wrapper while a request runs. It counts queries and their total time, times
+the view and the response rendering, and reports them as a ``Server-Timing``
+header. It also folds them into per-endpoint histograms, which
+``MetricsView`` exposes. Queries are normalized to a shape: literals and
+``IN`` lists are collapsed. The same shape running ``N_PLUS_ONE_THRESHOLD``
+times in one request is logged as a likely N+1 and kept in the registry.
+"""
+import contextvars
+import functools
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+_IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+def n_plus_one_threshold():
+    return getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+
+
+def query_shape(sql):
+    """Normalize SQL so queries differing only in parameters compare equal."""
+    sql = _IN_LIST.sub("(...)", sql)
+    sql = _STRING.sub("?", sql)
+    return _NUMBER.sub("?", sql)
+
+
+class RequestMetrics:
+    """What one request spent on the database, the view and rendering."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.shapes = Counter()
+        self.spans = {}
+        self._open = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    @contextmanager
+    def span(self, name):
+        # Only the outermost span of a name counts, so a list serializer
+        # timing its children doesn't count them twice.
+        self._open[name] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._open[name] -= 1
+            if not self._open[name]:
+                self.add(name, time.perf_counter() - started)
+
+    def repeated_shapes(self, threshold=None):
+        threshold = n_plus_one_threshold() if threshold is None else threshold
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    @contextmanager
+    def record(self, using=None):
+        """Count queries on ``using`` (default: every configured connection) inside the block."""
+        aliases = [using] if using else list(connections)
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+
+def current():
+    """The metrics of the request being handled on this thread/task, if any."""
+    return _current.get()
+
+
+def timed(name):
+    """Decorator adding a function's run time to the current request's ``name`` span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = _current.get()
+            if metrics is None:
+                return func(*args, **kwargs)
+            with metrics.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the ``fraction`` quantile."""
+        count = sum(self.counts)
+        if not count:
+            return 0
+        rank = fraction * count
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            seen += bucket
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        count = sum(self.counts)
+        return {
+            'count': count,
+            'sum': round(self.total, 3),
+            'mean': round(self.total / count, 3) if count else 0,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(bound) for bound in self.bounds] + ['+Inf'], self.counts)),
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.db_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.serialize_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+
+    def snapshot(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_ms': self.latency_ms.snapshot(),
+            'db_ms': self.db_ms.snapshot(),
+            'serialize_ms': self.serialize_ms.snapshot(),
+            'queries': self.queries.snapshot(),
+        }
+
+
+class MetricsRegistry:
+    """Process-wide per-endpoint histograms and recent N+1 reports."""
+
+    def __init__(self, recent=50):
+        self._endpoints = {}
+        self._n_plus_one = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, status_code, total_seconds, metrics):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.requests += 1
+            if status_code >= 500:
+                stats.errors += 1
+            stats.latency_ms.observe(total_seconds * 1000)
+            stats.db_ms.observe(metrics.db_seconds * 1000)
+            stats.serialize_ms.observe(metrics.spans.get('serialize', 0.0) * 1000)
+            stats.queries.observe(metrics.queries)
+
+    def report_n_plus_one(self, endpoint, repeated):
+        with self._lock:
+            self._n_plus_one.append({
+                'endpoint': endpoint,
+                'at': time.time(),
+                'queries': [{'sql': shape, 'count': count} for shape, count in repeated],
+            })
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'endpoints': {name: stats.snapshot() for name, stats in sorted(self._endpoints.items())},
+                'n_plus_one': list(self._n_plus_one),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._n_plus_one.clear()
+
+
+registry = MetricsRegistry()
+
+
+def _endpoint(request):
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else 'unresolved'
+    return f"{request.method} /{route}"
+
+
+class RequestMetricsMiddleware:
+    """
+    Put this last in ``MIDDLEWARE`` so the view and render timings don't
+    include other middleware.
+
+    ``Server-Timing`` reports ``db`` (query time and count), ``view`` (the
+    view itself, including its queries), ``serialize`` (serializer and
+    renderer time) and ``total``. Turn the header off with
+    ``SERVER_TIMING_HEADER = False``; the histograms are kept either way.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.header = getattr(settings, 'SERVER_TIMING_HEADER', True)
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        request._metrics = metrics
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with metrics.record():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        finished = time.perf_counter()
+
+        view_started = getattr(request, '_metrics_view_started', None)
+        view_finished = getattr(request, '_metrics_view_finished', None)
+        if view_started is not None:
+            # Rendering happens between process_template_response and here.
+            metrics.add('view', (view_finished or finished) - view_started)
+            if view_finished is not None:
+                metrics.add('serialize', finished - view_finished)
+
+        total = finished - started
+        endpoint = _endpoint(request)
+        registry.observe(endpoint, response.status_code, total, metrics)
+
+        repeated = metrics.repeated_shapes()
+        if repeated:
+            registry.report_n_plus_one(endpoint, repeated)
+            logger.warning(
+                "Possible N+1 on %s: %s", endpoint,
+                "; ".join(f"{count}x {shape}" for shape, count in repeated),
+            )
+
+        if self.header:
+            response['Server-Timing'] = server_timing(metrics, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._metrics_view_finished = time.perf_counter()
+        return response
+
+
+def server_timing(metrics, total):
+    entries = [f'db;dur={metrics.db_seconds * 1000:.2f};desc="{metrics.queries} queries"']
+    for name in ('view', 'serialize'):
+        if name in metrics.spans:
+            entries.append(f'{name};dur={metrics.spans[name] * 1000:.2f}')
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
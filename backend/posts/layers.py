@@ -0,0 +1,360 @@
+# posts/layers.py
+"""
+A channel layer that works across processes on one host.
+
+Each process that uses the layer owns a Unix-domain socket in a shared
+directory and names its channels after it (``specific.<process>!<id>``), so a
+sender always knows which socket a channel lives behind. Group membership is
+kept in a small SQLite registry in the same directory. ``group_send``
+serializes the message once and writes a single frame per destination
+process, listing every local channel that should receive it.
+
+Registry queries run in worker threads, never on the caller's event loop.
+Frames are written from one long-lived sender loop per process, so each peer
+gets a single connection however many short-lived loops (``async_to_sync``)
+send through the layer. A peer whose socket refuses connections is treated as
+dead: its memberships and socket file are removed.
+
+No outside service is needed: the HTTP process (``runserver``) and the Daphne
+process that holds the WebSockets only have to agree on ``path``.
+
+Usage in settings::
+
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "posts.layers.UnixSocketChannelLayer",
+            "CONFIG": {"path": "/tmp/microblog-channels"},
+        },
+    }
+"""
+import asyncio
+import base64
+import json
+import os
+import random
+import sqlite3
+import string
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+FRAME_HEADER = struct.Struct('!I')
+
+
+def _encode_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _decode_hook(value):
+    if len(value) == 1 and '__bytes__' in value:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+
+def encode_frame(channels, message):
+    payload = json.dumps({'c': channels, 'm': message}, default=_encode_default, separators=(',', ':'))
+    payload = payload.encode('utf-8')
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def decode_frame(payload):
+    data = json.loads(payload, object_hook=_decode_hook)
+    return data['c'], data['m']
+
+
+class GroupRegistry:
+    """Group memberships shared by every process using the same directory."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), timeout=5, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS memberships ('
+                ' grp TEXT NOT NULL, channel TEXT NOT NULL, process TEXT NOT NULL, expires REAL NOT NULL,'
+                ' PRIMARY KEY (grp, channel))'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS memberships_process ON memberships (process)')
+
+    def add(self, group, channel, process, expires):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO memberships (grp, channel, process, expires) VALUES (?, ?, ?, ?)',
+                (group, channel, process, expires),
+            )
+
+    def discard(self, group, channel):
+        with self._lock:
+            self._conn.execute('DELETE FROM memberships WHERE grp = ? AND channel = ?', (group, channel))
+
+    def members(self, group, now):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT channel, process FROM memberships WHERE grp = ? AND expires > ?', (group, now)
+            ).fetchall()
+
+    def remove_process(self, process):
+        with self._lock:
+            self._conn.execute('DELETE FROM memberships WHERE process = ?', (process,))
+
+    def flush(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM memberships')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    extensions = ["groups", "flush"]
+
+    def __init__(
+        self,
+        path=None,
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        prefix="specific",
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.group_expiry = group_expiry
+        self.path = Path(path or Path(tempfile.gettempdir()) / 'microblog-channels')
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.process_name = '%d-%s' % (
+            os.getpid(),
+            ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(8)),
+        )
+        self.prefix = prefix
+        self.client_prefix = f"{prefix}.{self.process_name}"
+        self.socket_path = self.path / f"{self.process_name}.sock"
+        self.registry = GroupRegistry(self.path / 'groups.sqlite3')
+        # channel name -> asyncio.Queue of (expires_at, message)
+        self._queues = {}
+        # channel name -> time of its last receive() call, or None while one is waiting
+        self._last_receive = {}
+        self._server = None
+        self._server_loop = None
+        self._server_lock = None
+        # Owned by the sender loop: process -> StreamWriter
+        self._writers = {}
+        self._sender_loop = None
+        self._sender_lock = threading.Lock()
+
+    # Naming
+
+    def _process_of(self, channel):
+        head, bang, _ = channel.partition('!')
+        if not bang or not head.startswith(self.prefix + '.'):
+            raise ValueError(f"Channel {channel!r} was not created by this channel layer")
+        return head[len(self.prefix) + 1:]
+
+    def _socket_of(self, process):
+        return self.path / f"{process}.sock"
+
+    # Server side
+
+    async def _ensure_server(self):
+        if self._server is not None:
+            return
+        if self._server_lock is None:
+            self._server_lock = asyncio.Lock()
+        async with self._server_lock:
+            if self._server is None:
+                self._server_loop = asyncio.get_running_loop()
+                self._server = await asyncio.start_unix_server(self._handle_peer, path=str(self.socket_path))
+
+    async def _handle_peer(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                (length,) = FRAME_HEADER.unpack(header)
+                channels, message = decode_frame(await reader.readexactly(length))
+                for channel in channels:
+                    self._deliver_local(channel, message, strict=False)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _deliver_local(self, channel, message, strict=True):
+        queue = self._queues.get(channel)
+        if queue is None:
+            if not strict:
+                # The channel is gone; remote senders can't be told, so drop.
+                return
+            queue = self._queues[channel] = asyncio.Queue()
+        if queue.qsize() >= self.get_capacity(channel):
+            if strict:
+                raise ChannelFull(channel)
+            return
+        item = (time.time() + self.expiry, message)
+        loop = self._server_loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if loop is not None and running is not loop:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        else:
+            queue.put_nowait(item)
+
+    # Client side
+
+    def _sender(self):
+        with self._sender_lock:
+            if self._sender_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=self._run_sender, args=(loop,), name='channel-layer-sender', daemon=True).start()
+                self._sender_loop = loop
+            return self._sender_loop
+
+    @staticmethod
+    def _run_sender(loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _send_frame(self, process, frame):
+        future = asyncio.run_coroutine_threadsafe(self._write_frame(process, frame), self._sender())
+        return await asyncio.wrap_future(future)
+
+    async def _write_frame(self, process, frame):
+        """Runs on the sender loop, which owns ``self._writers``."""
+        for attempt in range(2):
+            writer = self._writers.get(process)
+            try:
+                if writer is None:
+                    _, writer = await asyncio.open_unix_connection(str(self._socket_of(process)))
+                    self._writers[process] = writer
+                writer.write(frame)
+                await writer.drain()
+                return True
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The owning process has exited; forget its memberships.
+                self._drop_writer(process)
+                await asyncio.to_thread(self._forget_process, process)
+                return False
+            except ConnectionError:
+                # Possibly a stale connection to a live peer; reconnect once
+                self._drop_writer(process)
+        return False
+
+    def _drop_writer(self, process):
+        writer = self._writers.pop(process, None)
+        if writer is not None:
+            writer.close()
+
+    def _forget_process(self, process):
+        self.registry.remove_process(process)
+        try:
+            self._socket_of(process).unlink()
+        except FileNotFoundError:
+            pass
+
+    async def _close_writers(self):
+        for process in list(self._writers):
+            self._drop_writer(process)
+
+    async def _dispatch(self, process, channels, message):
+        if process == self.process_name:
+            for channel in channels:
+                self._deliver_local(channel, message, strict=False)
+        else:
+            await self._send_frame(process, encode_frame(channels, message))
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+        process = self._process_of(channel)
+        if process == self.process_name:
+            self._deliver_local(channel, message)
+        else:
+            await self._send_frame(process, encode_frame([channel], message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        await self._ensure_server()
+        queue = self._queues.setdefault(channel, asyncio.Queue())
+        self._last_receive[channel] = None
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires >= time.time():
+                    return message
+        finally:
+            self._last_receive[channel] = time.time()
+
+    async def new_channel(self, prefix="specific"):
+        await self._ensure_server()
+        self._prune_channels()
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        channel = f"{self.client_prefix}!{suffix}"
+        self._queues[channel] = asyncio.Queue()
+        self._last_receive[channel] = time.time()
+        return channel
+
+    def _prune_channels(self):
+        """Forget local channels nobody has received on for longer than ``expiry``."""
+        cutoff = time.time() - self.expiry
+        for channel, last in list(self._last_receive.items()):
+            if last is not None and last < cutoff:
+                queue = self._queues.get(channel)
+                if queue is None or queue.empty():
+                    self._queues.pop(channel, None)
+                    del self._last_receive[channel]
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await asyncio.to_thread(
+            self.registry.add, group, channel, self._process_of(channel), time.time() + self.group_expiry
+        )
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await asyncio.to_thread(self.registry.discard, group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        by_process = {}
+        for channel, process in await asyncio.to_thread(self.registry.members, group, time.time()):
+            by_process.setdefault(process, []).append(channel)
+        if by_process:
+            await asyncio.gather(
+                *(self._dispatch(process, channels, message) for process, channels in by_process.items())
+            )
+
+    async def flush(self):
+        await asyncio.to_thread(self.registry.flush)
+        self._queues = {}
+        self._last_receive = {}
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        with self._sender_lock:
+            loop, self._sender_loop = self._sender_loop, None
+        if loop is not None:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._close_writers(), loop))
+            loop.call_soon_threadsafe(loop.stop)
+        await asyncio.to_thread(self._forget_process, self.process_name)
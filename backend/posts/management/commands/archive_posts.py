@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = "Move old posts, with their likes and comments, from the hot tables into the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=None,
+            help="Defaults to ARCHIVE_AFTER_DAYS; lower that setting too rather than going below it.",
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help="Posts moved per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between chunks.")
+        parser.add_argument('--max-chunks', type=int, default=None)
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        archived = archive.archive_posts(
+            older_than=timedelta(days=days) if days is not None else None,
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+            max_chunks=options['max_chunks'],
+            progress=lambda total: self.stdout.write(f"Archived {total} posts"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Done: {archived} posts archived"))
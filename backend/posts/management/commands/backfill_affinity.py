@@ -0,0 +1,86 @@
+import math
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import affinity
+from posts.models import Affinity, Comment, Like
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Affinity table from existing Likes and Comments, in chunks of users."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--prune-only', action='store_true',
+            help="Only delete edges that have decayed below the minimum weight (rebuilds drop them anyway).",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        now = timezone.now()
+        if options['prune_only']:
+            pruned = affinity.prune(now)
+            self.stdout.write(self.style.SUCCESS(f"Done: pruned {pruned} decayed affinity edges"))
+            return
+
+        half_life = affinity.half_life_seconds()
+        keep = affinity.top_k()
+
+        last_id = 0
+        users_done = 0
+        edges_written = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+
+            # (user_id, author_id) -> weight decayed to now
+            weights = defaultdict(float)
+            latest = {}
+            sources = (
+                (Like.objects.filter(user_id__in=user_ids), affinity.LIKE_WEIGHT),
+                (Comment.objects.filter(user_id__in=user_ids), affinity.COMMENT_WEIGHT),
+            )
+            for queryset, weight in sources:
+                rows = queryset.values_list('user_id', 'post__user_id', 'created_at').iterator(chunk_size=5000)
+                for user_id, author_id, created_at in rows:
+                    if user_id != author_id:
+                        age = (now - created_at).total_seconds()
+                        weights[user_id, author_id] += weight * 2 ** (-age / half_life)
+                        latest[user_id, author_id] = max(latest.get((user_id, author_id), created_at), created_at)
+
+            by_user = defaultdict(list)
+            for (user_id, author_id), weight in weights.items():
+                if weight >= affinity.MIN_WEIGHT:
+                    by_user[user_id].append((weight, author_id))
+
+            rows = []
+            for user_id, edges in by_user.items():
+                edges.sort(reverse=True)
+                for weight, author_id in edges[:keep]:
+                    rows.append(Affinity(
+                        user_id=user_id,
+                        author_id=author_id,
+                        score=math.log2(weight) + now.timestamp() / half_life,
+                        last_interaction_at=latest[user_id, author_id],
+                    ))
+
+            with transaction.atomic():
+                Affinity.objects.filter(user_id__in=user_ids).delete()
+                Affinity.objects.bulk_create(rows, batch_size=1000)
+
+            users_done += len(user_ids)
+            edges_written += len(rows)
+            last_id = user_ids[-1]
+            self.stdout.write(f"Processed {users_done} users")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {edges_written} affinity edges for {users_done} users"))
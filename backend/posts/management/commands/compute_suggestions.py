@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's \"who to follow\" suggestions from the follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-user', type=int, default=None, help="Defaults to FOLLOW_SUGGESTIONS['per_user'].")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Users written per transaction.")
+
+    def handle(self, *args, **options):
+        users, written = suggestions.compute_all(options['per_user'], options['chunk_size'])
+        engine = 'NumPy' if suggestions.np is not None else 'pure Python'
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} suggestions for {users} users ({engine})"))
@@ -0,0 +1,32 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = "Write a user's posts, likes, comments and follows as NDJSON, optionally gzip-compressed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', '-o', default='-', help="File to write; '-' (the default) is stdout.")
+        parser.add_argument('--gzip', action='store_true', help="Compress the output (implied by a .gz file name).")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['username']!r}")
+
+        output = options['output']
+        compress = options['gzip'] or output.endswith('.gz')
+        out = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for chunk in export.stream(user, compress=compress):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(f"Exported {user.username} to {output}"))
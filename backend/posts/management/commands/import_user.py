@@ -0,0 +1,37 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = "Import an export made by export_user or /api/export/, in batched inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON file, gzip-compressed if it ends in .gz; '-' reads stdin.")
+        parser.add_argument(
+            '--username', default=None,
+            help="Account to import into; defaults to the exported username. Created if it doesn't exist.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Records per bulk insert.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path == '-':
+            lines = sys.stdin.buffer
+        elif path.endswith('.gz'):
+            lines = gzip.open(path, 'rb')
+        else:
+            lines = open(path, 'rb')
+        try:
+            user, counts = export.import_lines(lines, options['username'], options['batch_size'])
+        except export.InvalidExport as exc:
+            raise CommandError(str(exc))
+        finally:
+            if lines is not sys.stdin.buffer:
+                lines.close()
+
+        summary = ', '.join(f"{count} {kind}" for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Imported into {user.username}: {summary}"))
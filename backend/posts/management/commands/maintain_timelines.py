@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts import timeline
+from posts.models import Follow
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Trim timelines back to TIMELINE_MAX_LENGTH and fan out pull authors again "
+        "once their follower count is back under TIMELINE_FANOUT_LIMIT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help="Timelines trimmed per query.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        backend = timeline.get_timeline_backend()
+
+        pull_authors = backend.pull_author_ids()
+        still_heavy = set(
+            Follow.objects.filter(followee_id__in=pull_authors)
+            .values('followee_id')
+            .annotate(followers=Count('id'))
+            .filter(followers__gt=timeline.fanout_limit())
+            .values_list('followee_id', flat=True)
+        )
+        for author_id in pull_authors - still_heavy:
+            followers = timeline.demote_pull_author(author_id)
+            self.stdout.write(f"Demoted pull author {author_id}, backfilled {followers} timelines")
+
+        last_id = 0
+        trimmed = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+            trimmed += backend.trim(user_ids)
+            last_id = user_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Done: trimmed {trimmed} timeline entries"))
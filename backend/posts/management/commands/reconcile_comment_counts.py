@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import comments
+
+
+class Command(BaseCommand):
+    help = "Recompute Post.comments_count from Comment rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        reconciled = comments.reconcile_comment_counts(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled comments_count for {reconciled} posts"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = "Fold sharded like counters into Post.likes_count, or recompute it from Like rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--flush-only',
+            action='store_true',
+            help="Only fold pending shard increments; don't recount Like rows.",
+        )
+
+    def handle(self, *args, **options):
+        if options['flush_only']:
+            flushed = counters.flush_like_counters(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Flushed like counters for {flushed} posts"))
+            return
+
+        reconciled = counters.reconcile_like_counts(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled likes_count for {reconciled} posts"))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import ArchivedPost, Post
+
+
+class Command(BaseCommand):
+    help = "Rebuild the post full-text search index, hot and archived posts, in primary-key batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help="Don't clear the index first; re-index posts in place.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        backend = search.get_search_backend()
+        if not options['keep']:
+            backend.clear()
+
+        indexed = 0
+        for model in (Post, ArchivedPost):
+            last_id = 0
+            while True:
+                rows = list(
+                    model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'text')[:batch_size]
+                )
+                if not rows:
+                    break
+                with transaction.atomic():
+                    backend.index(rows)
+                indexed += len(rows)
+                last_id = rows[-1][0]
+                self.stdout.write(f"Indexed {indexed} posts")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {indexed} posts indexed"))
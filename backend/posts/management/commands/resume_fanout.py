@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import fanout
+
+
+class Command(BaseCommand):
+    help = "Dispatch timeline fan-out that a stopped process left pending, and wait for it to finish."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=None,
+            help="Seconds a post must have been pending (default FANOUT_RESUME_SECONDS). "
+                 "Use 0 only when no server process is running.",
+        )
+
+    def handle(self, *args, **options):
+        dispatcher = fanout.get_dispatcher()
+        resumed = dispatcher.resume(options['older_than'])
+        dispatcher.join()
+        self.stdout.write(self.style.SUCCESS(f"Done: resumed fan-out for {resumed} posts"))
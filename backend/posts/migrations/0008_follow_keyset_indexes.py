@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2025-10-14 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['followee', '-created_at'], name='posts_follo_followe_0433cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', '-created_at'], name='posts_follo_followe_d553a7_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2025-10-15 09:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_comments_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField()),
+                ('start', models.DateTimeField()),
+                ('score', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'start'], name='posts_trend_resolut_d868de_idx')],
+                'unique_together': {('post', 'resolution', 'start')},
+            },
+        ),
+    ]
@@ -11,6 +11,7 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ["-created_at"]
@@ -31,7 +32,9 @@ class Follow(models.Model):
         unique_together = ("follower", "followee")
         indexes = [
             models.Index(fields=["follower"]),
-            models.Index(fields=["followee"])
+            models.Index(fields=["followee"]),
+            models.Index(fields=["followee", "-created_at"]),
+            models.Index(fields=["follower", "-created_at"])
         ]
     
     def __str__(self):
@@ -60,9 +63,191 @@ class Comment(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=["post"]),
+            models.Index(fields=["post", "created_at"]),
             models.Index(fields=["user"])
         ]
 
     def __str__(self):
-        return f"Comment by {self.user.username} on post {self.post.id}"
\ No newline at end of file
+        return f"Comment by {self.user.username} on post {self.post.id}"
+
+class TimelineEntry(models.Model):
+    """A post pushed into a follower's materialized home timeline."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "-created_at"]),
+            models.Index(fields=["user", "author"])
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in timeline of user {self.user_id}"
+
+class TimelinePullAuthor(models.Model):
+    """An author whose posts are merged into timelines at read time instead of fanned out."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Pull author {self.user_id}"
+
+
+class PendingFanout(models.Model):
+    """
+    A post whose follower fan-out hasn't finished. Written in the post's
+    transaction and deleted once its timelines are written, so fan-out a
+    process didn't finish is picked up again (see posts/fanout.py).
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name="+")
+    queued_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Pending fan-out of post {self.post_id}"
+
+
+class LikeCounterShard(models.Model):
+    """
+    One of several rows that absorb like/unlike increments for a post, so hot
+    posts don't serialize every like on the ``Post`` row. Pending shard totals
+    are folded into ``Post.likes_count`` by ``reconcile_like_counts``.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="like_shards")
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("post", "shard")
+
+    def __str__(self):
+        return f"Like shard {self.shard} of post {self.post_id}: {self.count}"
+
+class Affinity(models.Model):
+    """
+    How strongly a user engages with an author, decayed over time.
+
+    ``score`` is ``log2(weight) + t / half_life`` for the weight as of time
+    ``t``, so ordering by score ranks authors by their decayed weight at any
+    later moment without rewriting rows.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="affinities")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    last_interaction_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "author")
+        indexes = [
+            models.Index(fields=["user", "-score"])
+        ]
+
+    def __str__(self):
+        return f"Affinity of user {self.user_id} for author {self.author_id}"
+
+
+class TrendingBucket(models.Model):
+    """
+    Weighted engagement (likes and comments) on a post during one minute or
+    one hour starting at ``start``. Maintained by ``posts.trending``, which
+    rolls minute buckets up into hours and drops hours past the window.
+    """
+    MINUTE = 60
+    HOUR = 3600
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    resolution = models.PositiveIntegerField()  # bucket length in seconds
+    start = models.DateTimeField()
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("post", "resolution", "start")
+        indexes = [
+            models.Index(fields=["resolution", "start"])
+        ]
+
+    def __str__(self):
+        return f"Trending bucket {self.start} ({self.resolution}s) of post {self.post_id}: {self.score}"
+
+
+class FollowSuggestion(models.Model):
+    """
+    A precomputed "who to follow" candidate: someone followed by people
+    ``user`` follows. ``score`` adds ``1 / log2(2 + following count)`` for
+    each of those people (Adamic-Adar), so paths through accounts that follow
+    everyone count for less; ``mutuals`` is how many of them there are.
+    Written by ``compute_suggestions`` and kept up to date on follow/unfollow
+    (see posts/suggestions.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="follow_suggestions")
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    mutuals = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "candidate")
+        indexes = [
+            models.Index(fields=["user", "-score"])
+        ]
+
+    def __str__(self):
+        return f"Suggest user {self.candidate_id} to user {self.user_id}: {self.score:.3f}"
+
+
+class ArchivedPost(models.Model):
+    """
+    A post moved out of ``Post`` by ``archive_posts`` (see posts/archive.py).
+    It keeps its original ID. Archived posts, likes and comments are read-only.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_posts")
+    text = models.TextField()
+    image_url = models.URLField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created_at"]),
+            models.Index(fields=["-created_at"])
+        ]
+
+    def __str__(self):
+        return f"Archived post {self.id} by user {self.user_id}"
+
+
+class ArchivedLike(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE, related_name="likes")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "post")
+
+    def __str__(self):
+        return f"Archived like by user {self.user_id} on post {self.post_id}"
+
+
+class ArchivedComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE, related_name="comments")
+    content = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["post", "created_at"])
+        ]
+
+    def __str__(self):
+        return f"Archived comment {self.id} on post {self.post_id}"
+
+
+# Connects the user cache invalidation signals in every process
+from . import usercache  # noqa: E402,F401
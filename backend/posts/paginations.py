@@ -0,0 +1,257 @@
+# posts/paginations.py
+"""
+Keyset pagination for every list endpoint.
+
+Pages are selected with a ``WHERE (created_at, id) < (last_created_at,
+last_id)`` comparison instead of ``OFFSET``, so page 500 costs the same as page
+1 and walks the same ``(…, created_at)`` indexes. ``id`` breaks ties, so posts
+sharing a timestamp are never skipped or repeated. Cursors are opaque: base64
+JSON holding the boundary row's key and a direction; a malformed one is a 400.
+
+``encode_position``/``decode_position`` are the same codec for views that
+paginate outside the ORM (search, the ranked feed); they pass the position's
+expected shape so a tampered cursor is rejected before it reaches a query.
+"""
+import base64
+import json
+import math
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import exceptions
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import archive
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_position(position):
+    """Opaque cursor token for a JSON-serializable ``position``."""
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode()
+
+
+def decode_position(token, shape=None):
+    """
+    Decode a token from ``encode_position``, raising ``InvalidCursor`` if it's malformed.
+
+    ``shape`` is a sequence of types: the position must then be a list with one
+    value of each (``float`` also accepts ints, and must be finite).
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(token)
+    if shape is not None and not _has_shape(position, shape):
+        raise InvalidCursor(token)
+    return position
+
+
+def _has_shape(position, shape):
+    if not isinstance(position, list) or len(position) != len(shape):
+        return False
+    for value, kind in zip(position, shape):
+        if isinstance(value, bool):
+            return False
+        if kind is float:
+            if not isinstance(value, (int, float)) or not math.isfinite(value):
+                return False
+        elif not isinstance(value, kind):
+            return False
+    return True
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite key.
+
+    ``ordering`` lists the key fields with a ``-`` prefix for descending; the
+    last one must be unique (the primary key). The queryset's own ordering is
+    replaced. Responses look like DRF's ``CursorPagination``:
+    ``{"next": url, "previous": url, "results": [...]}``.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = [self._flip(field) for field in self.ordering] if reverse else list(self.ordering)
+        rows = self.fetch(queryset, ordering, position, self.page_size + 1, view)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        # Walking backwards, "more" lies before the page; a previous page
+        # exists when we got here from one, and vice versa.
+        self.has_next = (not reverse and has_more) or (reverse and position is not None)
+        self.has_previous = (reverse and has_more) or (not reverse and position is not None)
+        return rows
+
+    def fetch(self, queryset, ordering, position, limit, view=None):
+        """Up to ``limit`` rows after ``position`` in ``ordering``."""
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+        return list(queryset[:limit])
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                requested = int(request.query_params[self.page_size_query_param])
+            except (KeyError, ValueError):
+                pass
+            else:
+                if requested > 0:
+                    return min(requested, self.max_page_size)
+        return self.page_size
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(ordering, position):
+        """``Q`` selecting rows strictly after ``position`` in ``ordering``, lexicographically."""
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            term = Q(**{f'{name}__{lookup}': position[index]})
+            for earlier, value in zip(ordering[:index], position):
+                term &= Q(**{earlier.lstrip('-'): value})
+            condition |= term
+        return condition
+
+    def _values(self, row):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def _key(self, row):
+        return [value.isoformat() if hasattr(value, 'isoformat') else value for value in self._values(row)]
+
+    def encode_cursor(self, row, reverse=False):
+        payload = {'k': self._key(row)}
+        if reverse:
+            payload['r'] = 1
+        return replace_query_param(self.base_url, self.cursor_query_param, encode_position(payload))
+
+    def decode_cursor(self, request, model):
+        """Return ``(position, reverse)``; ``position`` is ``None`` on the first page."""
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = decode_position(token)
+            values = payload['k']
+            if len(values) != len(self.ordering):
+                raise ValueError(token)
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (ValueError, TypeError, KeyError, ValidationError):
+            # A 400 with the same body the views give bad search/ranked cursors
+            raise exceptions.ValidationError({'error': self.invalid_cursor_message})
+        return position, bool(payload.get('r'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ArchiveFallbackPagination(KeysetPagination):
+    """
+    Post pagination that continues into the archive (see posts/archive.py).
+
+    The view's ``get_archive_queryset()`` returns the archived counterpart of
+    its queryset. The archive is only queried once something has been
+    archived, and then only for pages that reach the archive boundary. Rows from both tables are merged in key order, so a
+    page can straddle the boundary.
+    """
+
+    def fetch(self, queryset, ordering, position, limit, view=None):
+        rows = super().fetch(queryset, ordering, position, limit, view)
+        get_archive_queryset = getattr(view, 'get_archive_queryset', None)
+        if get_archive_queryset is None or not archive.has_archived():
+            return rows
+
+        boundary = archive.boundary()
+        descending = ordering[0].startswith('-')
+        if descending:
+            # Walking back in time: the page reaches the boundary if the hot
+            # rows ran out or went past it
+            reaches = len(rows) < limit or tuple(self._values(rows[-1])) <= boundary
+        else:
+            reaches = position is not None and tuple(position) < boundary
+        if not reaches:
+            return rows
+
+        archived = super().fetch(get_archive_queryset(), ordering, position, limit, view)
+        merged = sorted(rows + archived, key=lambda row: tuple(self._values(row)), reverse=descending)
+        return merged[:limit]
+
+
+class PostPagination(ArchiveFallbackPagination):
+    page_size = 20
+
+
+class FeedCursorPagination(ArchiveFallbackPagination):
+    page_size = 20
+
+
+class ProfilePostPagination(ArchiveFallbackPagination):
+    page_size = 20
+
+
+class CommentPagination(KeysetPagination):
+    """Comments read oldest first, like a conversation."""
+    ordering = ('created_at', 'id')
+    page_size = 50
+
+
+class FollowPagination(KeysetPagination):
+    """Follower/following lists, most recent follow first (over ``Follow`` rows)."""
+    page_size = 50
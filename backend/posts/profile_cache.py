@@ -0,0 +1,96 @@
+# posts/profile_cache.py
+"""
+Versioned cache for the viewer-independent part of profile responses.
+
+Every profile has a version number in the cache. Cached payloads are keyed by
+it, so invalidating a profile is a single ``incr`` from the post, follow and
+like write paths and stale entries simply age out. The version is also part
+of the profile ``ETag``.
+
+Username lookups are cached too. Saving or deleting a user drops its
+mapping, so a renamed or deleted account's old username stops resolving,
+and bumps the version, since the payload embeds the user.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+
+def timeout():
+    return getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300)
+
+
+def _version_key(user_id):
+    return f'profile:ver:{user_id}'
+
+
+def get_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a version lost to eviction never reuses an
+        # old number that still has a cached payload.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump(*user_ids):
+    for user_id in user_ids:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            get_version(user_id)
+
+
+def _username_key(username):
+    return f'profile:uid:{username}'
+
+
+def _cached_username_key(user_id):
+    # The username a user ID was cached under, so a rename can find the old one
+    return f'profile:uname:{user_id}'
+
+
+def user_id_for(username):
+    """Resolve a username to a user ID, cached. Returns ``None`` if there's no such user."""
+    key = _username_key(username)
+    user_id = cache.get(key)
+    if user_id is None:
+        user_id = User.objects.filter(username=username).values_list('id', flat=True).first()
+        if user_id is None:
+            return None
+        cache.set_many({key: user_id, _cached_username_key(user_id): username}, timeout())
+    return user_id
+
+
+def forget_username(user_id):
+    username = cache.get(_cached_username_key(user_id))
+    keys = [_cached_username_key(user_id)]
+    if username is not None:
+        keys.append(_username_key(username))
+    cache.delete_many(keys)
+
+
+def get_payload(user_id, version):
+    return cache.get(f'profile:{user_id}:v{version}')
+
+
+def set_payload(user_id, version, payload):
+    cache.set(f'profile:{user_id}:v{version}', payload, timeout())
+
+
+def etag(user_id, version, viewer_id):
+    return f'"{user_id}-{version}-{viewer_id or 0}"'
+
+
+def _invalidate_user(sender, instance, **kwargs):
+    forget_username(instance.pk)
+    bump(instance.pk)
+
+
+post_save.connect(_invalidate_user, sender=settings.AUTH_USER_MODEL, dispatch_uid='posts.profile_cache.save')
+post_delete.connect(_invalidate_user, sender=settings.AUTH_USER_MODEL, dispatch_uid='posts.profile_cache.delete')
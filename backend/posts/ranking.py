@@ -0,0 +1,161 @@
+# posts/ranking.py
+"""
+Ranked home feed.
+
+Candidates are the recent posts the chronological feed would show: the
+materialized timeline, pull authors and the user's top affinity authors.
+The candidate set is bounded by ``FEED_RANKING['candidates']`` and
+``FEED_RANKING['window_hours']``. It is loaded as four columns and scored in
+one vectorized pass:
+
+    score = recency  * 2 ** (-age / recency_half_life)
+          + likes    * log1p(likes / (age_hours + 2))
+          + affinity * log1p(decayed affinity weight for the author)
+          + comments * log1p(comments_count)
+
+NumPy is optional. Without it, ``score_columns`` falls back to an equivalent
+pure-Python loop. The ranked ID list for a snapshot time is cached, so later
+pages come from the same ordering even as likes keep arriving.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from . import affinity, counters, timeline
+from .models import Post
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when NumPy isn't installed
+    np = None
+
+DEFAULT_RANKING = {
+    'recency': 1.0,
+    'recency_half_life_hours': 6,
+    'likes': 0.6,
+    'affinity': 0.8,
+    'comments': 0.4,
+    'candidates': 2000,
+    'window_hours': 72,
+    'snapshot_seconds': 600,
+}
+
+
+def config():
+    return {**DEFAULT_RANKING, **getattr(settings, 'FEED_RANKING', {})}
+
+
+def score_columns(ages, likes, comments, affinities, weights=None):
+    """
+    Score candidate columns (equal-length sequences, ``ages`` in seconds).
+    Returns a NumPy array when NumPy is available, otherwise a list.
+    """
+    weights = weights or config()
+    if np is None:
+        return score_columns_python(ages, likes, comments, affinities, weights)
+
+    ages = np.asarray(ages, dtype=np.float64)
+    age_hours = ages / 3600.0
+    return (
+        weights['recency'] * np.exp2(-age_hours / weights['recency_half_life_hours'])
+        + weights['likes'] * np.log1p(np.asarray(likes, dtype=np.float64) / (age_hours + 2.0))
+        + weights['affinity'] * np.log1p(np.asarray(affinities, dtype=np.float64))
+        + weights['comments'] * np.log1p(np.asarray(comments, dtype=np.float64))
+    )
+
+
+def score_columns_python(ages, likes, comments, affinities, weights=None):
+    weights = weights or config()
+    recency, half_life = weights['recency'], weights['recency_half_life_hours']
+    w_likes, w_affinity, w_comments = weights['likes'], weights['affinity'], weights['comments']
+    scores = []
+    for age, like_count, comment_count, weight in zip(ages, likes, comments, affinities):
+        age_hours = age / 3600.0
+        scores.append(
+            recency * 2.0 ** (-age_hours / half_life)
+            + w_likes * math.log1p(like_count / (age_hours + 2.0))
+            + w_affinity * math.log1p(weight)
+            + w_comments * math.log1p(comment_count)
+        )
+    return scores
+
+
+def load_candidates(user_id, now, weights):
+    """Return ``(post_ids, ages, likes, comments, affinities)`` columns for the user's candidates."""
+    timeline_post_ids, pull_ids = timeline.read_sources(user_id)
+    affinity_weights = affinity.top_weights(user_id, now)
+    since = now - timedelta(hours=weights['window_hours'])
+    rows = list(
+        Post.objects.filter(
+            Q(id__in=timeline_post_ids)
+            | Q(user__in=pull_ids)
+            | Q(id__in=affinity.recent_post_ids(set(affinity_weights) - set(pull_ids)))
+        )
+        .filter(created_at__gt=since, created_at__lte=now)
+        .order_by('-created_at')
+        .values_list('id', 'user_id', 'created_at', 'likes_count', 'comments_count')[:weights['candidates']]
+    )
+    post_ids = [row[0] for row in rows]
+    pending = counters.pending_like_counts(post_ids)
+    return (
+        post_ids,
+        [(now - row[2]).total_seconds() for row in rows],
+        [row[3] + pending.get(row[0], 0) for row in rows],
+        [row[4] for row in rows],
+        [affinity_weights.get(row[1], 0.0) for row in rows],
+    )
+
+
+def rank(user_id, now):
+    """Return ``[[score, post_id], ...]`` best first for the user's candidates at ``now``."""
+    weights = config()
+    post_ids, ages, likes, comments, affinities = load_candidates(user_id, now, weights)
+    if not post_ids:
+        return []
+    scores = score_columns(ages, likes, comments, affinities, weights)
+    if np is not None:
+        # Sort by score, then post ID, both descending
+        order = np.lexsort((-np.asarray(post_ids), -scores))
+        return [[round(float(scores[index]), 9), post_ids[index]] for index in order]
+    ranked = sorted(zip(scores, post_ids), key=lambda item: (-item[0], -item[1]))
+    return [[round(score, 9), post_id] for score, post_id in ranked]
+
+
+def _snapshot_key(user_id, snapshot):
+    return f'feed:ranked:{user_id}:{snapshot}'
+
+
+def ranked_page(user_id, snapshot=None, after=None, limit=20):
+    """
+    Return ``(post_ids, next_position)`` for one page of the ranked feed.
+
+    ``snapshot`` is the ranking time, as epoch seconds. ``next_position`` is
+    ``[snapshot, score, post_id]`` for the last post on the page; passing its
+    snapshot and ``(score, post_id)`` as ``after`` continues the same ordering. If the cached ranking
+    has expired, the feed is re-ranked at the snapshot time and the page is
+    continued by keyset.
+    """
+    if snapshot is None:
+        snapshot = int(timezone.now().timestamp())
+    key = _snapshot_key(user_id, snapshot)
+    ranked = cache.get(key)
+    if ranked is None:
+        ranked = rank(user_id, datetime.fromtimestamp(snapshot, tz=dt_timezone.utc))
+        cache.set(key, ranked, config()['snapshot_seconds'])
+
+    start = 0
+    if after is not None:
+        score, post_id = after
+        start = len(ranked)
+        for index, (entry_score, entry_id) in enumerate(ranked):
+            if entry_score < score or (entry_score == score and entry_id < post_id):
+                start = index
+                break
+    page = ranked[start:start + limit]
+    has_more = start + limit < len(ranked)
+    next_position = [snapshot, *page[-1]] if has_more and page else None
+    return [post_id for _, post_id in page], next_position
@@ -0,0 +1,40 @@
+# posts/renderers.py
+"""
+A faster JSON renderer for the post list endpoints.
+
+``FastJSONRenderer`` encodes with ``orjson`` when it is installed and
+produces the same bytes as DRF's ``JSONRenderer``. The output is compact and
+not ASCII-escaped, U+2028/U+2029 are escaped, and types orjson doesn't
+handle itself (including datetimes) are converted by DRF's encoder. When
+orjson is missing, or for anything it can't encode the same way (non-string
+keys, integers over 64 bits, an ``indent`` in the Accept header), rendering
+falls back to ``JSONRenderer``.
+
+orjson formats floats differently (``1e16`` rather than ``1e+16``), so only
+use this renderer for payloads without floats.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised when orjson isn't installed
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=JSONEncoder().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, for JavaScript string literals
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
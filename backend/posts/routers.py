@@ -0,0 +1,177 @@
+# posts/routers.py
+"""
+Primary/replica database routing.
+
+Writes always go to ``default``. Reads go to a replica from
+``DATABASE_REPLICAS`` only inside views that opt in with
+``ReplicaReadMixin``, and only for safe methods. They stay on the primary
+when:
+
+* the user wrote within the last ``DATABASE_PIN_SECONDS`` (read-your-writes
+  across requests, tracked in the cache by ``PrimaryPinMiddleware``);
+* the current request has already written (read-your-writes within it);
+* no replica is healthy. Replicas are probed with ``SELECT 1`` at most every
+  ``DATABASE_REPLICA_CHECK_SECONDS``, and a failed replica is skipped until
+  its next probe succeeds.
+"""
+import contextlib
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+_wrote = contextvars.ContextVar('wrote_primary', default=False)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def pin_seconds():
+    return getattr(settings, 'DATABASE_PIN_SECONDS', 5)
+
+
+def _pin_key(user_id):
+    return f'db:pin:{user_id}'
+
+
+def pin(user_id):
+    """Keep ``user_id`` on the primary for ``DATABASE_PIN_SECONDS``."""
+    if user_id is not None and replicas():
+        cache.set(_pin_key(user_id), True, pin_seconds())
+
+
+def is_pinned(user_id):
+    return user_id is not None and bool(cache.get(_pin_key(user_id)))
+
+
+class ReplicaHealth:
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._checked = {}
+        self._healthy = {}
+        self._lock = threading.Lock()
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked.get(alias, float('-inf')) < self.interval:
+                return self._healthy[alias]
+            # Claim the probe so concurrent requests don't all run it
+            self._checked[alias] = now
+            self._healthy.setdefault(alias, True)
+        healthy = self.probe(alias)
+        with self._lock:
+            if healthy != self._healthy.get(alias):
+                logger.log(logging.INFO if healthy else logging.WARNING,
+                           "Replica %s is %s", alias, 'back' if healthy else 'unavailable')
+            self._healthy[alias] = healthy
+        return healthy
+
+    @staticmethod
+    def probe(alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except DatabaseError:
+            connections[alias].close()
+            return False
+
+
+health = ReplicaHealth(interval=getattr(settings, 'DATABASE_REPLICA_CHECK_SECONDS', 5))
+
+
+def choose_replica():
+    """A random healthy replica, or ``None`` to use the primary."""
+    candidates = replicas()
+    random.shuffle(candidates)
+    for alias in candidates:
+        if health.is_healthy(alias):
+            return alias
+    return None
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """
+    Read from the primary inside the block, even in a ``ReplicaReadMixin``
+    view. For results that outlive the request, such as cached payloads,
+    which must not capture a lagging replica.
+    """
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and not _wrote.get():
+            return choose_replica() or DEFAULT_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    For DRF views whose safe-method handlers only read. Routing is decided
+    after authentication, so a user who just wrote is kept on the primary.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned(request.user.id):
+            self._replica_token = _replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _replica_reads.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class PrimaryPinMiddleware:
+    """Pins users to the primary after any successful unsafe request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _wrote.reset(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            # DRF copies the token-authenticated user onto the Django request
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin(user.id)
+        return response
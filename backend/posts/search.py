@@ -0,0 +1,111 @@
+# posts/search.py
+"""
+Full-text search over ``Post.text``.
+
+The index is kept in sync from the post write paths in ``PostViewSet`` and
+can be rebuilt with ``manage.py reindex_posts``. Storage is pluggable through
+``settings.SEARCH_BACKEND``; the default uses an SQLite FTS5 table created by
+migration ``0007_post_search_index``. Only the newest ``SEARCH_MAX_CANDIDATES``
+matches of a query are ranked, so a common term costs the same as a rare one.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'posts.search.SQLiteFTSBackend'
+
+
+def max_candidates():
+    return getattr(settings, 'SEARCH_MAX_CANDIDATES', 5000)
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements."""
+
+    def index(self, rows):
+        """Add or replace ``(post_id, text)`` rows."""
+        raise NotImplementedError
+
+    def remove(self, post_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, query, after=None, limit=20):
+        """
+        Return up to ``limit`` ``(post_id, position)`` hits, best first.
+
+        ``position`` is an opaque, JSON-serializable sort key; passing the
+        last one back as ``after`` returns the next page.
+        """
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    table = 'posts_post_fts'
+
+    @staticmethod
+    def to_match_query(query):
+        # Quote every term so user input can't use (or break) FTS5 syntax;
+        # the last term is a prefix match for search-as-you-type.
+        terms = ['"%s"' % term.replace('"', '""') for term in query.split()]
+        if terms:
+            terms[-1] += '*'
+        return ' '.join(terms)
+
+    def index(self, rows):
+        rows = list(rows)
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(post_id,) for post_id, _ in rows])
+            cursor.executemany(f"INSERT INTO {self.table} (rowid, text) VALUES (%s, %s)", rows)
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(post_id,) for post_id in post_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, query, after=None, limit=20):
+        match = self.to_match_query(query)
+        if not match:
+            return []
+        # rank is bm25(), lower for better matches; (rank, rowid) is the
+        # keyset. FTS5 only ranks rows at or above the rowid floor, i.e. the
+        # newest max_candidates() matches, however common the terms are.
+        sql = (
+            f"SELECT rowid, rank FROM {self.table} WHERE {self.table} MATCH %s AND rowid >= COALESCE(("
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rowid DESC LIMIT 1 OFFSET %s"
+            f"), 0)"
+        )
+        params = [match, match, max_candidates() - 1]
+        if after is not None:
+            score, post_id = after
+            sql += " AND (rank > %s OR (rank = %s AND rowid > %s))"
+            params += [score, score, post_id]
+        sql += " ORDER BY rank, rowid LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(post_id, [score, post_id]) for post_id, score in cursor.fetchall()]
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_search_backend():
+    return _load_backend(getattr(settings, 'SEARCH_BACKEND', DEFAULT_BACKEND))
+
+
+def index_post(post):
+    get_search_backend().index([(post.id, post.text)])
+
+
+def remove_post(post_id):
+    get_search_backend().remove([post_id])
@@ -1,9 +1,11 @@
 # posts/serializers.py
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import Post, Like, Follow
+from .models import Comment, Post, Like, Follow
+from . import comments, counters, instrumentation
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.db.models import prefetch_related_objects
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     username_field = 'email'
@@ -19,26 +21,18 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         email = attrs.get('email')
         password = attrs.get('password')
 
-        print(f"DEBUG SERIALIZER: Attempting login with email={email}")
-
         if not email or not password:
-            print("DEBUG SERIALIZER: Missing email or password")
             raise serializers.ValidationError('Email and password are required')
 
         # Try to authenticate with email as username (our EmailBackend handles this)
         user = authenticate(username=email, password=password)
-        print(f"DEBUG SERIALIZER: Authentication result: {user}")
 
         if user is None:
-            print(f"DEBUG SERIALIZER: Authentication failed for {email}")
             raise serializers.ValidationError('Invalid email or password')
 
         if not user.is_active:
-            print(f"DEBUG SERIALIZER: User {email} is not active")
             raise serializers.ValidationError('User account is disabled')
 
-        print(f"DEBUG SERIALIZER: Authentication successful for {user.username}")
-
         # Generate tokens manually instead of calling parent
         refresh = self.get_token(user)
         
@@ -48,7 +42,6 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
             'user': UserSerializer(user).data
         }
         
-        print(f"DEBUG SERIALIZER: Returning tokens for {user.username}")
         return data
 
 class UserSerializer(serializers.ModelSerializer):
@@ -57,6 +50,26 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "email", "date_joined"]
 
 
+class FollowSerializer(serializers.ModelSerializer):
+    """One side of a ``Follow`` row, picked by ``context['side']`` ('follower' or 'followee')."""
+    id = serializers.SerializerMethodField()
+    username = serializers.SerializerMethodField()
+    followed_at = serializers.DateTimeField(source="created_at")
+
+    class Meta:
+        model = Follow
+        fields = ["id", "username", "followed_at"]
+
+    def _user(self, obj):
+        return getattr(obj, self.context.get('side', 'follower'))
+
+    def get_id(self, obj):
+        return self._user(obj).id
+
+    def get_username(self, obj):
+        return self._user(obj).username
+
+
 # Add this new class for registration
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -68,16 +81,71 @@ class RegisterSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         return User.objects.create_user(**validated_data)
 
+class PostListSerializer(serializers.ListSerializer):
+    """
+    Serializes a page of posts with a fixed number of queries.
+
+    The authors, the viewer's liked post IDs, the pending like counter
+    shards and the comment previews for the whole page are loaded up front
+    and shared with the child serializer through the context, so no field
+    queries per post.
+    """
+
+    @instrumentation.timed('serialize')
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+
+        missing_authors = [post for post in posts if not Post.user.is_cached(post)]
+        if missing_authors:
+            prefetch_related_objects(missing_authors, 'user')
+
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            self.context['liked_post_ids'] = set(
+                Like.objects.filter(user=request.user, post_id__in=[post.id for post in posts])
+                .values_list('post_id', flat=True)
+            )
+        self.context['pending_like_counts'] = counters.pending_like_counts([post.id for post in posts])
+        self.context['comment_previews'] = comments.previews([post.id for post in posts if post.comments_count])
+        return [self.child.to_representation(post) for post in posts]
+
+
+class CommentSerializer(serializers.ModelSerializer):
+    author = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Comment
+        fields = ["id", "post", "author", "content", "created_at"]
+        read_only_fields = ["post"]
+
+    def get_author(self, obj):
+        return {
+            "id": obj.user.id,
+            "username": obj.user.username,
+            "avatar_url": getattr(obj.user, 'avatar_url', None)
+        }
+
+
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.SerializerMethodField()
     content = serializers.CharField(source="text", allow_blank=True)
-    likes_count = serializers.ReadOnlyField()
+    likes_count = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
+    comments_preview = serializers.SerializerMethodField()
     image_url = serializers.URLField(required=False, allow_null=True, allow_blank=True)
 
     class Meta:
         model = Post
-        fields = ["id", "author", "content", "image_url", "created_at", "likes_count", "is_liked"]
+        fields = [
+            "id", "author", "content", "image_url", "created_at",
+            "likes_count", "is_liked", "comments_count", "comments_preview",
+        ]
+        read_only_fields = ["comments_count"]
+        list_serializer_class = PostListSerializer
+
+    @instrumentation.timed('serialize')
+    def to_representation(self, instance):
+        return super().to_representation(instance)
 
     def get_author(self, obj):
         return {
@@ -86,8 +154,25 @@ class PostSerializer(serializers.ModelSerializer):
             "avatar_url": getattr(obj.user, 'avatar_url', None)
         }
 
+    def get_likes_count(self, obj):
+        pending = self.context.get('pending_like_counts')
+        if pending is not None:
+            return obj.likes_count + pending.get(obj.id, 0)
+        return counters.like_count(obj)
+
     def get_is_liked(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            liked_post_ids = self.context.get('liked_post_ids')
+            if liked_post_ids is not None:
+                return obj.id in liked_post_ids
             return obj.likes.filter(user=request.user).exists()
-        return False
\ No newline at end of file
+        return False
+
+    def get_comments_preview(self, obj):
+        if not obj.comments_count:
+            return []
+        previews = self.context.get('comment_previews')
+        if previews is None:
+            previews = comments.previews([obj.id])
+        return CommentSerializer(previews.get(obj.id, []), many=True).data
@@ -0,0 +1,279 @@
+# posts/suggestions.py
+"""
+"Who to follow" suggestions from the friends-of-friends graph.
+
+``compute_all`` (``manage.py compute_suggestions``) loads the whole
+``Follow`` table once into CSR arrays, where row ``u`` lists the users ``u``
+follows. It then scores each user's two-hop neighbourhood with a sparse
+row-times-matrix product:
+
+    score(u, c) = sum of 1 / log2(2 + following(w)) over the users w that
+                  u follows and that follow c
+
+This is Adamic-Adar: a path through someone who follows thousands of
+accounts says little. Users ``u`` already follows are skipped, and the best
+``FOLLOW_SUGGESTIONS['per_user']`` candidates replace the stored
+``FollowSuggestion`` rows. NumPy is optional. Without it the product runs as
+a pure-Python loop over the same arrays.
+
+Between runs, ``on_follow_many`` adjusts the stored rows when someone
+follows or unfollows. The follower gains or loses the paths through the
+followee (and an unfollowed account becomes a candidate again through the
+follower's other followees), and the follower's own followers gain or lose
+a path to the followee; a row is removed once its score falls to zero. Weights use the following counts at the time of the event, and
+work past ``max_fanout`` is skipped, so the stored scores drift slightly
+until the next batch run. The endpoint only reads ``FollowSuggestion``.
+"""
+import heapq
+import math
+from array import array
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Follow, FollowSuggestion
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when NumPy isn't installed
+    np = None
+
+DEFAULT_SUGGESTIONS = {
+    'per_user': 50,
+    'max_fanout': 5000,
+}
+
+# Rows whose score falls to this or below after unfollows are removed
+MIN_SCORE = 1e-6
+
+
+def config():
+    return {**DEFAULT_SUGGESTIONS, **getattr(settings, 'FOLLOW_SUGGESTIONS', {})}
+
+
+def path_weight(following_count):
+    return 1.0 / math.log2(2 + following_count)
+
+
+class FollowGraph:
+    """The follow graph as CSR arrays over dense user indexes (``user_ids`` is sorted)."""
+
+    def __init__(self, user_ids, indptr, indices):
+        self.user_ids = user_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = array('d', (path_weight(indptr[row + 1] - indptr[row]) for row in range(len(user_ids))))
+        self._arrays = None
+        if np is not None:
+            self._arrays = (
+                np.frombuffer(indptr, dtype=np.int64),
+                np.frombuffer(indices, dtype=np.int64),
+                np.frombuffer(self.weights, dtype=np.float64),
+            )
+
+    @classmethod
+    def load(cls, chunk_size=20000):
+        user_ids = array('q', User.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size))
+        index = {user_id: row for row, user_id in enumerate(user_ids)}
+        indptr = array('q', [0]) * (len(user_ids) + 1)
+        indices = array('q')
+        if not user_ids:
+            return cls(user_ids, indptr, indices)
+        edges = (
+            Follow.objects.filter(follower_id__lte=user_ids[-1], followee_id__lte=user_ids[-1])
+            .order_by('follower_id', 'followee_id')
+            .values_list('follower_id', 'followee_id')
+            .iterator(chunk_size=chunk_size)
+        )
+        row = 0
+        for follower_id, followee_id in edges:
+            follower = index[follower_id]
+            while row < follower:
+                row += 1
+                indptr[row] = len(indices)
+            indices.append(index[followee_id])
+        while row < len(user_ids):
+            row += 1
+            indptr[row] = len(indices)
+        return cls(user_ids, indptr, indices)
+
+    def candidates(self, row, limit):
+        """The best ``limit`` ``(row, score, mutuals)`` for the user at ``row``, best first."""
+        if self._arrays is not None:
+            return self._candidates_numpy(row, limit)
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        following = indices[indptr[row]:indptr[row + 1]]
+        skip = set(following)
+        skip.add(row)
+        scores, mutuals = {}, {}
+        for middle in following:
+            weight = weights[middle]
+            for candidate in indices[indptr[middle]:indptr[middle + 1]]:
+                if candidate not in skip:
+                    scores[candidate] = scores.get(candidate, 0.0) + weight
+                    mutuals[candidate] = mutuals.get(candidate, 0) + 1
+        # Highest score first, then the older account
+        best = heapq.nlargest(limit, scores, key=lambda candidate: (scores[candidate], -candidate))
+        return [(candidate, scores[candidate], mutuals[candidate]) for candidate in best]
+
+    def _candidates_numpy(self, row, limit):
+        indptr, indices, weights = self._arrays
+        following = indices[indptr[row]:indptr[row + 1]]
+        starts = indptr[following]
+        lengths = indptr[following + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return []
+        # Positions in ``indices`` of every followee of every followee
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+        reached = indices[offsets]
+        path_weights = np.repeat(weights[following], lengths)
+        keep = ~np.isin(reached, following) & (reached != row)
+        reached, path_weights = reached[keep], path_weights[keep]
+        if not len(reached):
+            return []
+        candidates, inverse = np.unique(reached, return_inverse=True)
+        scores = np.bincount(inverse, weights=path_weights)
+        mutuals = np.bincount(inverse)
+        order = np.lexsort((candidates, -scores))[:limit]
+        return [(int(candidates[index]), float(scores[index]), int(mutuals[index])) for index in order]
+
+
+def compute_all(per_user=None, chunk_size=1000):
+    """Recompute every user's suggestions. Returns ``(users, suggestions written)``."""
+    per_user = config()['per_user'] if per_user is None else per_user
+    graph = FollowGraph.load()
+    user_ids = graph.user_ids
+    written = 0
+    for start in range(0, len(user_ids), chunk_size):
+        rows = range(start, min(start + chunk_size, len(user_ids)))
+        suggestions = [
+            FollowSuggestion(user_id=user_ids[row], candidate_id=user_ids[candidate], score=score, mutuals=mutuals)
+            for row in rows
+            for candidate, score, mutuals in graph.candidates(row, per_user)
+        ]
+        with transaction.atomic():
+            FollowSuggestion.objects.filter(user_id__gte=user_ids[rows[0]], user_id__lte=user_ids[rows[-1]]).delete()
+            FollowSuggestion.objects.bulk_create(suggestions, batch_size=500)
+        written += len(suggestions)
+    return len(user_ids), written
+
+
+def following_counts(user_ids):
+    return dict(
+        Follow.objects.filter(follower_id__in=user_ids)
+        .values('follower_id')
+        .annotate(total=Count('id'))
+        .values_list('follower_id', 'total')
+    )
+
+
+def _merge(user_id, increments, per_user, drop=()):
+    """Apply ``{candidate_id: (score, mutuals)}`` to a user's rows and keep the best ``per_user``."""
+    with transaction.atomic():
+        rows = {
+            row.candidate_id: row
+            for row in FollowSuggestion.objects.select_for_update().filter(user_id=user_id)
+        }
+        for candidate_id, (score, mutuals) in increments.items():
+            row = rows.get(candidate_id)
+            if row is None:
+                if score <= 0:
+                    continue
+                row = rows[candidate_id] = FollowSuggestion(
+                    user_id=user_id, candidate_id=candidate_id, score=0.0, mutuals=0
+                )
+            row.score += score
+            row.mutuals += mutuals
+        for candidate_id in drop:
+            rows.pop(candidate_id, None)
+
+        keep = heapq.nlargest(
+            per_user,
+            (row for row in rows.values() if row.score > MIN_SCORE),
+            key=lambda row: (row.score, -row.candidate_id),
+        )
+        FollowSuggestion.objects.filter(user_id=user_id).exclude(
+            candidate_id__in=[row.candidate_id for row in keep]
+        ).delete()
+        FollowSuggestion.objects.bulk_update([row for row in keep if row.pk], ['score', 'mutuals'])
+        FollowSuggestion.objects.bulk_create([row for row in keep if row.pk is None])
+
+
+def _add_paths_through(user_id, followee_ids, weight, sign):
+    """Users following ``user_id`` gain (or lose) a path to each of ``followee_ids``."""
+    followers = Follow.objects.filter(followee_id=user_id).values('follower_id')
+    with transaction.atomic():
+        for followee_id in followee_ids:
+            stored = FollowSuggestion.objects.filter(candidate_id=followee_id, user_id__in=followers)
+            stored.update(score=F('score') + weight, mutuals=F('mutuals') + sign)
+            if sign < 0:
+                # Only the rows that just lost their last path
+                stored.filter(score__lte=MIN_SCORE).delete()
+                continue
+            have = set(stored.values_list('user_id', flat=True))
+            new = (
+                Follow.objects.filter(followee_id=user_id)
+                .exclude(follower_id=followee_id)
+                .exclude(follower_id__in=Follow.objects.filter(followee_id=followee_id).values('follower_id'))
+                .values_list('follower_id', flat=True)
+            )
+            FollowSuggestion.objects.bulk_create(
+                [
+                    FollowSuggestion(user_id=follower_id, candidate_id=followee_id, score=weight, mutuals=1)
+                    for follower_id in new if follower_id not in have
+                ],
+                ignore_conflicts=True,
+            )
+
+
+def on_follow(user_id, followee_id, followed=True):
+    on_follow_many(user_id, [followee_id], followed)
+
+
+def on_follow_many(user_id, followee_ids, followed=True):
+    """Adjust stored suggestions after ``user_id`` follows (or unfollows) ``followee_ids``."""
+    followee_ids = list(followee_ids)
+    if not followee_ids:
+        return
+    cfg = config()
+    sign = 1 if followed else -1
+    following = set(Follow.objects.filter(follower_id=user_id).values_list('followee_id', flat=True))
+    counts = following_counts([user_id, *followee_ids])
+
+    # The user's own candidates: whoever the (un)followed users follow
+    middles = [followee_id for followee_id in followee_ids if counts.get(followee_id, 0) <= cfg['max_fanout']]
+    increments = {}
+    edges = Follow.objects.filter(follower_id__in=middles).values_list('follower_id', 'followee_id')
+    # (Un)followed users were dropped from the rows when followed; see below for unfollows
+    skip = following | set(followee_ids) | {user_id}
+    for middle, candidate in edges:
+        if candidate in skip:
+            continue
+        score, mutuals = increments.get(candidate, (0.0, 0))
+        increments[candidate] = (score + sign * path_weight(counts.get(middle, 0)), mutuals + sign)
+    if not followed:
+        # Unfollowed users are candidates again if people the user follows follow them
+        paths = list(
+            Follow.objects.filter(
+                follower_id__in=Follow.objects.filter(follower_id=user_id).values('followee_id'),
+                followee_id__in=followee_ids,
+            )
+            .values_list('follower_id', 'followee_id')
+        )
+        middle_counts = following_counts({middle for middle, _ in paths})
+        for middle, candidate in paths:
+            score, mutuals = increments.get(candidate, (0.0, 0))
+            increments[candidate] = (score + path_weight(middle_counts.get(middle, 0)), mutuals + 1)
+    if increments or followed:
+        _merge(user_id, increments, cfg['per_user'], drop=followee_ids if followed else ())
+
+    # The user's followers now reach the (un)followed users through the user.
+    # Paths are weighted by the user's following count with the followees
+    # included, so an unfollow takes away what the follow added.
+    followers = Follow.objects.filter(followee_id=user_id).count()
+    if followers and followers * len(followee_ids) <= cfg['max_fanout']:
+        user_following = counts.get(user_id, 0) + (0 if followed else len(followee_ids))
+        _add_paths_through(user_id, followee_ids, sign * path_weight(user_following), sign)
@@ -0,0 +1,30 @@
+# posts/testing.py
+"""Test helpers for query regressions."""
+from contextlib import contextmanager
+
+from .instrumentation import RequestMetrics, n_plus_one_threshold
+
+
+@contextmanager
+def assert_no_n_plus_one(threshold=None, using=None, max_queries=None):
+    """
+    Fail if any query shape runs ``threshold`` times or more inside the block
+    (default ``N_PLUS_ONE_THRESHOLD``), or if more than ``max_queries`` run.
+
+        with assert_no_n_plus_one():
+            self.client.get('/api/feed/')
+
+    Yields the ``RequestMetrics`` so tests can make further assertions.
+    """
+    metrics = RequestMetrics()
+    with metrics.record(using):
+        yield metrics
+
+    problems = []
+    threshold = n_plus_one_threshold() if threshold is None else threshold
+    for shape, count in metrics.repeated_shapes(threshold):
+        problems.append(f"  {count}x {shape}")
+    if max_queries is not None and metrics.queries > max_queries:
+        problems.append(f"  {metrics.queries} queries, expected at most {max_queries}")
+    if problems:
+        raise AssertionError("Query regression detected:\n" + "\n".join(problems))
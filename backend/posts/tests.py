@@ -0,0 +1,1105 @@
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import (
+    affinity, archive, counters, export, fanout, fastserialize, images, routers, search, suggestions, timeline, trending,
+    writequeue,
+)
+from .authentication import CachedJWTAuthentication
+from .consumers import FeedConsumer
+from .layers import UnixSocketChannelLayer
+from .models import Affinity, Comment, Follow, FollowSuggestion, Like, LikeCounterShard, PendingFanout, Post, TimelineEntry, TimelinePullAuthor
+from .paginations import encode_position
+from .renderers import FastJSONRenderer
+from .routing import websocket_urlpatterns
+from .serializers import PostSerializer
+from .testing import assert_no_n_plus_one
+from .usercache import user_cache
+from .ws_auth import JWTAuthMiddleware, get_user_for_token, token_cache
+
+
+class PostListSerializerQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        authors = [User.objects.create_user(f'author{index}', f'author{index}@example.com', 'password')
+                   for index in range(10)]
+        posts = Post.objects.bulk_create(
+            [Post(user=authors[index % len(authors)], text=f'post {index}') for index in range(50)]
+        )
+        # Likes by the viewer and comments on every third post, so is_liked
+        # and the comment previews have something to load on every page size
+        Like.objects.bulk_create([Like(user=cls.viewer, post=post) for post in posts[::2]])
+        for post in posts[::3]:
+            Comment.objects.create(user=authors[0], post=post, content='nice')
+            Comment.objects.create(user=cls.viewer, post=post, content='agreed')
+            Post.objects.filter(pk=post.pk).update(comments_count=2)
+
+    def serialize_page(self, size):
+        request = RequestFactory().get('/api/posts/')
+        request.user = self.viewer
+        page = Post.objects.order_by('-created_at', '-id')[:size]
+        with CaptureQueriesContext(connection) as captured:
+            data = PostSerializer(page, many=True, context={'request': request}).data
+        self.assertEqual(len(data), size)
+        return len(captured)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.assertEqual(self.serialize_page(5), self.serialize_page(50))
+
+    def test_reconcile_comment_counts(self):
+        Post.objects.update(comments_count=7)
+        call_command('reconcile_comment_counts', '--batch-size', '8', stdout=StringIO())
+        counts = dict(Post.objects.values_list('id', 'comments_count'))
+        self.assertEqual(sum(counts.values()), Comment.objects.count())
+        self.assertEqual({counts[post_id] for post_id in Comment.objects.values_list('post_id', flat=True)}, {2})
+
+
+class FastSerializeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('reader', 'reader@example.com', 'password')
+        author = User.objects.create_user('writer', 'writer@example.com', 'password')
+        posts = [
+            Post.objects.create(user=author, text='plain'),
+            Post.objects.create(user=author, text='with image', image_url='https://example.com/a.jpg'),
+            Post.objects.create(user=cls.viewer, text='line\u2028separator and caf\u00e9'),
+            Post.objects.create(user=author, text='', image_url=''),
+        ]
+        Like.objects.create(user=cls.viewer, post=posts[0])
+        Post.objects.filter(pk=posts[0].pk).update(likes_count=1)
+        counters.increment_likes(posts[0].id, 2)
+        counters.increment_likes(posts[1].id, 1)
+        for index in range(5):
+            Comment.objects.create(user=[author, cls.viewer][index % 2], post=posts[2], content=f'comment {index}')
+        Comment.objects.create(user=author, post=posts[1], content='only one')
+        Post.objects.filter(pk=posts[2].pk).update(comments_count=5)
+        Post.objects.filter(pk=posts[1].pk).update(comments_count=1)
+
+    def assertMatchesSerializer(self, viewer):
+        request = RequestFactory().get('/api/posts/')
+        request.user = viewer
+        queryset = Post.objects.order_by('-created_at', '-id')
+        expected = PostSerializer(queryset, many=True, context={'request': request}).data
+        fast = fastserialize.serialize_posts(fastserialize.post_rows(queryset), viewer)
+        self.assertEqual(fast, list(expected))
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+        return fast
+
+    def test_matches_post_serializer_for_a_viewer(self):
+        data = self.assertMatchesSerializer(self.viewer)
+        by_content = {post['content']: post for post in data}
+        self.assertTrue(by_content['plain']['is_liked'])
+        self.assertEqual(by_content['plain']['likes_count'], 3)
+        self.assertEqual(by_content['with image']['image_url'], 'https://example.com/a.jpg')
+        self.assertEqual(len(by_content['with image']['comments_preview']), 1)
+        self.assertTrue(by_content['line\u2028separator and caf\u00e9']['comments_preview'])
+
+    def test_matches_post_serializer_anonymously(self):
+        data = self.assertMatchesSerializer(AnonymousUser())
+        self.assertFalse(any(post['is_liked'] for post in data))
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = self.assertMatchesSerializer(self.viewer)
+        payloads = [
+            {'results': data, 'next': None, 'previous': 'http://testserver/api/feed/?cursor=abc'},
+            {'nested': {'emoji': '\U0001f600', 'quote': '"\\', 'control': '\x01'}, 'when': timezone.now(), 'big': 2 ** 70},
+        ]
+        for payload in payloads:
+            self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+
+
+class ListViewQueryTests(TestCase):
+    """The feed and profile pages load a page of posts without per-post queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('reader', 'reader@example.com', 'password')
+        authors = [User.objects.create_user(f'writer{index}', f'writer{index}@example.com', 'password')
+                   for index in range(8)]
+        Follow.objects.bulk_create([Follow(follower=cls.viewer, followee=author) for author in authors])
+        posts = Post.objects.bulk_create(
+            [Post(user=authors[index % len(authors)], text=f'post {index}') for index in range(40)]
+        )
+        Like.objects.bulk_create([Like(user=cls.viewer, post=post) for post in posts[::2]])
+        for post in posts[::2]:
+            Comment.objects.create(user=authors[1], post=post, content='first')
+            Post.objects.filter(pk=post.pk).update(comments_count=1)
+        call_command('rebuild_timelines', stdout=StringIO())
+        cls.author = authors[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_feed(self):
+        with assert_no_n_plus_one():
+            response = self.client.get('/api/feed/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_profile(self):
+        with assert_no_n_plus_one():
+            response = self.client.get(f'/api/users/{self.author.username}/')
+        self.assertEqual(response.status_code, 200)
+
+
+class BulkEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.me = User.objects.create_user('bulky', 'bulky@example.com', 'password')
+        cls.authors = [
+            User.objects.create_user(f'bulk{index}', f'bulk{index}@example.com', 'password') for index in range(24)
+        ]
+        # One post per author, so likes touch as many authors as posts
+        cls.posts = [Post.objects.create(user=author, text=f'bulk {author.username}') for author in cls.authors]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def post(self, url, data):
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return {item['id']: item['status'] for item in response.data['results']}
+
+    def queries(self, url, data):
+        with assert_no_n_plus_one() as metrics:
+            self.post(url, data)
+        return metrics.queries
+
+    def test_bulk_like_statuses(self):
+        first, second, third = self.posts[:3]
+        Like.objects.create(user=self.me, post=second)
+        Post.objects.filter(pk=second.pk).update(likes_count=1)
+        missing = Post.objects.order_by('-id').values_list('id', flat=True).first() + 1000
+        url = '/api/posts/bulk_like/'
+        statuses = self.post(url, {'ids': [first.id, second.id, missing, first.id]})
+        self.assertEqual(statuses, {first.id: 'liked', second.id: 'already_liked', missing: 'not_found'})
+        self.assertEqual(set(Like.objects.filter(user=self.me).values_list('post_id', flat=True)), {first.id, second.id})
+
+        statuses = self.post(url, {'ids': [second.id, third.id, missing], 'action': 'unlike'})
+        self.assertEqual(statuses, {second.id: 'unliked', third.id: 'not_liked', missing: 'not_found'})
+        self.assertEqual(counters.like_count(Post.objects.get(pk=first.pk)), 1)
+        self.assertEqual(counters.like_count(Post.objects.get(pk=second.pk)), 0)
+
+    def test_bulk_follow_statuses(self):
+        first, second, third = self.authors[:3]
+        Follow.objects.create(follower=self.me, followee=second)
+        missing = self.authors[-1].id + 1000
+        url = '/api/follows/bulk/'
+        statuses = self.post(url, {'user_ids': [first.id, second.id, self.me.id, missing, first.id]})
+        self.assertEqual(
+            statuses, {first.id: 'followed', second.id: 'already_following', self.me.id: 'self', missing: 'not_found'}
+        )
+        self.assertEqual(set(Follow.objects.filter(follower=self.me).values_list('followee_id', flat=True)),
+                         {first.id, second.id})
+
+        statuses = self.post(url, {'user_ids': [second.id, third.id], 'action': 'unfollow'})
+        self.assertEqual(statuses, {second.id: 'unfollowed', third.id: 'not_following'})
+
+    def test_bulk_like_query_count_is_constant(self):
+        url = '/api/posts/bulk_like/'
+        small = self.queries(url, {'ids': [post.id for post in self.posts[:2]]})
+        large = self.queries(url, {'ids': [post.id for post in self.posts[2:]]})
+        self.assertEqual(small, large)
+
+    def test_bulk_follow_query_count_is_constant(self):
+        url = '/api/follows/bulk/'
+        small = self.queries(url, {'user_ids': [author.id for author in self.authors[:2]]})
+        large = self.queries(url, {'user_ids': [author.id for author in self.authors[2:]]})
+        self.assertEqual(small, large)
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('profiled', 'profiled@example.com', 'password')
+        self.post = Post.objects.create(user=self.author, text='hello')
+        self.viewer = User.objects.create_user('visitor', 'visitor@example.com', 'password')
+        self.other = User.objects.create_user('passerby', 'passerby@example.com', 'password')
+        self.url = f'/api/users/{self.author.username}/'
+
+    def get(self, user, **headers):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(self.url, **headers)
+
+    def post_as(self, user, url, data):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(url, data, format='json')
+        self.assertLess(response.status_code, 400)
+
+    def test_matching_etag_is_answered_without_queries(self):
+        etag = self.get(self.viewer)['ETag']
+        with self.assertNumQueries(0):
+            response = self.get(self.viewer, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_writes_change_the_etag(self):
+        writes = (
+            (self.author, '/api/posts/', {'content': 'another'}),
+            (self.viewer, '/api/follows/bulk/', {'user_ids': [self.author.id]}),
+            (self.viewer, '/api/posts/bulk_like/', {'ids': [self.post.id]}),
+        )
+        etag = self.get(self.viewer)['ETag']
+        for user, url, data in writes:
+            with self.subTest(url=url):
+                self.post_as(user, url, data)
+                response = self.get(self.viewer, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+                etag = response['ETag']
+
+    def test_viewer_fields_stay_with_their_viewer(self):
+        self.post_as(self.viewer, '/api/follows/bulk/', {'user_ids': [self.author.id]})
+        self.post_as(self.viewer, '/api/posts/bulk_like/', {'ids': [self.post.id]})
+        mine, theirs = self.get(self.viewer), self.get(self.other)
+        self.assertNotEqual(mine['ETag'], theirs['ETag'])
+        self.assertEqual((mine.data['is_following'], mine.data['posts']['results'][0]['is_liked']), (True, True))
+        self.assertEqual((theirs.data['is_following'], theirs.data['posts']['results'][0]['is_liked']), (False, False))
+
+    def test_renamed_and_deleted_users_stop_resolving(self):
+        self.assertEqual(self.get(self.viewer).status_code, 200)
+        self.author.username = 'renamed'
+        self.author.save()
+        self.assertEqual(self.get(self.viewer).status_code, 404)
+        self.url = '/api/users/renamed/'
+        self.assertEqual(self.get(self.viewer).data['user']['username'], 'renamed')
+
+        self.author.delete()
+        self.assertEqual(self.get(self.viewer).status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=['default'])
+class ProfileReplicaLagTests(TestCase):
+    """
+    The primary doubles as the "replica"; replica-routed reads of the follow
+    table see a snapshot taken before the write, as a lagging replica would.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('lagged', 'lagged@example.com', 'password')
+        self.viewer = User.objects.create_user('watcher', 'watcher@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    @staticmethod
+    def lagging(execute, sql, params, many, context):
+        if routers._replica_reads.get() and not routers._wrote.get():
+            sql = sql.replace('"posts_follow"', '"lagging_posts_follow"')
+        return execute(sql, params, many, context)
+
+    def test_cached_payload_is_current(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMP TABLE "lagging_posts_follow" AS SELECT * FROM "posts_follow"')
+        follower = User.objects.create_user('newfan', 'newfan@example.com', 'password')
+        self.client.force_authenticate(follower)
+        response = self.client.post('/api/follows/bulk/', {'user_ids': [self.author.id]}, format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'followed')
+
+        self.client.force_authenticate(self.viewer)
+        with connection.execute_wrapper(self.lagging):
+            response = self.client.get(f'/api/users/{self.author.username}/')
+            self.assertEqual(response.data['follower_count'], 1)
+            again = self.client.get(f'/api/users/{self.author.username}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+
+@override_settings(TIMELINE_MAX_LENGTH=3, TIMELINE_FANOUT_LIMIT=2)
+class TimelineMaintenanceTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('celebrity', 'celebrity@example.com', 'password')
+        self.fans = [User.objects.create_user(f'fan{index}', f'fan{index}@example.com', 'password')
+                     for index in range(3)]
+        Follow.objects.bulk_create([Follow(follower=fan, followee=self.author) for fan in self.fans])
+        self.posts = [Post.objects.create(user=self.author, text=f'post {index}') for index in range(5)]
+        self.backend = timeline.get_timeline_backend()
+
+    def test_fetch_is_read_only_and_maintenance_trims(self):
+        fan = self.fans[0]
+        for post in self.posts:
+            self.backend.push(post.id, post.user_id, post.created_at, [fan.id])
+        self.assertEqual(self.backend.fetch(fan.id), [post.id for post in self.posts[:-4:-1]])
+        self.assertEqual(TimelineEntry.objects.filter(user=fan).count(), 5)
+
+        call_command('maintain_timelines', stdout=StringIO())
+        self.assertEqual(TimelineEntry.objects.filter(user=fan).count(), 3)
+
+    def test_pull_author_is_demoted_below_the_limit(self):
+        self.assertFalse(timeline.fan_out_post(self.posts[0], Follow.objects.values_list('follower_id', flat=True)))
+        self.assertEqual(timeline.read_sources(self.fans[0].id)[1], {self.author.id})
+
+        Follow.objects.filter(follower=self.fans[2]).delete()
+        call_command('maintain_timelines', stdout=StringIO())
+        self.assertFalse(TimelinePullAuthor.objects.exists())
+        post_ids, pull_ids = timeline.read_sources(self.fans[0].id)
+        self.assertEqual(pull_ids, set())
+        self.assertEqual(post_ids, [post.id for post in self.posts[:-4:-1]])
+
+    def test_fetch_breaks_timestamp_ties_by_post_id(self):
+        fan = self.fans[0]
+        same_time = timezone.now()
+        # Pushed out of order, all at one timestamp
+        for post in sorted(self.posts, key=lambda post: post.id % 3):
+            self.backend.push(post.id, post.user_id, same_time, [fan.id])
+        self.assertEqual(self.backend.fetch(fan.id), [post.id for post in self.posts[:-4:-1]])
+
+    def test_rebuild_drops_stale_entries(self):
+        fan = self.fans[0]
+        stranger = User.objects.create_user('stranger', 'stranger@example.com', 'password')
+        unfollowed = Post.objects.create(user=stranger, text='not followed')
+        self.backend.push(unfollowed.id, stranger.id, unfollowed.created_at, [fan.id])
+        call_command('rebuild_timelines', stdout=StringIO())
+        # The celebrity is over TIMELINE_FANOUT_LIMIT, so only read-time merged
+        self.assertEqual(timeline.read_sources(fan.id), ([], {self.author.id}))
+        self.assertEqual(self.backend.fetch(stranger.id), [unfollowed.id])
+
+
+@override_settings(AFFINITY_POSTS_PER_AUTHOR=2)
+class AffinityCandidateTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('fan', 'fan@example.com', 'password')
+        self.active = User.objects.create_user('active', 'active@example.com', 'password')
+        self.faded = User.objects.create_user('faded', 'faded@example.com', 'password')
+        now = timezone.now()
+        affinity.record_interaction(self.reader.id, self.active.id, affinity.LIKE_WEIGHT, at=now)
+        # A single like a year ago has decayed far below MIN_WEIGHT
+        affinity.record_interaction(self.reader.id, self.faded.id, affinity.LIKE_WEIGHT, at=now - timedelta(days=365))
+        self.posts = [Post.objects.create(user=self.active, text=f'post {index}') for index in range(4)]
+        Post.objects.create(user=self.faded, text='old friend')
+
+    def test_decayed_edges_are_ignored_and_pruned(self):
+        self.assertEqual(affinity.top_authors(self.reader.id), [self.active.id])
+        self.assertEqual(Affinity.objects.count(), 2)
+
+        call_command('backfill_affinity', '--prune-only', stdout=StringIO())
+        self.assertEqual(list(Affinity.objects.values_list('author_id', flat=True)), [self.active.id])
+
+    def test_feed_takes_the_newest_posts_per_affinity_author(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        response = client.get('/api/feed/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post['id'] for post in response.data['results']], [post.id for post in self.posts[:-3:-1]])
+
+
+class SearchCursorTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('searcher', 'searcher@example.com', 'password')
+        posts = [Post.objects.create(user=user, text=f'hello number {index}') for index in range(25)]
+        search.get_search_backend().index([(post.id, post.text) for post in posts])
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_pages_follow_the_cursor(self):
+        seen = []
+        url = '/api/search/?q=hello'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [post['id'] for post in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(set(seen)))
+        self.assertEqual(len(seen), 25)
+
+    def test_malformed_cursors_are_rejected(self):
+        for position in ({'t': 1}, [1.5], ['1.5', 2], [1.5, 2.5], [1.5, True], [1.5, 2, 3]):
+            with self.subTest(position=position):
+                response = self.client.get('/api/search/', {'q': 'hello', 'cursor': encode_position(position)})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/search/', {'q': 'hello', 'cursor': 'not base64!'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_hits_match_an_unpaged_ranking(self):
+        backend = search.get_search_backend()
+        everything = backend.search('number', limit=100)
+        paged, after = [], None
+        while True:
+            hits = backend.search('number', after=after, limit=4)
+            if not hits:
+                break
+            paged += hits
+            after = hits[-1][1]
+        self.assertEqual(paged, everything)
+        self.assertEqual(len(everything), 25)
+        self.assertEqual(everything, sorted(everything, key=lambda hit: hit[1]))
+
+    @override_settings(SEARCH_MAX_CANDIDATES=10)
+    def test_only_the_newest_candidates_are_ranked(self):
+        hits = search.get_search_backend().search('hello', limit=100)
+        newest = Post.objects.order_by('-id').values_list('id', flat=True)[:10]
+        self.assertEqual({post_id for post_id, _ in hits}, set(newest))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('paged', 'paged@example.com', 'password')
+        self.posts = [Post.objects.create(user=user, text=f'post {index}') for index in range(7)]
+        # Three pairs share a timestamp, so only the id orders them
+        now = timezone.now()
+        for index, post in enumerate(self.posts):
+            Post.objects.filter(pk=post.pk).update(created_at=now - timedelta(minutes=index // 2))
+        self.expected = [post.id for post in reversed(self.posts[:2])] + [
+            post.id for pair in range(1, 4) for post in reversed(self.posts[pair * 2:pair * 2 + 2])
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['results']]
+
+    def test_ties_are_broken_by_id(self):
+        seen = []
+        response = self.client.get('/api/posts/', {'page_size': 2})
+        while True:
+            seen += self.ids(response)
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_links_walk_back(self):
+        first = self.client.get('/api/posts/', {'page_size': 3})
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        third = self.client.get(second.data['next'])
+        self.assertEqual(self.ids(third), self.expected[6:])
+        self.assertIsNone(third.data['next'])
+
+        back = self.client.get(third.data['previous'])
+        self.assertEqual(self.ids(back), self.ids(second))
+        back = self.client.get(back.data['previous'])
+        self.assertEqual(self.ids(back), self.expected[:3])
+        self.assertIsNone(back.data['previous'])
+        self.assertEqual(self.ids(self.client.get(back.data['next'])), self.ids(second))
+
+    def test_tampered_cursors_are_rejected(self):
+        created_at = timezone.now().isoformat()
+        for payload in ({'k': [created_at]}, {'k': [created_at, 1, 2]}, {'k': ['yesterday', 1]},
+                        {'k': [created_at, 'x']}, {'r': 1}, [created_at, 1]):
+            with self.subTest(payload=payload):
+                response = self.client.get('/api/posts/', {'cursor': encode_position(payload)})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {'error': 'Invalid cursor'})
+        self.assertEqual(self.client.get('/api/posts/', {'cursor': 'not base64!'}).status_code, 400)
+
+
+class ArchiveFallbackPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('veteran', 'veteran@example.com', 'password')
+        self.viewer = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.posts = [Post.objects.create(user=self.author, text=f'post {index}') for index in range(5)]
+        self.newest_first = [post.id for post in reversed(self.posts)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def archive_oldest(self, count):
+        for index, post in enumerate(self.posts[:count]):
+            Post.objects.filter(pk=post.pk).update(created_at=timezone.now() - timedelta(days=400 - index))
+        self.assertEqual(archive.archive_posts(), count)
+
+    def test_empty_archive_is_not_queried(self):
+        # The first request looks the boundary up and caches that it's empty
+        self.client.get('/api/posts/')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/posts/')
+        self.assertEqual([post['id'] for post in response.data['results']], self.newest_first)
+        self.assertFalse([query for query in captured if 'archived' in query['sql']])
+
+    def test_pages_cross_the_boundary(self):
+        self.archive_oldest(3)
+        seen = []
+        url = '/api/posts/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.append([post['id'] for post in response.data['results']])
+            url = response.data['next']
+        # The second page holds the newest archived post next to the oldest hot one
+        self.assertEqual(seen, [self.newest_first[:2], self.newest_first[2:4], self.newest_first[4:]])
+        back = self.client.get(response.data['previous'])
+        self.assertEqual([post['id'] for post in back.data['results']], self.newest_first[2:4])
+
+    def test_likes_on_archived_posts(self):
+        Like.objects.create(user=self.viewer, post=self.posts[0])
+        Like.objects.create(user=self.viewer, post=self.posts[4])
+        self.archive_oldest(2)
+        self.assertEqual(
+            archive.liked_post_ids(self.viewer, [post.id for post in self.posts]), {self.posts[0].id, self.posts[4].id}
+        )
+        self.client.force_authenticate(self.viewer)
+        response = self.client.get(f'/api/users/{self.author.username}/')
+        liked = {post['id']: post['is_liked'] for post in response.data['posts']['results']}
+        self.assertEqual(liked, {post_id: post_id in (self.posts[0].id, self.posts[4].id) for post_id in self.newest_first})
+
+
+class RankedFeedCursorTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('ranker', 'ranker@example.com', 'password')
+        author = User.objects.create_user('ranked', 'ranked@example.com', 'password')
+        Follow.objects.create(follower=self.reader, followee=author)
+        for index in range(25):
+            Post.objects.create(user=author, text=f'post {index}')
+        # Snapshots are whole seconds; keep the posts clear of the current one
+        Post.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_pages_follow_the_cursor(self):
+        first = self.client.get('/api/feed/', {'mode': 'ranked'})
+        self.assertEqual(first.status_code, 200)
+        second = self.client.get(first.data['next'])
+        self.assertEqual(second.status_code, 200)
+        ids = [post['id'] for post in first.data['results'] + second.data['results']]
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_malformed_cursors_are_rejected(self):
+        for position in ({'t': 1, 'after': [1.5, 2]}, [1, 1.5], [1.5, 1.5, 2], [1, 'x', 2], [10 ** 20, 1.5, 2]):
+            with self.subTest(position=position):
+                response = self.client.get('/api/feed/', {'mode': 'ranked', 'cursor': encode_position(position)})
+                self.assertEqual(response.status_code, 400)
+
+
+class FollowSuggestionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            name: User.objects.create_user(name, f'{name}@example.com', 'password')
+            for name in ('alice', 'mid', 'bob', 'carol', 'dave', 'erin', 'newbie', 'xavier', 'yvonne')
+        }
+        for follower, followees in {
+            'alice': ['mid'],
+            'mid': ['bob', 'erin'],
+            'bob': ['carol', 'dave'],
+            'xavier': ['alice', 'newbie'],
+            'yvonne': ['alice', 'bob', 'newbie'],
+        }.items():
+            for followee in followees:
+                Follow.objects.create(follower=cls.users[follower], followee=cls.users[followee])
+
+    def stored(self):
+        return {
+            (user_id, candidate_id): (round(score, 9), mutuals)
+            for user_id, candidate_id, score, mutuals
+            in FollowSuggestion.objects.values_list('user_id', 'candidate_id', 'score', 'mutuals')
+        }
+
+    def computed(self):
+        suggestions.compute_all()
+        return self.stored()
+
+    def bulk_follow(self, name, followees, action='follow'):
+        client = APIClient()
+        client.force_authenticate(self.users[name])
+        response = client.post(
+            '/api/follows/bulk/', {'user_ids': [self.users[followee].id for followee in followees], 'action': action},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_matches_compute_all(self):
+        suggestions.compute_all()
+        self.bulk_follow('newbie', ['bob', 'mid'])
+        self.assertEqual(self.stored(), self.computed())
+
+    def test_unfollow_restores_compute_all(self):
+        before = self.computed()
+        # Alice already reaches bob through mid; following bob drops him
+        self.assertIn((self.users['alice'].id, self.users['bob'].id), before)
+        self.bulk_follow('alice', ['bob', 'carol'])
+        self.assertNotIn((self.users['alice'].id, self.users['bob'].id), self.stored())
+        self.bulk_follow('alice', ['bob', 'carol'], action='unfollow')
+        self.assertEqual(self.stored(), before)
+
+    def test_unfollow_only_touches_the_followers_rows(self):
+        suggestions.compute_all()
+        # A row of someone who doesn't follow alice, low enough to look spent
+        unrelated = FollowSuggestion.objects.create(
+            user=self.users['erin'], candidate=self.users['dave'], score=suggestions.MIN_SCORE / 2, mutuals=1
+        )
+        self.bulk_follow('alice', ['dave'])
+        self.bulk_follow('alice', ['dave'], action='unfollow')
+        self.assertTrue(FollowSuggestion.objects.filter(pk=unrelated.pk).exists())
+        self.assertFalse(FollowSuggestion.objects.filter(candidate=self.users['dave'], score__lte=0).exists())
+
+    @skipUnless(suggestions.np is not None, "NumPy isn't installed")
+    def test_numpy_and_pure_python_agree(self):
+        graph = suggestions.FollowGraph.load()
+        arrays = graph._arrays
+        for row in range(len(graph.user_ids)):
+            graph._arrays = arrays
+            fast = graph.candidates(row, 50)
+            graph._arrays = None
+            pure = graph.candidates(row, 50)
+            self.assertEqual([(candidate, mutuals) for candidate, _, mutuals in fast],
+                             [(candidate, mutuals) for candidate, _, mutuals in pure])
+            for (_, fast_score, _), (_, pure_score, _) in zip(fast, pure):
+                self.assertAlmostEqual(fast_score, pure_score)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user('token', 'token@example.com', 'password')
+
+    def test_string_claims_share_the_cache_entry(self):
+        token = AccessToken(str(AccessToken.for_user(self.user)))
+        self.assertEqual(CachedJWTAuthentication().get_user(token), self.user)
+        self.assertIsNotNone(user_cache.peek(self.user.id))
+        self.assertIsNotNone(user_cache.peek(str(self.user.id)))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(user_cache.peek(str(self.user.id)))
+        with self.assertRaises(AuthenticationFailed):
+            CachedJWTAuthentication().get_user(token)
+
+    def test_revoked_tokens_are_rejected(self):
+        # simplejwt rebinds api_settings on setting_changed, so patch the
+        # instance its modules imported
+        with mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = AccessToken(str(AccessToken.for_user(self.user)))
+            self.assertEqual(CachedJWTAuthentication().get_user(token), self.user)
+            self.user.set_password('changed')
+            self.user.save()
+            with self.assertRaises(AuthenticationFailed):
+                CachedJWTAuthentication().get_user(token)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class WebSocketAuthTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        token_cache.clear()
+        self.user = User.objects.create_user('socket', 'socket@example.com', 'password')
+        self.token = str(AccessToken.for_user(self.user))
+
+    async def test_subprotocol_token_authenticates(self):
+        application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+        communicator = WebsocketCommunicator(application, '/ws/feed/', subprotocols=['access_token', self.token])
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'access_token')
+        # Only an authenticated socket joins the user's group
+        await get_channel_layer().group_send(f'user_{self.user.id}', {'type': 'feed_update', 'content': {'id': 1}})
+        frame = json.loads(await communicator.receive_from())
+        self.assertEqual(frame['posts'], [{'id': 1}])
+        await communicator.disconnect()
+
+    async def test_expired_tokens_are_rejected_when_cached(self):
+        self.assertEqual(await get_user_for_token(self.token), self.user)
+        later = timezone.now() + timedelta(days=365)
+        with mock.patch('posts.ws_auth.time.time', return_value=later.timestamp()), \
+                mock.patch('rest_framework_simplejwt.tokens.aware_utcnow', return_value=later):
+            self.assertIsNone(token_cache.get(self.token))
+            self.assertFalse((await get_user_for_token(self.token)).is_authenticated)
+
+    async def test_revoked_tokens_are_rejected_when_cached(self):
+        with mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = str(AccessToken.for_user(self.user))
+            self.assertEqual(await get_user_for_token(token), self.user)
+            self.user.set_password('changed')
+            await self.user.asave()
+            self.assertFalse((await get_user_for_token(token)).is_authenticated)
+
+    async def test_deactivation_drops_cache_entries(self):
+        self.assertEqual(await get_user_for_token(self.token), self.user)
+        self.assertIsNotNone(token_cache.get(self.token))
+        self.user.is_active = False
+        await self.user.asave()
+        self.assertIsNone(token_cache.get(self.token))
+        self.assertFalse((await get_user_for_token(self.token)).is_authenticated)
+
+
+@override_settings(LIKE_COUNTER_SHARDS=4)
+class LikeCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user('liked', 'liked@example.com', 'password')
+        self.posts = [Post.objects.create(user=author, text=f'post {index}') for index in range(3)]
+        self.post = self.posts[0]
+
+    def likes_count(self, post):
+        return Post.objects.get(pk=post.pk).likes_count
+
+    def test_increments_are_pending_until_flushed(self):
+        for _ in range(10):
+            counters.increment_likes(self.post.id, 1)
+        counters.increment_likes(self.post.id, -1)
+        counters.increment_likes_many([post.id for post in self.posts], 1)
+        self.assertEqual(self.likes_count(self.post), 0)
+        self.assertEqual(counters.like_count(Post.objects.get(pk=self.post.pk)), 10)
+        self.assertLessEqual(LikeCounterShard.objects.filter(post=self.post).count(), 4)
+
+        self.assertEqual(counters.flush_like_counters(batch_size=2), 3)
+        self.assertEqual([self.likes_count(post) for post in self.posts], [10, 1, 1])
+        self.assertFalse(LikeCounterShard.objects.exists())
+
+    def test_fold_clamps_at_zero(self):
+        Post.objects.filter(pk=self.post.pk).update(likes_count=1)
+        counters.increment_likes(self.post.id, -3)
+        counters.flush_like_counters_for([self.post.id])
+        self.assertEqual(self.likes_count(self.post), 0)
+
+    def test_reconcile_recounts_likes_and_drops_shards(self):
+        fans = [User.objects.create_user(f'fan{index}', f'fan{index}@example.com', 'password') for index in range(2)]
+        Like.objects.bulk_create([Like(user=fan, post=self.post) for fan in fans])
+        Post.objects.filter(pk=self.posts[1].pk).update(likes_count=5)
+        counters.increment_likes(self.post.id, 7)
+        self.assertEqual(counters.reconcile_like_counts(batch_size=2), 3)
+        self.assertEqual([self.likes_count(post) for post in self.posts], [2, 0, 0])
+        self.assertFalse(LikeCounterShard.objects.exists())
+
+    def test_trending_sync_flushes_counters(self):
+        counters.increment_likes(self.post.id, 2)
+        with mock.patch.object(trending.TrendingTracker, 'start'):
+            trending.TrendingTracker().reload()
+        self.assertEqual(self.likes_count(self.post), 2)
+        # Other processes skip the flush until LIKE_COUNTER_FLUSH_SECONDS pass
+        counters.increment_likes(self.post.id, 1)
+        with mock.patch.object(trending.TrendingTracker, 'start'):
+            trending.TrendingTracker().reload()
+        self.assertEqual(self.likes_count(self.post), 2)
+
+
+class TrendingTrackerTests(TestCase):
+    def test_top_only_reads_memory(self):
+        author = User.objects.create_user('popular', 'popular@example.com', 'password')
+        first, second = [Post.objects.create(user=author, text=text) for text in ('first', 'second')]
+        with mock.patch.object(trending.TrendingTracker, 'start') as start:
+            tracker = trending.TrendingTracker()
+            tracker.record(first.id, 3)
+            start.assert_called_once()
+            # What the background thread does every refresh_seconds
+            tracker.reload()
+            with self.assertNumQueries(0):
+                self.assertEqual(tracker.top(5), [(first.id, 3)])
+                tracker.record(second.id, 5)
+                self.assertEqual(tracker.top(5), [(second.id, 5), (first.id, 3)])
+        self.assertEqual(tracker.stats()['pending_increments'], 1)
+
+
+class ImageUploadTests(SimpleTestCase):
+    PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 64
+
+    class RenderingPool:
+        """Stands in for the process pool: 'renders' every size at once."""
+
+        def __init__(self):
+            self.submitted = []
+
+        def submit(self, render, path, sizes):
+            self.submitted.append(set(sizes))
+            future = Future()
+            future.set_result({name: b'webp' for name in sizes})
+            return future
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.uploads = tempfile.TemporaryDirectory()
+        self.addCleanup(self.uploads.cleanup)
+        patcher = mock.patch.object(tempfile, 'tempdir', self.uploads.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self):
+        return images.process_upload(SimpleUploadedFile('image.png', self.PNG))
+
+    def test_feed_variant_exists_when_the_upload_returns(self):
+        pool = self.RenderingPool()
+        with mock.patch.object(images, 'PIL', object()), mock.patch.object(images, 'get_pool', return_value=pool):
+            result = self.upload()
+        self.assertEqual(pool.submitted, [{'feed'}, {'thumb', 'full'}])
+        self.assertTrue(images.default_storage.exists(images.variant_name(result['hash'], 'feed')))
+        self.assertEqual(set(result['variants']), {'thumb', 'feed', 'full'})
+        self.assertEqual(os.listdir(self.uploads.name), [])
+
+    def test_only_the_original_without_pillow(self):
+        with mock.patch.object(images, 'PIL', None):
+            result = self.upload()
+        self.assertEqual(result['variants'], {})
+        self.assertTrue(result['public_url'].endswith('/original.png'))
+        self.assertEqual(os.listdir(self.uploads.name), [])
+
+    def test_temp_file_is_removed_when_storage_fails(self):
+        with mock.patch.object(images.default_storage, 'save', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.upload()
+        self.assertEqual(os.listdir(self.uploads.name), [])
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.source = User.objects.create_user('mover', 'mover@example.com', 'password')
+        self.posts = [Post.objects.create(user=self.source, text=f'moving {index}') for index in range(3)]
+        Post.objects.filter(pk=self.posts[0].pk).update(created_at=timezone.now() - timedelta(days=30))
+        self.target = User.objects.create_user('moved', 'moved@example.com', 'password')
+        self.fan = User.objects.create_user('fan', 'fan@example.com', 'password')
+        Follow.objects.create(follower=self.fan, followee=self.target)
+
+    def test_round_trip_keeps_timestamps_and_reaches_timelines(self):
+        lines = b''.join(export.stream(self.source)).splitlines()
+        _, counts = export.import_lines(lines, username='moved')
+        self.assertEqual(counts['posts'], 3)
+
+        original = sorted(Post.objects.filter(user=self.source).values_list('text', 'created_at', 'updated_at'))
+        imported = sorted(Post.objects.filter(user=self.target).values_list('text', 'created_at', 'updated_at'))
+        self.assertEqual(imported, original)
+        self.assertTrue(Post._meta.get_field('created_at').auto_now_add)
+        self.assertTrue(Post._meta.get_field('updated_at').auto_now)
+
+        imported_ids = set(Post.objects.filter(user=self.target).values_list('id', flat=True))
+        self.assertEqual(set(timeline.read_sources(self.fan.id)[0]), imported_ids)
+        self.assertEqual(set(timeline.read_sources(self.target.id)[0]), imported_ids)
+
+    def imported_rows(self):
+        return (
+            sorted(Post.objects.filter(user=self.target).values_list('text', 'created_at')),
+            sorted(Like.objects.filter(user=self.target).values_list('post_id', flat=True)),
+            sorted(Comment.objects.filter(user=self.target).values_list('post_id', 'content', 'created_at')),
+            sorted(Follow.objects.filter(follower=self.target).values_list('followee_id', flat=True)),
+            sorted(Post.objects.values_list('id', 'likes_count', 'comments_count')),
+        )
+
+    def test_importing_twice_changes_nothing(self):
+        liked = Post.objects.create(user=self.fan, text='liked')
+        Like.objects.create(user=self.source, post=liked)
+        Comment.objects.create(user=self.source, post=liked, content='first!')
+        Comment.objects.create(user=self.source, post=self.posts[1], content='replying to myself')
+        Follow.objects.create(follower=self.source, followee=self.fan)
+        lines = b''.join(export.stream(self.source)).splitlines()
+        kinds = ('posts', 'likes', 'comments', 'follows')
+
+        _, counts = export.import_lines(lines, username='moved', batch_size=2)
+        self.assertEqual([counts[kind] for kind in kinds], [3, 1, 2, 1])
+        counters.flush_like_counters()
+        rows = self.imported_rows()
+
+        _, counts = export.import_lines(lines, username='moved', batch_size=2)
+        self.assertEqual([counts[kind] for kind in kinds], [0, 0, 0, 0])
+        counters.flush_like_counters()
+        self.assertEqual(self.imported_rows(), rows)
+
+
+
+class UnixSocketChannelLayerTests(SimpleTestCase):
+    # A peer process that joins a group, then dies without cleaning up
+    PEER = (
+        "import asyncio, os, sys\n"
+        "from posts.layers import UnixSocketChannelLayer\n"
+        "async def main():\n"
+        "    layer = UnixSocketChannelLayer(path=sys.argv[1])\n"
+        "    channel = await layer.new_channel()\n"
+        "    await layer.group_add('peers', channel)\n"
+        "    print(channel, flush=True)\n"
+        "    await asyncio.to_thread(sys.stdin.readline)\n"
+        "    os._exit(0)\n"
+        "asyncio.run(main())\n"
+    )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    @contextlib.asynccontextmanager
+    async def layers(self, count):
+        layers = [UnixSocketChannelLayer(path=self.path) for _ in range(count)]
+        try:
+            yield layers
+        finally:
+            for layer in layers:
+                await layer.close()
+
+    async def test_send_and_receive_across_processes(self):
+        async with self.layers(2) as (receiver, sender):
+            channel = await receiver.new_channel()
+            await sender.send(channel, {'type': 'hello', 'data': b'\x00\x01'})
+            message = await asyncio.wait_for(receiver.receive(channel), 2)
+            self.assertEqual(message, {'type': 'hello', 'data': b'\x00\x01'})
+
+    async def test_group_add_and_discard(self):
+        async with self.layers(2) as (receiver, sender):
+            first, second = await receiver.new_channel(), await receiver.new_channel()
+            await receiver.group_add('room', first)
+            await receiver.group_add('room', second)
+            await sender.group_send('room', {'type': 'one'})
+            for channel in (first, second):
+                self.assertEqual(await asyncio.wait_for(receiver.receive(channel), 2), {'type': 'one'})
+
+            await receiver.group_discard('room', second)
+            await sender.group_send('room', {'type': 'two'})
+            self.assertEqual(await asyncio.wait_for(receiver.receive(first), 2), {'type': 'two'})
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(receiver.receive(second), 0.2)
+
+    async def test_dead_peer_is_forgotten(self):
+        async with self.layers(1) as (sender,):
+            peer = subprocess.Popen(
+                [sys.executable, '-c', self.PEER, self.path],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.dirname(__file__)),
+            )
+            self.addCleanup(peer.kill)
+            channel = await asyncio.to_thread(peer.stdout.readline)
+            process = sender._process_of(channel.strip())
+            await sender.group_send('peers', {'type': 'alive'})
+            self.assertIn(process, sender._writers)
+
+            peer.stdin.write('\n')
+            peer.stdin.close()
+            await asyncio.to_thread(peer.wait)
+            await sender.group_send('peers', {'type': 'dead'})
+            self.assertNotIn(process, sender._writers)
+            self.assertEqual(sender.registry.members('peers', 0), [])
+            self.assertFalse(os.path.exists(sender._socket_of(process)))
+
+
+class WriteQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('writer', 'writer@example.com', 'password')
+
+    def create(self, text, fail=False):
+        Post.objects.create(user=self.author, text=text)
+        if fail:
+            raise ValueError(text)
+        return text
+
+    def test_failing_job_only_rolls_back_its_savepoint(self):
+        writer = writequeue.WriteQueue(batch_size=8)
+        futures = [Future() for _ in range(3)]
+        # Queue every job before the thread starts so they share one batch
+        for future, (text, fail) in zip(futures, [('first', False), ('broken', True), ('third', False)]):
+            writer._queue.put((self.create, (text,), {'fail': fail}, future))
+        writer.start()
+        self.assertEqual(futures[0].result(5), 'first')
+        with self.assertRaisesMessage(ValueError, 'broken'):
+            futures[1].result(5)
+        self.assertEqual(futures[2].result(5), 'third')
+        self.assertEqual(writer.batches, 1)
+        self.assertEqual(set(Post.objects.values_list('text', flat=True)), {'first', 'third'})
+
+    def test_nested_jobs_run_inline(self):
+        writer = writequeue.WriteQueue()
+
+        def outer():
+            return writer.run(lambda: threading.current_thread().name)
+        self.assertEqual(writer.run(outer), 'sqlite-writer')
+        self.assertEqual(writer.batches, 1)
+
+    def test_jobs_inside_a_transaction_run_inline(self):
+        writer = writequeue.WriteQueue()
+        with transaction.atomic():
+            self.assertEqual(writer.run(self.create, 'inline'), 'inline')
+        self.assertIsNone(writer._thread)
+        self.assertTrue(Post.objects.filter(text='inline').exists())
+
+
+class PendingFanoutTests(TestCase):
+    class RecordingDispatcher(fanout.FanoutDispatcher):
+        def submit(self, post, payload):
+            self.submitted.append((post.id, payload))
+
+    def setUp(self):
+        author = User.objects.create_user('poster', 'poster@example.com', 'password')
+        self.post = Post.objects.create(user=author, text='hello')
+        self.dispatcher = self.RecordingDispatcher()
+        self.dispatcher.submitted = []
+
+    def test_enqueue_records_the_post_in_its_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            fanout.enqueue(self.post, {'id': self.post.id})
+        self.assertTrue(PendingFanout.objects.filter(post=self.post).exists())
+        self.assertEqual(len(callbacks), 1)
+
+    def test_resume_claims_stale_rows_once(self):
+        PendingFanout.objects.create(post=self.post)
+        self.assertEqual(self.dispatcher.resume(older_than=60), 0)
+
+        self.assertEqual(self.dispatcher.resume(older_than=0), 1)
+        self.assertEqual(self.dispatcher.submitted, [(self.post.id, None)])
+        # The claim moved queued_at, so a sweep right after leaves it alone
+        self.assertEqual(self.dispatcher.resume(older_than=60), 0)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class FeedConsumerFlowControlTests(SimpleTestCase):
+    class Consumer(FeedConsumer):
+        coalesce_seconds = 0.01
+        max_unacked = 2
+        queue_size = 3
+
+    async def connect(self, **attrs):
+        consumer = type('Consumer', (self.Consumer,), attrs)
+        communicator = WebsocketCommunicator(consumer.as_asgi(), '/ws/feed/')
+        communicator.scope['user'] = SimpleNamespace(id=7, is_authenticated=True)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def publish(self, post_id):
+        await get_channel_layer().group_send('user_7', {'type': 'feed_update', 'content': {'id': post_id}})
+        # One event per coalescing window, so each would be its own frame
+        await asyncio.sleep(0.05)
+
+    async def test_sends_pause_until_acknowledged(self):
+        communicator = await self.connect()
+        for post_id in range(1, 4):
+            await self.publish(post_id)
+        first = json.loads(await communicator.receive_from())
+        second = json.loads(await communicator.receive_from())
+        self.assertEqual([first['seq'], second['seq']], [1, 2])
+        self.assertTrue(await communicator.receive_nothing(0.1))
+
+        await communicator.send_to(text_data=json.dumps({'type': 'ack', 'seq': 2}))
+        third = json.loads(await communicator.receive_from())
+        self.assertEqual((third['seq'], third['posts']), (3, [{'id': 3}]))
+        await communicator.disconnect()
+
+    async def test_unacknowledging_client_hits_the_slow_consumer_policy(self):
+        communicator = await self.connect(slow_consumer_policy='disconnect')
+        for post_id in range(1, 7):
+            await self.publish(post_id)
+        frames = [json.loads(await communicator.receive_from()) for _ in range(3)]
+        self.assertEqual([frame['type'] for frame in frames], ['batch', 'batch', 'resync'])
+        self.assertEqual(frames[-1]['last_post_id'], 2)
+        self.assertEqual((await communicator.receive_output())['type'], 'websocket.close')
@@ -0,0 +1,323 @@
+# posts/timeline.py
+"""
+Materialized home timelines (fan-out-on-write).
+
+When a post is created its ID is pushed into the bounded timeline of every
+follower, so reading a feed is a single range fetch instead of a query over
+the reader's whole follow graph. Authors with more followers than
+``TIMELINE_FANOUT_LIMIT`` are not fanned out; they are registered as "pull"
+authors and merged into their followers' feeds at read time.
+
+Reads never write. Pushes may leave a timeline longer than
+``TIMELINE_MAX_LENGTH`` (``fetch`` returns only the newest entries), and
+``manage.py maintain_timelines`` trims the overflow. The same command
+demotes pull authors whose follower count has dropped back under the limit
+and backfills their recent posts into their followers' timelines.
+
+The storage is pluggable through ``settings.TIMELINE_BACKEND``.
+"""
+import bisect
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils.module_loading import import_string
+
+from .models import Follow, Post, TimelineEntry, TimelinePullAuthor
+
+DEFAULT_BACKEND = 'posts.timeline.DatabaseTimelineBackend'
+
+
+def max_length():
+    return getattr(settings, 'TIMELINE_MAX_LENGTH', 800)
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 10000)
+
+
+class BaseTimelineBackend:
+    """Interface every timeline store implements."""
+
+    def push(self, post_id, author_id, created_at, user_ids):
+        """Insert one post into the timelines of ``user_ids``."""
+        raise NotImplementedError
+
+    def backfill(self, user_id, entries):
+        """Insert ``(post_id, author_id, created_at)`` entries into one timeline."""
+        raise NotImplementedError
+
+    def fetch(self, user_id):
+        """Return up to ``TIMELINE_MAX_LENGTH`` post IDs, newest first."""
+        raise NotImplementedError
+
+    def remove_authors(self, user_id, author_ids):
+        """Drop every post by ``author_ids`` from one timeline."""
+        raise NotImplementedError
+
+    def reset(self, user_id):
+        """Empty one timeline."""
+        raise NotImplementedError
+
+    def trim(self, user_ids):
+        """Drop entries past ``TIMELINE_MAX_LENGTH`` from the timelines of ``user_ids``."""
+        raise NotImplementedError
+
+    def add_pull_author(self, author_id):
+        raise NotImplementedError
+
+    def remove_pull_author(self, author_id):
+        raise NotImplementedError
+
+    def pull_author_ids(self, author_ids=None):
+        """The pull authors among ``author_ids`` (IDs or a values_list subquery), or all of them."""
+        raise NotImplementedError
+
+
+class DatabaseTimelineBackend(BaseTimelineBackend):
+    """Stores timelines in the ``TimelineEntry`` table."""
+
+    batch_size = 1000
+
+    def push(self, post_id, author_id, created_at, user_ids):
+        entries = [
+            TimelineEntry(user_id=user_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for user_id in user_ids
+        ]
+        TimelineEntry.objects.bulk_create(entries, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def backfill(self, user_id, entries):
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, post_id=post_id, author_id=author_id, created_at=created_at)
+                for post_id, author_id, created_at in entries
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        self.trim([user_id])
+
+    def fetch(self, user_id):
+        return list(
+            TimelineEntry.objects.filter(user_id=user_id)
+            .order_by('-created_at', '-post_id')
+            .values_list('post_id', flat=True)[:max_length()]
+        )
+
+    def remove_authors(self, user_id, author_ids):
+        TimelineEntry.objects.filter(user_id=user_id, author_id__in=author_ids).delete()
+
+    def reset(self, user_id):
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+
+    def trim(self, user_ids):
+        overflow = list(
+            TimelineEntry.objects.filter(user_id__in=user_ids)
+            .annotate(position=Window(
+                RowNumber(),
+                partition_by=[F('user_id')],
+                order_by=[F('created_at').desc(), F('post_id').desc()],
+            ))
+            .filter(position__gt=max_length())
+            .values_list('id', flat=True)
+        )
+        for start in range(0, len(overflow), self.batch_size):
+            TimelineEntry.objects.filter(id__in=overflow[start:start + self.batch_size]).delete()
+        return len(overflow)
+
+    def add_pull_author(self, author_id):
+        TimelinePullAuthor.objects.get_or_create(user_id=author_id)
+
+    def remove_pull_author(self, author_id):
+        TimelinePullAuthor.objects.filter(user_id=author_id).delete()
+
+    def pull_author_ids(self, author_ids=None):
+        pull_authors = TimelinePullAuthor.objects.all()
+        if author_ids is not None:
+            pull_authors = pull_authors.filter(user_id__in=author_ids)
+        return set(pull_authors.values_list('user_id', flat=True))
+
+
+class InMemoryTimelineBackend(BaseTimelineBackend):
+    """Process-local timelines, for tests and single-process development."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user_id -> list of (-timestamp, -post_id, author_id), kept sorted newest first
+        self._timelines = {}
+        self._pull_authors = set()
+
+    def _insert(self, user_id, post_id, author_id, created_at):
+        timeline = self._timelines.setdefault(user_id, [])
+        key = (-created_at.timestamp(), -post_id, author_id)
+        index = bisect.bisect_left(timeline, key)
+        if index < len(timeline) and timeline[index][1] == -post_id:
+            return
+        timeline.insert(index, key)
+        del timeline[max_length():]
+
+    def push(self, post_id, author_id, created_at, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._insert(user_id, post_id, author_id, created_at)
+
+    def backfill(self, user_id, entries):
+        with self._lock:
+            for post_id, author_id, created_at in entries:
+                self._insert(user_id, post_id, author_id, created_at)
+
+    def fetch(self, user_id):
+        with self._lock:
+            return [-post_id for _, post_id, _ in self._timelines.get(user_id, [])]
+
+    def remove_authors(self, user_id, author_ids):
+        author_ids = set(author_ids)
+        with self._lock:
+            timeline = self._timelines.get(user_id)
+            if timeline:
+                timeline[:] = [entry for entry in timeline if entry[2] not in author_ids]
+
+    def reset(self, user_id):
+        with self._lock:
+            self._timelines.pop(user_id, None)
+
+    def trim(self, user_ids):
+        # _insert already keeps every timeline bounded
+        return 0
+
+    def add_pull_author(self, author_id):
+        with self._lock:
+            self._pull_authors.add(author_id)
+
+    def remove_pull_author(self, author_id):
+        with self._lock:
+            self._pull_authors.discard(author_id)
+
+    def pull_author_ids(self, author_ids=None):
+        author_ids = None if author_ids is None else set(author_ids)
+        with self._lock:
+            return set(self._pull_authors) if author_ids is None else self._pull_authors & author_ids
+
+    def clear(self):
+        with self._lock:
+            self._timelines.clear()
+            self._pull_authors.clear()
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_timeline_backend():
+    return _load_backend(getattr(settings, 'TIMELINE_BACKEND', DEFAULT_BACKEND))
+
+
+def push_to_author(post):
+    """Put a new post in its author's own timeline, so they read their write immediately."""
+    get_timeline_backend().push(post.id, post.user_id, post.created_at, [post.user_id])
+
+
+def fan_out_post(post, follower_ids):
+    """
+    Push a new post into its followers' timelines. ``follower_ids`` may be a
+    lazy ``values_list`` queryset; it is only loaded when under the limit.
+
+    Returns ``False`` when the author has too many followers and was switched
+    to read-time merging instead.
+    """
+    backend = get_timeline_backend()
+    limit = fanout_limit()
+    if len(follower_ids[:limit + 1]) > limit:
+        backend.add_pull_author(post.user_id)
+        return False
+
+    backend.push(post.id, post.user_id, post.created_at, follower_ids)
+    return True
+
+
+def on_follow(follower_id, followee_id):
+    """Seed a new follower's timeline with the followee's recent posts."""
+    on_follow_many(follower_id, [followee_id])
+
+
+def on_follow_many(follower_id, followee_ids):
+    backend = get_timeline_backend()
+    followee_ids = set(followee_ids)
+    followee_ids -= backend.pull_author_ids(followee_ids)
+    if not followee_ids:
+        return
+    # The timeline is bounded, so only the newest posts across all new followees matter
+    recent = (
+        Post.objects.filter(user_id__in=followee_ids)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'user_id', 'created_at')[:max_length()]
+    )
+    backend.backfill(follower_id, list(recent))
+
+
+def on_unfollow(follower_id, followee_id):
+    on_unfollow_many(follower_id, [followee_id])
+
+
+def on_unfollow_many(follower_id, followee_ids):
+    get_timeline_backend().remove_authors(follower_id, followee_ids)
+
+
+def read_sources(user_id):
+    """
+    Return ``(post_ids, pull_user_ids)`` for a user's home feed: the
+    materialized timeline plus the followed authors merged at read time.
+    """
+    backend = get_timeline_backend()
+    post_ids = backend.fetch(user_id)
+    pull_ids = backend.pull_author_ids(
+        Follow.objects.filter(follower_id=user_id).values_list('followee_id', flat=True)
+    )
+    return post_ids, pull_ids
+
+
+def _recent_posts(author_id):
+    return list(
+        Post.objects.filter(user_id=author_id).order_by('-created_at', '-id')
+        .values_list('id', 'user_id', 'created_at')[:max_length()]
+    )
+
+
+def _backfill_followers(backend, author_id, recent):
+    followers = 0
+    for follower_id in Follow.objects.filter(followee_id=author_id).values_list('follower_id', flat=True).iterator():
+        backend.backfill(follower_id, recent)
+        followers += 1
+    return followers
+
+
+def demote_pull_author(author_id):
+    """
+    Fan an author out on write again: their recent posts go into every
+    follower's timeline. Returns the number of followers backfilled.
+    """
+    backend = get_timeline_backend()
+    backend.remove_pull_author(author_id)
+    return _backfill_followers(backend, author_id, _recent_posts(author_id))
+
+
+def backfill_author(author_id):
+    """
+    Put an author's recent posts into their own and their followers'
+    timelines, for posts written without fan-out (an account import).
+    Authors over the fan-out limit become pull authors instead. Returns the
+    number of followers backfilled.
+    """
+    backend = get_timeline_backend()
+    recent = _recent_posts(author_id)
+    backend.backfill(author_id, recent)
+    if backend.pull_author_ids([author_id]):
+        return 0
+    limit = fanout_limit()
+    if len(Follow.objects.filter(followee_id=author_id)[:limit + 1]) > limit:
+        backend.add_pull_author(author_id)
+        return 0
+    return _backfill_followers(backend, author_id, recent)
@@ -0,0 +1,315 @@
+# posts/trending.py
+"""
+Trending posts over a sliding window.
+
+Likes and comments add ``TRENDING['like_weight']`` / ``['comment_weight']``
+to a post once their transaction commits (unlikes and deleted comments
+subtract it). Each process keeps:
+
+* pending increments per (post, minute), written to ``TrendingBucket``
+  minute rows every ``flush_seconds`` with a few set-based statements;
+* every post's total over the window, reloaded from the buckets every
+  ``refresh_seconds`` and updated in place by local events in between;
+* the top ``top_k`` posts, maintained incrementally from those updates. A
+  full pass over the totals happens only after a reload or when a top post
+  loses score, so ``top()`` is O(K).
+
+Flushes, rollups and reloads run on a background ``trending-sync`` thread,
+which also folds the sharded like counters (see posts/counters.py), so
+requests never wait on them; ``top()`` only reads memory (the first call
+in a process waits for the initial load).
+
+Minute buckets from before the current hour are rolled up into hour buckets
+(by one process at a time, at most once a minute), and hour buckets that
+leave the window are deleted. The window is exact to the minute at its
+recent end; at the old end the oldest hour counts until it has fully
+expired. Engagement recorded by other processes shows up after their next
+flush and our next reload, a few seconds later.
+"""
+import heapq
+import logging
+import threading
+import time
+from datetime import timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from . import counters, writequeue
+from .models import Post, TrendingBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRENDING = {
+    'window_hours': 24,
+    'top_k': 50,
+    'like_weight': 1,
+    'comment_weight': 2,
+    'flush_seconds': 2,
+    'refresh_seconds': 5,
+}
+
+ROLLUP_LOCK_KEY = 'trending:rollup'
+
+
+def config():
+    return {**DEFAULT_TRENDING, **getattr(settings, 'TRENDING', {})}
+
+
+def _minute(at):
+    return at.replace(second=0, microsecond=0)
+
+
+def _hour(at):
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def _live(increments):
+    """``{(post_id, start): delta}`` without zero deltas and posts that have been deleted."""
+    existing = set(
+        Post.objects.filter(id__in={post_id for post_id, _ in increments}).values_list('id', flat=True)
+    )
+    return {key: delta for key, delta in increments.items() if delta and key[0] in existing}
+
+
+def _add_to_buckets(resolution, increments):
+    """Add ``{(post_id, start): delta}`` to buckets of ``resolution``, creating them as needed."""
+    if not increments:
+        return
+    TrendingBucket.objects.bulk_create(
+        [TrendingBucket(post_id=post_id, resolution=resolution, start=start) for post_id, start in increments],
+        ignore_conflicts=True,
+    )
+    # Most increments are +1 in the current minute, so this is usually one UPDATE
+    groups = {}
+    for (post_id, start), delta in increments.items():
+        groups.setdefault((start, delta), []).append(post_id)
+    for (start, delta), post_ids in groups.items():
+        TrendingBucket.objects.filter(resolution=resolution, start=start, post_id__in=post_ids).update(
+            score=F('score') + delta
+        )
+
+
+def write_minutes(increments):
+    # Read before the transaction: one that starts with a read and then
+    # writes fails at once on a busy SQLite database instead of waiting
+    increments = _live(increments)
+    with transaction.atomic():
+        _add_to_buckets(TrendingBucket.MINUTE, increments)
+
+
+def rollup(now=None, window_hours=None):
+    """Fold minute buckets from before the current hour into hour buckets and drop expired hours."""
+    now = now or timezone.now()
+    window_hours = config()['window_hours'] if window_hours is None else window_hours
+    hour = _hour(now)
+    with transaction.atomic():
+        minutes = list(
+            TrendingBucket.objects.filter(resolution=TrendingBucket.MINUTE, start__lt=hour)
+            .values_list('id', 'post_id', 'start', 'score')
+        )
+        hours = {}
+        for _, post_id, start, score in minutes:
+            key = (post_id, _hour(start))
+            hours[key] = hours.get(key, 0) + score
+        _add_to_buckets(TrendingBucket.HOUR, _live(hours))
+        minute_ids = [bucket_id for bucket_id, _, _, _ in minutes]
+        for index in range(0, len(minute_ids), 500):
+            TrendingBucket.objects.filter(id__in=minute_ids[index:index + 500]).delete()
+        TrendingBucket.objects.filter(
+            resolution=TrendingBucket.HOUR, start__lt=hour - timedelta(hours=window_hours)
+        ).delete()
+    return len(minutes)
+
+
+def load_totals(now=None, window_hours=None):
+    """``{post_id: score}`` over the window from the stored buckets, positive scores only."""
+    now = now or timezone.now()
+    window_hours = config()['window_hours'] if window_hours is None else window_hours
+    cutoff = now - timedelta(hours=window_hours)
+    return dict(
+        TrendingBucket.objects.filter(
+            Q(resolution=TrendingBucket.HOUR, start__gte=_hour(cutoff))
+            | Q(resolution=TrendingBucket.MINUTE, start__gte=cutoff)
+        )
+        .values('post_id')
+        .annotate(total=Sum('score'))
+        .filter(total__gt=0)
+        .values_list('post_id', 'total')
+    )
+
+
+class TrendingTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held across flush + reload so events can't be counted twice or lost
+        # between writing them and reading the buckets back
+        self._sync_lock = threading.Lock()
+        self._pending = {}
+        self._totals = {}
+        self._top = {}
+        self._top_stale = True
+        self._loaded_at = None
+        self._loaded = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.flushes = 0
+        self.reloads = 0
+
+    def start(self):
+        """Start the background thread that flushes, rolls up and reloads."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sync, name='trending-sync', daemon=True)
+                self._thread.start()
+
+    def _sync(self):
+        while True:
+            cfg = config()
+            try:
+                close_old_connections()
+                with self._lock:
+                    loaded_at = self._loaded_at
+                if loaded_at is None or time.monotonic() - loaded_at >= cfg['refresh_seconds']:
+                    self.reload()
+                else:
+                    self.flush()
+            except DatabaseError:
+                logger.exception("Trending sync failed")
+            finally:
+                close_old_connections()
+            time.sleep(min(cfg['flush_seconds'], cfg['refresh_seconds']))
+
+    def record(self, post_id, delta, at=None):
+        if self._thread is None:
+            self.start()
+        key = (post_id, _minute(at or timezone.now()))
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + delta
+            if self._loaded_at is not None:
+                self._add(post_id, delta)
+
+    def _add(self, post_id, delta):
+        score = self._totals.get(post_id, 0) + delta
+        if score > 0:
+            self._totals[post_id] = score
+        else:
+            self._totals.pop(post_id, None)
+        if self._top_stale:
+            return
+        if post_id in self._top:
+            if delta < 0:
+                # A post outside the top may now outrank it
+                self._top_stale = True
+            else:
+                self._top[post_id] = score
+        elif score > 0:
+            if len(self._top) < config()['top_k']:
+                self._top[post_id] = score
+            else:
+                lowest = min(self._top.items(), key=itemgetter(1, 0))
+                if (score, post_id) > (lowest[1], lowest[0]):
+                    del self._top[lowest[0]]
+                    self._top[post_id] = score
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            writequeue.run(write_minutes, pending)
+        except DatabaseError:
+            logger.exception("Failed to write %d trending increments; retrying on the next flush", len(pending))
+            with self._lock:
+                for key, delta in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + delta
+            return
+        self.flushes += 1
+
+    def flush(self):
+        with self._sync_lock:
+            self._flush()
+
+    def reload(self):
+        """Write pending increments, roll up and fold like counters if due, and reload the window totals."""
+        cfg = config()
+        with self._sync_lock:
+            self._flush()
+            if cache.add(ROLLUP_LOCK_KEY, True, 60):
+                try:
+                    writequeue.run(rollup, window_hours=cfg['window_hours'])
+                except DatabaseError:
+                    logger.exception("Trending rollup failed")
+            if cache.add(counters.FLUSH_LOCK_KEY, True, counters.flush_seconds()):
+                try:
+                    counters.flush_like_counters()
+                except DatabaseError:
+                    logger.exception("Like counter flush failed")
+            totals = load_totals(window_hours=cfg['window_hours'])
+            with self._lock:
+                # Events recorded since the flush aren't in the buckets yet
+                for (post_id, _), delta in self._pending.items():
+                    totals[post_id] = totals.get(post_id, 0) + delta
+                self._totals = {post_id: score for post_id, score in totals.items() if score > 0}
+                self._top_stale = True
+                self._loaded_at = time.monotonic()
+            self._loaded.set()
+            self.reloads += 1
+
+    def top(self, limit):
+        """``[(post_id, score), ...]``, highest first (newest post first on ties)."""
+        if self._thread is None:
+            self.start()
+        self._loaded.wait(config()['refresh_seconds'])
+        with self._lock:
+            if self._top_stale:
+                best = heapq.nlargest(config()['top_k'], self._totals.items(), key=itemgetter(1, 0))
+                self._top = dict(best)
+                self._top_stale = False
+            ranked = sorted(self._top.items(), key=itemgetter(1, 0), reverse=True)
+        return ranked[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked_posts': len(self._totals),
+                'pending_increments': len(self._pending),
+                'flushes': self.flushes,
+                'reloads': self.reloads,
+            }
+
+
+tracker = TrendingTracker()
+
+
+def _record_on_commit(post_ids, delta):
+    def record():
+        for post_id in post_ids:
+            tracker.record(post_id, delta)
+    transaction.on_commit(record)
+
+
+def record_like(post_id, liked=True):
+    record_likes([post_id], liked)
+
+
+def record_likes(post_ids, liked=True):
+    if post_ids:
+        weight = config()['like_weight']
+        _record_on_commit(list(post_ids), weight if liked else -weight)
+
+
+def record_comment(post_id, created=True):
+    weight = config()['comment_weight']
+    _record_on_commit([post_id], weight if created else -weight)
+
+
+def top(limit=None):
+    """The trending ``(post_id, score)`` pairs, at most ``TRENDING['top_k']``."""
+    top_k = config()['top_k']
+    return tracker.top(min(limit or top_k, top_k))
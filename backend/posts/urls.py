@@ -1,14 +1,27 @@
 # posts/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PostViewSet, upload_image, UserProfileView, FeedView
+from .views import (
+    PostViewSet, upload_image, UserProfileView, FeedView, SearchView, MetricsView, FollowListView,
+    PostCommentsView, CommentDetailView, SuggestionsView, TrendingView, ExportView, bulk_follow,
+)
 
 router = DefaultRouter()
 router.register(r'posts', PostViewSet, basename='posts')
 
 urlpatterns = [
     path("", include(router.urls)),
+    path('posts/<int:post_id>/comments/', PostCommentsView.as_view(), name='post-comments'),
+    path('comments/<int:pk>/', CommentDetailView.as_view(), name='comment-detail'),
     path("uploads/", upload_image, name="upload-image"),
     path('users/<str:username>/', UserProfileView.as_view(), name='user-profile'),
+    path('users/<str:username>/followers/', FollowListView.as_view(direction='followers'), name='user-followers'),
+    path('users/<str:username>/following/', FollowListView.as_view(direction='following'), name='user-following'),
     path('feed/', FeedView.as_view(), name='feed'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('trending/', TrendingView.as_view(), name='trending'),
+    path('follows/bulk/', bulk_follow, name='bulk-follow'),
+    path('suggestions/', SuggestionsView.as_view(), name='follow-suggestions'),
+    path('export/', ExportView.as_view(), name='export'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,113 @@
+# posts/usercache.py
+"""
+Cache of ``User`` rows for authentication.
+
+Every authenticated request resolves its user from a token; this keeps the
+rows in a bounded in-process LRU with a TTL, optionally backed by Django's
+cache framework so processes share loads. Entries are dropped whenever a user
+is saved or deleted, which covers deactivation and password changes.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models.signals import post_delete, post_save
+
+
+class UserCache:
+    def __init__(self, max_size=10000, ttl=60, shared=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _shared_key(user_id):
+        return f'user:{user_id}'
+
+    @staticmethod
+    def _normalize(user_id):
+        """
+        ``user_id`` as the primary key's Python type, or ``None`` if it isn't one.
+
+        Tokens carry the ID as a string (simplejwt 5.5+) while saves signal the
+        int; without this the same user is cached twice and invalidation misses.
+        """
+        try:
+            return get_user_model()._meta.pk.to_python(user_id)
+        except ValidationError:
+            return None
+
+    def peek(self, user_id):
+        """Return the locally cached user without touching the DB or shared cache."""
+        user_id = self._normalize(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            # Callers may mutate request.user; never hand out the shared instance
+            return copy.copy(entry[0])
+
+    def get(self, user_id):
+        """Return the user with primary key ``user_id``, or ``None`` if there isn't one."""
+        user_id = self._normalize(user_id)
+        if user_id is None:
+            return None
+        user = self.peek(user_id)
+        if user is not None:
+            return user
+
+        user = cache.get(self._shared_key(user_id)) if self.shared else None
+        if user is None:
+            User = get_user_model()
+            try:
+                user = User.objects.get(pk=user_id)
+            except (User.DoesNotExist, ValueError, TypeError):
+                return None
+            if self.shared:
+                cache.set(self._shared_key(user_id), user, self.ttl)
+        self.put(user)
+        return copy.copy(user)
+
+    def put(self, user):
+        with self._lock:
+            self._entries[user.pk] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        user_id = self._normalize(user_id)
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if self.shared:
+            cache.delete(self._shared_key(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(
+    max_size=getattr(settings, 'USER_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'USER_CACHE_TTL', 60),
+    shared=getattr(settings, 'USER_CACHE_SHARED', False),
+)
+
+
+def _invalidate(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+post_save.connect(_invalidate, sender=settings.AUTH_USER_MODEL, dispatch_uid='posts.usercache.save')
+post_delete.connect(_invalidate, sender=settings.AUTH_USER_MODEL, dispatch_uid='posts.usercache.delete')
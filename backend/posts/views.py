@@ -1,22 +1,61 @@
 # posts/views.py
 
 # Add these imports for registration/profile endpoints
+import logging
+from datetime import datetime, timezone as dt_timezone
+
 import boto3
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.contrib.auth.models import User
 from rest_framework import generics, permissions, status, viewsets
+from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes, action
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.db.models import F, Count
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.db.models import Q
 from django.db import transaction
 from .serializers import RegisterSerializer, UserSerializer, MyTokenObtainPairSerializer  # Ensure RegisterSerializer exists
-from .models import Post, Like, Follow, Comment
-from .serializers import PostSerializer, RegisterSerializer, UserSerializer
+from .models import ArchivedComment, ArchivedPost, Post, Like, Follow, Comment, FollowSuggestion
+from .serializers import CommentSerializer, FollowSerializer, PostSerializer, RegisterSerializer, UserSerializer
+from rest_framework.utils.urls import replace_query_param
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .paginations import FeedCursorPagination, ProfilePostPagination
+from .paginations import (
+    CommentPagination, FeedCursorPagination, FollowPagination, InvalidCursor, PostPagination, ProfilePostPagination,
+    decode_position, encode_position,
+)
+from .renderers import FastJSONRenderer
+from .routers import ReplicaReadMixin, primary_reads
+from . import (
+    affinity, archive, comments, counters, export, fanout, fastserialize, images, instrumentation, profile_cache, ranking, search,
+    suggestions, timeline, trending, writequeue,
+)
+from .consumers import feed_metrics
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on IDs accepted by the batch endpoints
+BATCH_MAX_IDS = getattr(settings, 'BATCH_MAX_IDS', 500)
+
+
+class FastPostListMixin:
+    """
+    Post list views whose pages are serialized from ``values()`` rows by
+    ``posts.fastserialize`` (same output as ``PostSerializer``) and rendered
+    with ``FastJSONRenderer``.
+    """
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        rows = fastserialize.post_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(fastserialize.serialize_posts(page, request.user))
 
 
 # Custom token obtain view for email login
@@ -24,35 +63,6 @@ from .paginations import FeedCursorPagination, ProfilePostPagination
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
-    def dispatch(self, request, *args, **kwargs):
-        print("DEBUG: ========== MyTokenObtainPairView.dispatch called! ==========")
-        print(f"DEBUG: Raw request body: {repr(request.body)}")
-        print(f"DEBUG: Content-Type: {request.content_type}")
-        print(f"DEBUG: Request method: {request.method}")
-        print(f"DEBUG: Request path: {request.path}")
-        print(f"DEBUG: Request headers: {dict(request.headers)}")
-
-        # Try to parse JSON manually to see what's happening
-        try:
-            import json
-            if request.body:
-                body_str = request.body.decode('utf-8')
-                print(f"DEBUG: Body as string: '{body_str}'")
-                if body_str.strip():
-                    json_data = json.loads(body_str)
-                    print(f"DEBUG: Parsed JSON: {json_data}")
-                else:
-                    print("DEBUG: Empty request body!")
-            else:
-                print("DEBUG: Request body is None or empty!")
-        except Exception as e:
-            print(f"DEBUG: Error parsing JSON: {e}")
-            import traceback
-            traceback.print_exc()
-
-        print("DEBUG: =========================================================")
-        return super().dispatch(request, *args, **kwargs)
-
 # Registration endpoint
 class RegisterView(generics.CreateAPIView):
     """API endpoint for user registration."""
@@ -99,84 +109,167 @@ def api_root(request):
         'register': 'http://127.0.0.1:8000/api/register/',
     })
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all().order_by("-created_at")
+class PostViewSet(ReplicaReadMixin, FastPostListMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.select_related("user").order_by("-created_at", "-id")
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PostPagination
 
     def create(self, request, *args, **kwargs):
         # Explicit create to capture and return validation errors clearly
         serializer = self.get_serializer(data=request.data, context={"request": request})
         if not serializer.is_valid():
-            # Log errors to backend console for quick debugging during dev
-            print("DEBUG CREATE Post errors:", serializer.errors)
+            logger.debug("Rejected post from user %s: %s", request.user.id, serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         self.perform_create(serializer)
         headers = {}
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
     def perform_create(self, serializer):
+        writequeue.run(self._create_post, serializer)
+        profile_cache.bump(self.request.user.id)
+
+    def _create_post(self, serializer):
         post = serializer.save(user=self.request.user)
+        search.index_post(post)
+        timeline.push_to_author(post)
 
-        # Notify followers
-        from asgiref.sync import async_to_sync
-        from channels.layers import get_channel_layer
-        from .serializers import PostSerializer
-
-        followers = Follow.objects.filter(followee=self.request.user).values_list("follower_id", flat=True)
-        channel_layer = get_channel_layer()
-        post_data = PostSerializer(post, context={"request": self.request}).data
-
-        for follower_id in followers:
-            async_to_sync(channel_layer.group_send)(
-                f"user_{follower_id}",
-                {
-                    "type": "feed_update",
-                    "content": post_data
-                }
-            )
+        # Followers' timelines and WebSocket pushes are handled in the
+        # background once the post is committed. The payload is the one we
+        # already serialized for the response; is_liked is False for everyone.
+        fanout.enqueue(post, serializer.data)
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        search.index_post(post)
+        profile_cache.bump(post.user_id)
+
+    def perform_destroy(self, instance):
+        post_id = instance.id
+        with transaction.atomic():
+            instance.delete()
+            search.remove_post(post_id)
+        profile_cache.bump(instance.user_id)
 
     def get_queryset(self):
         return Post.objects.filter(user__in=[self.request.user])
 
+    def get_archive_queryset(self):
+        return fastserialize.archived_post_rows(ArchivedPost.objects.filter(user=self.request.user))
+
     @action(detail=True, methods=['post'])
     def toggle_like(self, request, pk=None):
-        post = self.get_object()
-        with transaction.atomic():
-            obj, created = Like.objects.get_or_create(user=request.user, post=post)
-            if created:
-                post.likes_count = F('likes_count') + 1
-            else:
-                obj.delete()
-                post.likes_count = F('likes_count') - 1
-            post.save(update_fields=['likes_count'])
-            post.refresh_from_db()
-            return Response({
-                "likes_count": post.likes_count,
-                "is_liked": created
-            })
+        return _toggle_like(request.user, self.get_object())
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """Fetch up to BATCH_MAX_IDS posts by ID (``?ids=1,2,3``) in one query, in request order."""
+        try:
+            ids = _parse_id_list(request.query_params.get('ids', '').split(','))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = fastserialize.post_rows_by_id(ids)
+        found = {row['id'] for row in rows}
+        return Response({
+            'results': fastserialize.serialize_posts(rows, request.user),
+            'missing': [post_id for post_id in ids if post_id not in found],
+        })
+
+    @action(detail=False, methods=['post'])
+    def bulk_like(self, request):
+        """Like or unlike many posts: ``{"ids": [...], "action": "like" | "unlike"}``."""
+        like = request.data.get('action', 'like')
+        if like not in ('like', 'unlike'):
+            return Response({'error': 'action must be "like" or "unlike"'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = _parse_id_list(request.data.get('ids'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': writequeue.run(_bulk_like, request.user, ids, like == 'like')})
+
+def _parse_id_list(values):
+    if not isinstance(values, (list, tuple)):
+        raise ValueError('ids must be a list')
+    try:
+        ids = list(dict.fromkeys(int(value) for value in values if value != ''))
+    except (TypeError, ValueError):
+        raise ValueError('ids must be integers')
+    if not ids:
+        raise ValueError('No ids provided')
+    if len(ids) > BATCH_MAX_IDS:
+        raise ValueError(f'At most {BATCH_MAX_IDS} ids per request')
+    return ids
+
+def _bulk_like(user, post_ids, like):
+    authors = dict(Post.objects.filter(id__in=post_ids).values_list('id', 'user_id'))
+    with transaction.atomic():
+        existing = set(
+            Like.objects.filter(user=user, post_id__in=authors).values_list('post_id', flat=True)
+        )
+        if like:
+            changed = [post_id for post_id in authors if post_id not in existing]
+            Like.objects.bulk_create([Like(user=user, post_id=post_id) for post_id in changed], ignore_conflicts=True)
+        else:
+            changed = [post_id for post_id in authors if post_id in existing]
+            Like.objects.filter(user=user, post_id__in=changed).delete()
+        counters.increment_likes_many(changed, 1 if like else -1)
+        trending.record_likes(changed, like)
+
+        per_author = {}
+        for post_id in changed:
+            per_author[authors[post_id]] = per_author.get(authors[post_id], 0) + 1
+        weight = affinity.LIKE_WEIGHT if like else -affinity.LIKE_WEIGHT
+        affinity.record_interactions(user.id, {author_id: weight * count for author_id, count in per_author.items()})
+    profile_cache.bump(*per_author)
+
+    changed = set(changed)
+    done, unchanged = ('liked', 'already_liked') if like else ('unliked', 'not_liked')
+    return [
+        {'id': post_id, 'status': 'not_found' if post_id not in authors else done if post_id in changed else unchanged}
+        for post_id in post_ids
+    ]
+
+def _apply_like(user, post):
+    # The Like row's unique constraint serializes concurrent toggles by the
+    # same user; the counter goes to a random shard instead of locking the post.
+    with transaction.atomic():
+        obj, created = Like.objects.get_or_create(user=user, post=post)
+        if not created:
+            obj.delete()
+        counters.increment_likes(post.id, 1 if created else -1)
+        affinity.record_like(user.id, post.user_id, liked=created)
+        trending.record_like(post.id, liked=created)
+    return created
+
+def _toggle_like(user, post):
+    created = writequeue.run(_apply_like, user, post)
+    profile_cache.bump(post.user_id)
+    return Response({
+        "likes_count": counters.like_count(post),
+        "is_liked": created
+    })
 
 # Like/Unlike Views (atomic and race-condition safe)
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated])
 def toggle_like(request, pk):
     try:
-        with transaction.atomic():
-            post = Post.objects.select_for_update().get(pk=pk)
-            obj, created = Like.objects.get_or_create(user=request.user, post=post)
-            if created:
-                post.likes_count = F('likes_count') + 1
-            else:
-                obj.delete()
-                post.likes_count = F('likes_count') - 1
-            post.save(update_fields=['likes_count'])
-            post.refresh_from_db()
-            return Response({
-                "likes_count": post.likes_count,
-                "is_liked": created
-            })
+        post = Post.objects.only('id', 'user', 'likes_count').get(pk=pk)
     except Post.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
+    return _toggle_like(request.user, post)
+
+def _apply_follow(follower, followee):
+    with transaction.atomic():
+        follow, created = Follow.objects.get_or_create(follower=follower, followee=followee)
+        if created:
+            timeline.on_follow(follower.id, followee.id)
+        else:
+            follow.delete()
+            timeline.on_unfollow(follower.id, followee.id)
+        suggestions.on_follow(follower.id, followee.id, followed=created)
+    return created
 
 # Follow/Unfollow Logic
 @api_view(["POST"])
@@ -187,41 +280,139 @@ def toggle_follow(request, pk):
         if request.user == followee:
             return Response({"error": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
-        follow, created = Follow.objects.get_or_create(follower=request.user, followee=followee)
+        created = writequeue.run(_apply_follow, request.user, followee)
+        profile_cache.bump(request.user.id, followee.id)
         if not created:
-            follow.delete()
             return Response({"status": "unfollowed", "is_following": False}, status=status.HTTP_200_OK)
-        
         return Response({"status": "followed", "is_following": True}, status=status.HTTP_201_CREATED)
     except User.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-class FeedView(generics.ListAPIView):
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_follow(request):
+    """Follow or unfollow many users: ``{"user_ids": [...], "action": "follow" | "unfollow"}``."""
+    follow = request.data.get('action', 'follow')
+    if follow not in ('follow', 'unfollow'):
+        return Response({'error': 'action must be "follow" or "unfollow"'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        ids = _parse_id_list(request.data.get('user_ids'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({'results': writequeue.run(_bulk_follow, request.user.id, ids, follow == 'follow')})
+
+def _bulk_follow(me, user_ids, follow):
+    found = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    with transaction.atomic():
+        existing = set(
+            Follow.objects.filter(follower_id=me, followee_id__in=found).values_list('followee_id', flat=True)
+        )
+        if follow:
+            changed = [user_id for user_id in user_ids if user_id in found and user_id not in existing and user_id != me]
+            Follow.objects.bulk_create(
+                [Follow(follower_id=me, followee_id=user_id) for user_id in changed], ignore_conflicts=True
+            )
+        else:
+            changed = [user_id for user_id in user_ids if user_id in existing]
+            Follow.objects.filter(follower_id=me, followee_id__in=changed).delete()
+
+    if changed:
+        if follow:
+            timeline.on_follow_many(me, changed)
+        else:
+            timeline.on_unfollow_many(me, changed)
+        suggestions.on_follow_many(me, changed, followed=follow)
+        profile_cache.bump(me, *changed)
+
+    changed = set(changed)
+    done, unchanged = ('followed', 'already_following') if follow else ('unfollowed', 'not_following')
+    results = []
+    for user_id in user_ids:
+        if user_id not in found:
+            item_status = 'not_found'
+        elif user_id == me:
+            item_status = 'self'
+        else:
+            item_status = done if user_id in changed else unchanged
+        results.append({'id': user_id, 'status': item_status})
+    return results
+
+class FeedView(ReplicaReadMixin, FastPostListMixin, generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = FeedCursorPagination
 
     def get_queryset(self):
-        # 1. Get the list of users the current user is following
-        following_users = Follow.objects.filter(follower=self.request.user).values_list("followee", flat=True)
-
-        # 2. Get users whose posts the current user has liked or commented on
-        interacted_users = set(
-            list(Like.objects.filter(user=self.request.user).values_list('post__user', flat=True)) +
-            list(Comment.objects.filter(user=self.request.user).values_list('post__user', flat=True))
+        # 1. Read the materialized timeline (followees and own posts) plus
+        #    the high-follower authors that are merged at read time
+        timeline_post_ids, pull_users = timeline.read_sources(self.request.user.id)
+
+        # 2. Get the authors the current user interacts with most (likes and
+        #    comments), precomputed in the affinity table
+        interacted_users = set(affinity.top_authors(self.request.user.id))
+
+        # 3. Filter posts by timeline membership or read-time authors; only
+        #    the newest few posts of each affinity author are candidates
+        queryset = Post.objects.filter(
+            Q(id__in=timeline_post_ids)
+            | Q(user__in=pull_users)
+            | Q(id__in=affinity.recent_post_ids(interacted_users - set(pull_users)))
+        ).select_related('user')
+
+        # 4. Newest first; the id tiebreak matches the pagination keyset
+        return queryset.order_by('-created_at', '-id')
+
+    def get_archive_queryset(self):
+        # Timelines only hold hot posts, so past the archive boundary the
+        # feed is read by author: followees, read-time authors and the user
+        user_id = self.request.user.id
+        _, pull_users = timeline.read_sources(user_id)
+        authors = set(pull_users) | {user_id}
+        interacted_users = set(affinity.top_authors(user_id)) - authors
+        followees = Follow.objects.filter(follower_id=user_id).values('followee_id')
+        return fastserialize.archived_post_rows(
+            ArchivedPost.objects.filter(
+                Q(user__in=followees)
+                | Q(user__in=authors)
+                | Q(id__in=affinity.recent_post_ids(interacted_users, model=ArchivedPost))
+            )
         )
 
-        # 3. Combine followed + interacted + own posts
-        related_users = set(list(following_users) + list(interacted_users) + [self.request.user.id])
-
-        # 4. Filter posts by these users
-        queryset = Post.objects.filter(user__in=related_users).select_related('user')
-
-        # 5. Denormalize the likes_count for the response
-        queryset = queryset.annotate(likes_count_annotated=Count('likes'))
-
-        # 6. Order the posts by creation date to prepare for cursor pagination
-        return queryset.order_by('-created_at')
+    def list(self, request, *args, **kwargs):
+        mode = request.query_params.get('mode', 'latest')
+        if mode == 'ranked':
+            return self.ranked(request)
+        if mode != 'latest':
+            return Response({'error': 'mode must be "latest" or "ranked"'}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+    def ranked(self, request):
+        """Posts scored by ``posts.ranking``, paginated over a cached per-snapshot ordering."""
+        snapshot, after = None, None
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                snapshot, score, post_id = decode_position(cursor, (int, float, int))
+                # ranked_page turns the snapshot into a datetime
+                datetime.fromtimestamp(snapshot, tz=dt_timezone.utc)
+            except (InvalidCursor, OverflowError, OSError, ValueError):
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            after = (score, post_id)
+
+        page_size = self.pagination_class.page_size
+        post_ids, next_position = ranking.ranked_page(request.user.id, snapshot, after, page_size)
+        rows = fastserialize.post_rows_by_id(post_ids)
+
+        next_link = None
+        if next_position:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor', encode_position(next_position)
+            )
+        return Response({
+            'results': fastserialize.serialize_posts(rows, request.user),
+            'next': next_link,
+        })
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -235,56 +426,294 @@ def upload_image(request):
 
     image_file = request.FILES['image']
 
-    # Validate file type
-    allowed_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
-    if image_file.content_type not in allowed_types:
-        return Response({'error': 'Invalid file type'}, status=400)
-
     # Validate file size (5MB limit)
     if image_file.size > 5 * 1024 * 1024:
         return Response({'error': 'File too large'}, status=400)
 
-    # Generate unique filename
-    import uuid
-    import os
-    from django.conf import settings
-    from django.core.files.storage import default_storage
-
-    ext = os.path.splitext(image_file.name)[1]
-    filename = f"user_uploads/{uuid.uuid4()}{ext}"
+    # Stream to storage under the content hash; the file type is sniffed from
+    # its bytes. The feed variant is ready on return, the rest follow later
+    try:
+        result = images.process_upload(image_file)
+    except images.InvalidImage:
+        return Response({'error': 'Invalid file type'}, status=400)
 
-    # Save file
-    file_path = default_storage.save(filename, image_file)
-    public_url = default_storage.url(file_path)
+    return Response(result)
 
-    return Response({'public_url': public_url})
 
+class UserProfileView(ReplicaReadMixin, APIView):
+    """
+    Profile header plus a page of the user's posts.
 
-class UserProfileView(APIView):
+    The viewer-independent parts of the first page are cached per profile
+    version (see posts/profile_cache.py), and a matching ``If-None-Match``
+    gets a 304 without touching the database.
+    """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def get(self, request, username):
+        user_id = profile_cache.user_id_for(username)
+        if user_id is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        viewer = request.user if request.user.is_authenticated else None
+        paginator = ProfilePostPagination()
+        first_page = paginator.cursor_query_param not in request.query_params
+
+        version = profile_cache.get_version(user_id)
+        etag = profile_cache.etag(user_id, version, viewer.id if viewer else None) if first_page else None
+        if etag and etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return self.finalize_profile_response(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+        payload = profile_cache.get_payload(user_id, version) if first_page else None
+        if payload is None:
+            if first_page:
+                # Cached under the current version and answered with 304s
+                # until the next bump, so it must not come from a lagging replica
+                with primary_reads():
+                    payload = self.build_payload(request, user_id, paginator)
+                if payload is not None:
+                    profile_cache.set_payload(user_id, version, payload)
+            else:
+                payload = self.build_payload(request, user_id, paginator)
+            if payload is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+
+        # Viewer-dependent parts are layered over the shared payload
+        results = payload['posts']['results']
+        is_following = False
+        if viewer:
+            is_following = Follow.objects.filter(follower=viewer, followee_id=user_id).exists()
+            liked = archive.liked_post_ids(viewer, [post['id'] for post in results])
+            results = [dict(post, is_liked=post['id'] in liked) for post in results]
+
+        response = Response({
+            'user': payload['user'],
+            'is_following': is_following,
+            'follower_count': payload['follower_count'],
+            'following_count': payload['following_count'],
+            'posts': {
+                'results': results,
+                'next': payload['posts']['next'],
+            },
+        })
+        return self.finalize_profile_response(response, etag)
+
+    def build_payload(self, request, user_id, paginator):
+        profile_user = User.objects.filter(pk=user_id).first()
+        if profile_user is None:
+            return None
+
+        # Get the user's posts
+        posts_queryset = fastserialize.post_rows(Post.objects.filter(user=profile_user))
+
+        # Paginate the posts; serialized without a viewer so the result can be shared
+        paginated_posts = paginator.paginate_queryset(posts_queryset, request, view=self)
+
+        return {
+            'user': UserSerializer(profile_user).data,
+            'follower_count': profile_user.followers.count(),
+            'following_count': profile_user.following.count(),
+            'posts': {
+                'results': fastserialize.serialize_posts(paginated_posts),
+                'next': paginator.get_next_link(),
+            },
+        }
+
+    def get_archive_queryset(self):
+        user_id = profile_cache.user_id_for(self.kwargs['username'])
+        return fastserialize.archived_post_rows(ArchivedPost.objects.filter(user_id=user_id))
+
+    def finalize_profile_response(self, response, etag):
+        if etag:
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+
+class PostCommentsView(ReplicaReadMixin, generics.ListCreateAPIView):
+    """A post's comments, oldest first, keyset-paginated on (created_at, id)."""
+    serializer_class = CommentSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CommentPagination
+
+    def get_post(self):
+        try:
+            return Post.objects.only('id', 'user_id').get(pk=self.kwargs['post_id'])
+        except Post.DoesNotExist:
+            raise NotFound()
+
+    def get_queryset(self):
+        post_id = self.kwargs['post_id']
+        if Post.objects.filter(pk=post_id).exists():
+            return Comment.objects.filter(post_id=post_id).select_related('user')
+        # Archived posts keep their comments, read-only
+        if ArchivedPost.objects.filter(pk=post_id).exists():
+            return ArchivedComment.objects.filter(post_id=post_id).select_related('user')
+        raise NotFound()
+
+    def perform_create(self, serializer):
+        post = self.get_post()
+        serializer.instance = writequeue.run(
+            comments.add_comment, self.request.user, post, serializer.validated_data['content']
+        )
+
+
+class CommentDetailView(generics.RetrieveDestroyAPIView):
+    """A single comment; the commenter or the post's author may delete it."""
+    serializer_class = CommentSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    queryset = Comment.objects.select_related('user', 'post')
+
+    def perform_destroy(self, instance):
+        if self.request.user.id not in (instance.user_id, instance.post.user_id):
+            raise PermissionDenied()
+        writequeue.run(comments.delete_comment, instance)
+
+
+class SuggestionsView(ReplicaReadMixin, APIView):
+    """Precomputed "who to follow" suggestions for the current user (see posts/suggestions.py)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, suggestions.config()['per_user']))
+
+        rows = (
+            FollowSuggestion.objects.filter(user=request.user)
+            .order_by('-score', 'candidate_id')
+            .values_list('candidate_id', 'candidate__username', 'mutuals')[:limit]
+        )
+        return Response({
+            'results': [
+                {'id': user_id, 'username': username, 'mutuals': mutuals}
+                for user_id, username, mutuals in rows
+            ],
+        })
+
+
+class FollowListView(ReplicaReadMixin, generics.ListAPIView):
+    """A user's followers or followees, most recent first, keyset-paginated."""
+    serializer_class = FollowSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = FollowPagination
+    # 'followers' lists Follow rows pointing at the user, 'following' rows from them
+    direction = 'followers'
+
+    def get_queryset(self):
+        user_id = profile_cache.user_id_for(self.kwargs['username'])
+        if user_id is None:
+            raise NotFound()
+        if self.direction == 'followers':
+            return Follow.objects.filter(followee_id=user_id).select_related('follower')
+        return Follow.objects.filter(follower_id=user_id).select_related('followee')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['side'] = 'follower' if self.direction == 'followers' else 'followee'
+        return context
+
+
+class SearchView(APIView):
+    """Ranked full-text search over posts, keyset-paginated with an opaque cursor."""
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    page_size = 20
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'results': [], 'next': None})
+
+        after = None
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                # (bm25 score, post id) of the last hit
+                after = decode_position(cursor, (float, int))
+            except InvalidCursor:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = search.get_search_backend().search(query, after=after, limit=self.page_size + 1)
+        has_more = len(hits) > self.page_size
+        hits = hits[:self.page_size]
+
+        rows = fastserialize.post_rows_by_id([post_id for post_id, _ in hits])
+
+        next_link = None
+        if has_more:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor', encode_position(hits[-1][1])
+            )
+        return Response({
+            'results': fastserialize.serialize_posts(rows, request.user),
+            'next': next_link,
+        })
+
+class TrendingView(APIView):
+    """Posts with the most likes and comments over the trending window (see posts/trending.py)."""
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
         try:
-            profile_user = User.objects.get(username=username)
-            is_following = Follow.objects.filter(follower=request.user, followee=profile_user).exists() if request.user.is_authenticated else False
-
-            # Get the user's posts
-            posts_queryset = Post.objects.filter(user=profile_user).order_by('-created_at').annotate(likes_count_annotated=Count('likes'))
-
-            # Paginate the posts
-            paginator = ProfilePostPagination()
-            paginated_posts = paginator.paginate_queryset(posts_queryset, request)
-            posts_serializer = PostSerializer(paginated_posts, many=True, context={'request': request})
-
-            return Response({
-                'user': UserSerializer(profile_user).data,
-                'is_following': is_following,
-                'follower_count': profile_user.followers.count(),
-                'following_count': profile_user.following.count(),
-                'posts': {
-                    'results': posts_serializer.data,
-                    'next': paginator.get_next_link(),
-                },
-            })
-        except User.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            limit = int(request.query_params.get('limit', 0))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        ranked = trending.top(limit if limit > 0 else None)
+        scores = dict(ranked)
+        rows = fastserialize.post_rows_by_id([post_id for post_id, _ in ranked])
+        results = fastserialize.serialize_posts(rows, request.user)
+        for post in results:
+            post['trending_score'] = scores[post['id']]
+        return Response({
+            'results': results,
+            'window_hours': trending.config()['window_hours'],
+        })
+
+class ExportView(APIView):
+    """
+    The signed-in user's posts, likes, comments and follows as streamed NDJSON
+    (see posts/export.py); ``?compress=gzip`` compresses it on the fly.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        compress = request.query_params.get('compress', '')
+        if compress not in ('', 'gzip'):
+            return Response({'error': 'compress must be gzip'}, status=status.HTTP_400_BAD_REQUEST)
+
+        filename = f'{request.user.username}.ndjson'
+        content_type = 'application/x-ndjson; charset=utf-8'
+        if compress:
+            filename += '.gz'
+            content_type = 'application/gzip'
+        chunks = export.stream(request.user, compress=bool(compress))
+        response = StreamingHttpResponse(
+            export.streaming_content(chunks, asgi=isinstance(request._request, ASGIRequest)),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+class MetricsView(APIView):
+    """Per-endpoint request histograms, recent N+1 reports, fan-out, WebSocket, write queue and trending stats. Staff only."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        data = instrumentation.registry.snapshot()
+        data['fanout'] = fanout.get_dispatcher().stats()
+        data['feed_sockets'] = feed_metrics.snapshot()
+        data['write_queue'] = writequeue.stats()
+        data['trending'] = trending.tracker.stats()
+        return Response(data)
+
+    def delete(self, request):
+        instrumentation.registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,115 @@
+# posts/writequeue.py
+"""
+Single-writer queue for SQLite.
+
+SQLite allows one writer at a time. With many request threads writing, each
+write waits on the file lock, and under load some fail with "database is
+locked". When ``WRITE_QUEUE_ENABLED`` is set, ``run`` hands the write to one
+background thread instead. That thread groups up to ``WRITE_QUEUE_BATCH_SIZE``
+jobs and commits them in one transaction. By default it takes whatever queued
+up while the previous batch committed; ``WRITE_QUEUE_MAX_DELAY`` makes it
+wait that many seconds for a batch to fill. Each job runs in its own savepoint,
+so a failing job raises to its own caller without undoing the others. Callers
+block until the batch commits, so the usual read-your-writes still holds.
+In WAL mode readers are never blocked by the writer.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    def __init__(self, batch_size=32, max_delay=0.0, using=DEFAULT_DB_ALIAS):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.using = using
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.jobs = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def run(self, func, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` in the writer's next batch and return its result."""
+        # Nested writes run inline: on the writer itself, or inside a
+        # transaction the caller already opened.
+        if threading.current_thread() is self._thread or connections[self.using].in_atomic_block:
+            return func(*args, **kwargs)
+        self.start()
+        future = Future()
+        self._queue.put((func, args, kwargs, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            close_old_connections()
+            try:
+                self._commit(jobs)
+            finally:
+                close_old_connections()
+
+    def _commit(self, jobs):
+        outcomes = []
+        try:
+            with transaction.atomic(using=self.using):
+                for func, args, kwargs, future in jobs:
+                    try:
+                        with transaction.atomic(using=self.using):
+                            outcomes.append((future, None, func(*args, **kwargs)))
+                    except Exception as exc:
+                        outcomes.append((future, exc, None))
+        except Exception as exc:
+            logger.exception("Write batch of %d jobs failed to commit", len(jobs))
+            for _, _, _, future in jobs:
+                future.set_exception(exc)
+            return
+
+        self.batches += 1
+        self.jobs += len(jobs)
+        for future, exc, result in outcomes:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+
+_writer = WriteQueue(
+    batch_size=getattr(settings, 'WRITE_QUEUE_BATCH_SIZE', 32),
+    max_delay=getattr(settings, 'WRITE_QUEUE_MAX_DELAY', 0.0),
+)
+
+
+def stats():
+    return {
+        'enabled': getattr(settings, 'WRITE_QUEUE_ENABLED', False),
+        'batches': _writer.batches,
+        'jobs': _writer.jobs,
+        'queue_depth': _writer._queue.qsize(),
+    }
+
+
+def run(func, *args, **kwargs):
+    """Run a write through the single-writer queue, or inline when it's disabled."""
+    if not getattr(settings, 'WRITE_QUEUE_ENABLED', False):
+        return func(*args, **kwargs)
+    return _writer.run(func, *args, **kwargs)
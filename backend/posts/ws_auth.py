@@ -0,0 +1,152 @@
+# posts/ws_auth.py
+"""
+JWT authentication for WebSocket connections.
+
+Browsers can't set an ``Authorization`` header on a WebSocket, so the
+simplejwt access token is taken from either
+
+* the ``Sec-WebSocket-Protocol`` header: ``new WebSocket(url, ["access_token", token])``
+* or the query string: ``/ws/feed/?token=<token>``
+
+Validated tokens are cached in memory until they expire and users come from
+the shared user cache, so a reconnect storm re-validates nothing and loads no
+user rows. The user checks run on every connection, cached or not: the user
+must be active and, with ``CHECK_REVOKE_TOKEN``, the token must match the
+current password. A user's entries are dropped whenever the user is saved or
+deleted.
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models.signals import post_delete, post_save
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .usercache import user_cache
+
+SUBPROTOCOL = "access_token"
+
+
+class TokenCache:
+    """A bounded LRU of ``token -> (user_id, expires_at, revoke_claim)``."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        # str(user_id) -> tokens, so a user's entries can be dropped
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        """``(user_id, revoke_claim)`` for a cached, unexpired token, else ``None``."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return entry[0], entry[2]
+
+    def set(self, token, user_id, expires_at, revoke_claim=None):
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (user_id, expires_at, revoke_claim)
+            self._by_user.setdefault(str(user_id), set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def forget_user(self, user_id):
+        with self._lock:
+            for token in list(self._by_user.get(str(user_id), ())):
+                self._remove(token)
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._by_user.get(str(entry[0]))
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[str(entry[0])]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+
+token_cache = TokenCache(getattr(settings, 'WS_TOKEN_CACHE_SIZE', 10000))
+
+
+async def _load_user(user_id):
+    user = user_cache.peek(user_id)
+    if user is None:
+        user = await database_sync_to_async(user_cache.get)(user_id)
+    return user if user is not None and user.is_active else None
+
+
+async def get_user_for_token(raw_token):
+    entry = token_cache.get(raw_token)
+    if entry is None:
+        try:
+            token = AccessToken(raw_token)
+        except TokenError:
+            return AnonymousUser()
+        user_id = token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return AnonymousUser()
+        entry = (user_id, token.get(api_settings.REVOKE_TOKEN_CLAIM))
+        token_cache.set(raw_token, user_id, token['exp'], entry[1])
+
+    user_id, revoke_claim = entry
+    user = await _load_user(user_id)
+    if user is None:
+        return AnonymousUser()
+    if api_settings.CHECK_REVOKE_TOKEN and revoke_claim != get_md5_hash_password(user.password):
+        return AnonymousUser()
+    return user
+
+
+def get_token_from_scope(scope):
+    """Return ``(token, subprotocol)``; ``subprotocol`` is set when the token came in that header."""
+    subprotocols = scope.get("subprotocols") or []
+    if SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], SUBPROTOCOL
+
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    tokens = query.get("token")
+    if tokens:
+        return tokens[0], None
+    return None, None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Populates ``scope["user"]`` from a simplejwt access token."""
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        token, subprotocol = get_token_from_scope(scope)
+        scope["user"] = await get_user_for_token(token) if token else AnonymousUser()
+        if subprotocol:
+            # The browser fails the handshake unless the server echoes it back
+            scope["jwt_subprotocol"] = subprotocol
+        return await super().__call__(scope, receive, send)
+
+
+def _forget_user(sender, instance, **kwargs):
+    token_cache.forget_user(instance.pk)
+
+
+post_save.connect(_forget_user, sender=settings.AUTH_USER_MODEL, dispatch_uid='posts.ws_auth.save')
+post_delete.connect(_forget_user, sender=settings.AUTH_USER_MODEL, dispatch_uid='posts.ws_auth.delete')
@@ -102,7 +102,8 @@ export default function FeedPage() {
         return
       }
 
-      ws = new WebSocket(`ws://127.0.0.1:8001/ws/feed/`)
+      // The access token travels as a subprotocol; browsers can't set headers on WebSockets
+      ws = new WebSocket(`ws://127.0.0.1:8001/ws/feed/`, ["access_token", accessToken])
 
       ws.onopen = () => {
         console.log('WebSocket connected')
@@ -110,8 +111,19 @@ export default function FeedPage() {
       }
 
       ws.onmessage = (event) => {
-        const newPost = JSON.parse(event.data)
-        setPosts((prev) => [newPost, ...prev])
+        const data = JSON.parse(event.data)
+        if (data.type === "resync") {
+          // The server dropped us as a slow consumer; onclose reconnects
+          return
+        }
+        // Posts come in numbered batches, oldest first; the server pauses
+        // sending until we acknowledge them
+        const newPosts: Post[] = [...data.posts].reverse()
+        setPosts((prev) => {
+          const existingIds = new Set(prev.map((p) => p.id))
+          return [...newPosts.filter((p) => !existingIds.has(p.id)), ...prev]
+        })
+        ws?.send(JSON.stringify({ type: "ack", seq: data.seq }))
       }
 
       ws.onclose = () => {
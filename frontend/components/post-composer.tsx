@@ -53,7 +53,11 @@ export default function PostComposer({ onPostCreated }: PostComposerProps) {
     const formData = new FormData()
     formData.append('image', file)
 
-    const { public_url } = await apiRequest<{ public_url: string }>(
+    const { public_url, variants } = await apiRequest<{
+      public_url: string
+      variants: { thumb?: string; feed?: string; full?: string }
+      variants_ready: boolean
+    }>(
       "/uploads/",
       {
         method: "POST",
@@ -62,7 +66,9 @@ export default function PostComposer({ onPostCreated }: PostComposerProps) {
       }
     )
 
-    return public_url
+    // The feed variant exists once the upload returns; without it (no
+    // image support on the server) store the original
+    return variants.feed ?? public_url
   }
 
   const handleSubmit = async (e: React.FormEvent) => {